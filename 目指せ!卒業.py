@@ -1,14 +1,38 @@
+import argparse
+import csv
+import gc
+import hashlib
+import io
+import json
 import math
+import mmap
 import os
 import random
+import struct
 import sys
 import time
+import tracemalloc
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
 import pygame as pg
 
+try:
+    import numpy as np
+except ImportError: #NumPyが無い環境では敵の一括移動(EnemySwarm)を使わない
+    np = None
+
 #グローバル変数
 width = 0 # ゲームウィンドウの幅格納用
 height = 0 # ゲームウィンドウの高さ格納用
 
+#起動時のディレクトリ（コマンドライン引数のファイルパス解決用）
+launch_dir = os.getcwd()
+#起動時刻（起動時間の計測用）
+start_clock = time.perf_counter()
+#ゲーム中の乱数（敵の出現位置・ミサイルの狙い・爆発の位置など、シードを決めればリプレイで同じになる）
+rng = random.Random()
+
 #実行ファイルのディレクトリに移動
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
@@ -27,6 +51,1107 @@ def check_bound(obj_rct: pg.Rect) -> tuple[bool, bool]:
     return yoko, tate
 
 
+def segment_box_dist2(x0: float, y0: float, x1: float, y1: float,
+                      left: float, top: float, right: float, bottom: float) -> float:
+    """
+    線分と長方形（辺を含む）の最短距離の2乗を返す関数（重なっていれば0）
+    引数1～4：線分の両端の座標 x0, y0, x1, y1
+    引数5～8：長方形の left, top, right, bottom
+    戻り値：最短距離の2乗
+    """
+    dx, dy = x1 - x0, y1 - y0
+    corners = ((left, top), (right, top), (left, bottom), (right, bottom))
+    #分離軸定理：x軸・y軸・線分の法線のどれでも分かれなければ交わっている
+    cross = [dx * (cy - y0) - dy * (cx - x0) for cx, cy in corners]
+    if (min(x0, x1) <= right and left <= max(x0, x1) and min(y0, y1) <= bottom and top <= max(y0, y1)
+            and min(cross) <= 0 <= max(cross)):
+        return 0.0
+    #交わらないときの最短距離は、線分の端と長方形の間か、長方形の角と線分の間のどれか
+    best = math.inf
+    for px, py in ((x0, y0), (x1, y1)):
+        ex = max(left - px, px - right, 0)
+        ey = max(top - py, py - bottom, 0)
+        best = min(best, ex * ex + ey * ey)
+    length2 = dx * dx + dy * dy
+    for cx, cy in corners:
+        u = 0.0 if length2 == 0 else min(max(((cx - x0) * dx + (cy - y0) * dy) / length2, 0.0), 1.0)
+        ex, ey = x0 + u * dx - cx, y0 + u * dy - cy
+        best = min(best, ex * ex + ey * ey)
+    return best
+
+
+def segment_box_dist2_array(seg: "np.ndarray", box: "np.ndarray") -> "np.ndarray":
+    """
+    segment_box_dist2 を線分と長方形の組ごとに配列でまとめて計算する関数（NumPyが必要）
+    引数1：線分の (x0, y0, x1, y1) を並べた(n, 4)の配列
+    引数2：長方形の (left, top, right, bottom) を並べた(n, 4)の配列
+    戻り値：組ごとの最短距離の2乗の配列
+    """
+    x0, y0, x1, y1 = seg.T
+    left, top, right, bottom = box.T
+    dx, dy = x1 - x0, y1 - y0
+    corners = ((left, top), (right, top), (left, bottom), (right, bottom))
+    cross = np.stack([dx * (cy - y0) - dy * (cx - x0) for cx, cy in corners])
+    inside = ((np.minimum(x0, x1) <= right) & (left <= np.maximum(x0, x1))
+              & (np.minimum(y0, y1) <= bottom) & (top <= np.maximum(y0, y1))
+              & (cross.min(axis=0) <= 0) & (cross.max(axis=0) >= 0))
+    best = np.full(len(seg), np.inf)
+    for px, py in ((x0, y0), (x1, y1)):
+        ex = np.maximum(np.maximum(left - px, px - right), 0)
+        ey = np.maximum(np.maximum(top - py, py - bottom), 0)
+        best = np.minimum(best, ex * ex + ey * ey)
+    length2 = dx * dx + dy * dy
+    safe = np.where(length2 == 0, 1.0, length2) #長さ0の線分は端の点として扱う
+    for cx, cy in corners:
+        u = np.clip(((cx - x0) * dx + (cy - y0) * dy) / safe, 0.0, 1.0)
+        ex, ey = x0 + u * dx - cx, y0 + u * dy - cy
+        best = np.minimum(best, ex * ex + ey * ey)
+    return np.where(inside, 0.0, best)
+
+
+class SpatialHash:
+    """
+    敵の当たり判定を高速化するための一様グリッド（空間ハッシュ）に関するクラス
+    毎フレーム敵グループから再構築し、武器との衝突判定を近傍セルの敵だけで行う
+    判定結果と順序は pg.sprite.groupcollide / spritecollide と同じになる
+    ミサイルの狙う敵を探すための近傍検索（最も近い敵、近い順にk体、半径内からランダム）もできる
+    """
+    BATCH_MIN = 16 #カプセルの判定でこれより組が少なければ配列を作らずに1組ずつ判定する（配列を作る手間の方が大きい）
+
+    def __init__(self, cell_size: int = 128):
+        """
+        初期化処理
+        引数：セル一辺の整数ピクセル数（初期値128）
+        """
+        self.cell_size = cell_size
+        self.cells: dict[tuple[int, int], list[pg.sprite.Sprite]] = {} #セル座標 -> 敵リスト
+        self.order: dict[pg.sprite.Sprite, int] = {} #グループ内の並び順（判定順の再現用）
+        self.members: dict = {} #登録元グループのspritedict（生存判定用）
+        self.bounds: list[int] | None = None #登録済みセルの範囲 [x最小, y最小, x最大, y最大]
+        self.rects: list[tuple[int, int, int, int]] = [] #登録順の (left, top, right, bottom)（配列での判定用）
+
+    def _cells_of(self, rect: pg.Rect):
+        """
+        Rectが重なるセル座標を順に返すジェネレータ
+        引数：判定するRect
+        """
+        cs = self.cell_size
+        for cx in range(rect.left // cs, (rect.right - 1) // cs + 1):
+            for cy in range(rect.top // cs, (rect.bottom - 1) // cs + 1):
+                yield cx, cy
+
+    def rebuild(self, group: pg.sprite.AbstractGroup) -> None:
+        """
+        グループの全スプライトでグリッドを作り直す
+        引数：敵を格納するsprite.Group
+        """
+        self.cells.clear()
+        self.order.clear()
+        self.rects.clear()
+        self.bounds = None
+        self.members = group.spritedict
+        for sprite in group:
+            self.insert(sprite)
+
+    def insert(self, sprite: pg.sprite.Sprite) -> None:
+        """
+        スプライトを1体だけグリッドに追加する（再構築後に出現したラスボスなど）
+        引数：追加するスプライト
+        """
+        self.order[sprite] = len(self.order)
+        left, top, right, bottom = box = sprite.rect.left, sprite.rect.top, sprite.rect.right, sprite.rect.bottom
+        self.rects.append(box)
+        cs = self.cell_size
+        x0, y0, x1, y1 = left // cs, top // cs, (right - 1) // cs, (bottom - 1) // cs
+        cells = self.cells
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                bucket = cells.get((cx, cy))
+                if bucket is None:
+                    cells[cx, cy] = [sprite]
+                else:
+                    bucket.append(sprite)
+
+        #近傍検索で調べるセルの範囲を広げる
+        b = self.bounds
+        if b is None:
+            self.bounds = [x0, y0, x1, y1]
+        else:
+            if x0 < b[0]:
+                b[0] = x0
+            if y0 < b[1]:
+                b[1] = y0
+            if x1 > b[2]:
+                b[2] = x1
+            if y1 > b[3]:
+                b[3] = y1
+
+    def query(self, rect: pg.Rect, probe: pg.sprite.Sprite | None = None) -> list[pg.sprite.Sprite]:
+        """
+        Rectと重なる生存中のスプライトを登録順で返す
+        collide_mode が"rect"でないスプライトは、矩形が重なったときだけ形（shapes）で精密に判定する
+        引数1：判定するRect
+        引数2：判定する側のスプライト（精密な判定で形を使う、NoneならRectそのもの）
+        戻り値：衝突しているスプライトのリスト
+        """
+        found = []
+        seen = set()
+        cells = self.cells
+        members = self.members
+        for key in self._cells_of(rect):
+            bucket = cells.get(key)
+            if bucket is None:
+                continue
+            for sprite in bucket:
+                if sprite in seen or sprite not in members:
+                    continue
+                seen.add(sprite)
+                if rect.colliderect(sprite.rect) and (
+                        getattr(sprite, "collide_mode", "rect") == "rect"
+                        or shapes.collide(rect if probe is None else probe, sprite)):
+                    found.append(sprite)
+        return sorted(found, key=self.order.__getitem__)
+
+    @staticmethod
+    def _capsule_test(segs: list, boxes: list, radii: list) -> list[bool]:
+        """
+        線分と長方形の組ごとに、最短距離が半径以下かをまとめて判定する（NumPyが無いか組が少なければ1組ずつ）
+        引数1：線分の (x0, y0, x1, y1) のリスト
+        引数2：長方形の (left, top, right, bottom) のリスト
+        引数3：組ごとの半径のリスト
+        戻り値：組ごとの判定結果のリスト
+        """
+        if not segs:
+            return []
+        if np is None or len(segs) < SpatialHash.BATCH_MIN:
+            return [segment_box_dist2(*seg, *box) <= r * r for seg, box, r in zip(segs, boxes, radii)]
+        d2 = segment_box_dist2_array(np.array(segs, dtype=np.float64), np.array(boxes, dtype=np.float64))
+        r = np.array(radii, dtype=np.float64)
+        return (d2 <= r * r).tolist()
+
+    def capsule_hits(self, beams: list) -> dict:
+        """
+        カプセル（半径のある線分）の形の武器ごとに、重なっている生存中のスプライトを返す
+        線分から半径以内のセルにいる敵だけを候補にし、全ての武器の候補を配列でまとめて判定する
+        collide_mode が"circle"の敵は円、"mask"の敵は矩形で絞ったあと形（shapes）で判定し直す
+        引数：capsule() を持つ武器のリスト
+        戻り値：{武器: [敵,...]} の辞書（敵は登録順、どれにも当たらない武器は含まない）
+        """
+        caps = [beam.capsule() for beam in beams]
+        cs = self.cell_size
+        cells, members = self.cells, self.members
+
+        #線分の外接矩形にある登録済みセルのうち、線分の帯（法線方向に半径以内）にかかるものだけ調べる
+        pairs = [] #(武器の番号, セル座標)
+        areas = [] #武器ごとのカプセルの外接矩形
+        half = cs / 2
+        for i, (x0, y0, x1, y1, r) in enumerate(caps):
+            left, top = math.floor(min(x0, x1) - r), math.floor(min(y0, y1) - r)
+            areas.append(pg.Rect(left, top, int(max(x0, x1) + r) - left + 2, int(max(y0, y1) + r) - top + 2))
+            length = math.hypot(x1 - x0, y1 - y0) or 1.0
+            nx, ny = (y0 - y1) / length, (x1 - x0) / length #線分の単位法線
+            reach = r + half * (abs(nx) + abs(ny)) #セルの中心と線分の法線方向の距離がこれ以内なら重なりうる
+            for cx in range(int((min(x0, x1) - r) // cs), int((max(x0, x1) + r) // cs) + 1):
+                for cy in range(int((min(y0, y1) - r) // cs), int((max(y0, y1) + r) // cs) + 1):
+                    if (cx, cy) in cells and abs((cx * cs + half - x0) * nx + (cy * cs + half - y0) * ny) <= reach:
+                        pairs.append((i, (cx, cy)))
+
+        #外接矩形と重なる候補の敵（武器ごとに重複なし）を敵の形と判定する
+        seen = set()
+        cands, segs, boxes, radii = [], [], [], []
+        for i, key in pairs:
+            area = areas[i]
+            for sprite in cells[key]:
+                if sprite not in members or (i, sprite) in seen:
+                    continue
+                seen.add((i, sprite))
+                if not area.colliderect(sprite.rect):
+                    continue
+                cands.append((i, sprite))
+                segs.append(caps[i][:4])
+                rect = sprite.rect
+                if getattr(sprite, "collide_mode", "rect") == "circle":
+                    #円は中心の点までの距離を、半径を足して判定する
+                    boxes.append((rect.centerx, rect.centery, rect.centerx, rect.centery))
+                    radii.append(caps[i][4] + min(rect.w, rect.h) // 2)
+                else:
+                    boxes.append((rect.left, rect.top, rect.right, rect.bottom))
+                    radii.append(caps[i][4])
+
+        hits: dict = {}
+        for (i, sprite), ok in zip(cands, self._capsule_test(segs, boxes, radii)):
+            if ok and (getattr(sprite, "collide_mode", "rect") != "mask" or shapes.collide(beams[i], sprite)):
+                hits.setdefault(beams[i], []).append(sprite)
+        for targets in hits.values():
+            targets.sort(key=self.order.__getitem__)
+        return hits
+
+    def _ring(self, qx: int, qy: int, r: int):
+        """
+        セル(qx, qy)からチェビシェフ距離がちょうどrのセル座標を順に返すジェネレータ
+        """
+        if r == 0:
+            yield qx, qy
+            return
+        for cx in range(qx - r, qx + r + 1):
+            yield cx, qy - r
+            yield cx, qy + r
+        for cy in range(qy - r + 1, qy + r):
+            yield qx - r, cy
+            yield qx + r, cy
+
+    def k_nearest(self, pos: tuple[float, float], k: int) -> list[pg.sprite.Sprite]:
+        """
+        中心が座標posに近い順に生存中のスプライトをk体まで返す
+        posのセルから外側へ1周ずつ調べ、それより外に近いものが無いと分かった時点で止める
+        引数1：基準の座標(x, y)
+        引数2：返す最大数
+        戻り値：近い順（同じ距離なら登録順）のスプライトのリスト
+        """
+        if self.bounds is None or k <= 0:
+            return []
+        cs = self.cell_size
+        px, py = pos
+        qx, qy = int(px // cs), int(py // cs)
+        x0, y0, x1, y1 = self.bounds
+        max_r = max(qx - x0, x1 - qx, qy - y0, y1 - qy, 0)
+        cells, members, order = self.cells, self.members, self.order
+        seen = set()
+        found = [] #(距離の2乗, 登録順, スプライト)
+        for r in range(max_r + 1):
+            for key in self._ring(qx, qy, r):
+                bucket = cells.get(key)
+                if bucket is None:
+                    continue
+                for sprite in bucket:
+                    if sprite in seen or sprite not in members:
+                        continue
+                    seen.add(sprite)
+                    cx, cy = sprite.rect.center
+                    found.append(((cx - px) ** 2 + (cy - py) ** 2, order[sprite], sprite))
+            if len(found) >= k:
+                found.sort(key=lambda item: item[:2])
+                #まだ調べていないセルの敵はr*cs以上離れている
+                if found[k - 1][0] <= (r * cs) ** 2:
+                    break
+        found.sort(key=lambda item: item[:2])
+        return [sprite for _, _, sprite in found[:k]]
+
+    def nearest(self, pos: tuple[float, float]) -> pg.sprite.Sprite | None:
+        """
+        中心が座標posに一番近い生存中のスプライトを返す（いなければNone）
+        引数：基準の座標(x, y)
+        """
+        hits = self.k_nearest(pos, 1)
+        return hits[0] if hits else None
+
+    def random_within(self, pos: tuple[float, float], radius: float,
+                      generator: random.Random | None = None) -> pg.sprite.Sprite | None:
+        """
+        中心が座標posから半径radius以内にある生存中のスプライトをランダムに1体返す（いなければNone）
+        引数1：基準の座標(x, y)
+        引数2：半径
+        引数3：乱数生成器（Noneならゲームの乱数rng）
+        """
+        px, py = pos
+        area = pg.Rect(int(px - radius), int(py - radius), int(2 * radius) + 2, int(2 * radius) + 2)
+        members = self.members
+        r2 = radius * radius
+        found = set()
+        cells = self.cells
+        for key in self._cells_of(area):
+            bucket = cells.get(key)
+            if bucket is None:
+                continue
+            for sprite in bucket:
+                if sprite in members and sprite not in found:
+                    cx, cy = sprite.rect.center
+                    if (cx - px) ** 2 + (cy - py) ** 2 <= r2:
+                        found.add(sprite)
+        if not found:
+            return None
+        return (generator or rng).choice(sorted(found, key=self.order.__getitem__))
+
+    def groupcollide(self, group: pg.sprite.AbstractGroup, dokill: bool) -> dict:
+        """
+        pg.sprite.groupcollide(登録グループ, group, False, dokill) と同じ結果を返す
+        dokill の場合、武器は登録順で最初に重なった敵1体にだけ当たり消滅する
+        collide_mode が"capsule"の武器（レーザー）は矩形ではなく capsule_hits() でまとめて判定する
+        引数1：武器のsprite.Group
+        引数2：衝突した武器を削除するかのbool値
+        戻り値：{敵: [武器,...]} の辞書（敵の登録順）
+        """
+        hits: dict = {}
+        weps = group.sprites()
+        beams = [wep for wep in weps if getattr(wep, "collide_mode", "rect") == "capsule"]
+        beam_hits = self.capsule_hits(beams) if beams else {}
+        for wep in weps:
+            if beams and getattr(wep, "collide_mode", "rect") == "capsule":
+                targets = beam_hits.get(wep)
+            else:
+                targets = self.query(wep.rect, wep)
+            if not targets:
+                continue
+            if dokill:
+                wep.kill()
+                targets = targets[:1]
+            for emy in targets:
+                lst = hits.get(emy)
+                if lst is None:
+                    hits[emy] = [wep]
+                else:
+                    lst.append(wep)
+        return dict(sorted(hits.items(), key=lambda item: self.order[item[0]]))
+
+    def spritecollide(self, sprite: pg.sprite.Sprite, dokill: bool) -> list[pg.sprite.Sprite]:
+        """
+        pg.sprite.spritecollide(sprite, 登録グループ, dokill) と同じ結果を返す
+        引数1：判定するスプライト（こうかとんなど）
+        引数2：衝突した敵を削除するかのbool値
+        戻り値：衝突した敵のリスト
+        """
+        hits = self.query(sprite.rect, sprite)
+        if dokill:
+            for emy in hits:
+                emy.kill()
+        return hits
+
+
+class AssetRegistry:
+    """
+    画像素材を一度だけ読み込み、変換済みのSurfaceを共有するクラス
+    拡大縮小・回転したものを画面の画素形式に変換(convert/convert_alpha)して保持する
+    """
+    def __init__(self):
+        """
+        初期化処理
+        キャッシュ辞書とヒット/ミスのカウンタの宣言
+        """
+        self.images: dict[tuple, pg.Surface] = {} #(パス, 倍率, サイズ, 角度, 透過) -> Surface
+        self.raw: dict[str, pg.Surface] = {} #パス -> 読み込んだだけのSurface
+        self.hits = 0
+        self.misses = 0
+
+        self.fonts: dict[tuple, pg.font.Font] = {} #(パス, サイズ, 太字) -> Font
+        self.font_data: dict[str, bytes] = {} #パス -> フォントファイルの中身
+        self.sounds: dict[tuple[str, float], pg.mixer.Sound] = {} #(パス, 音量) -> Sound
+        self.use_sysfont = True #Falseならsysfont()でシステムフォントを探さない
+
+        self.pending: dict[str, Future] = {} #パス -> 裏で読み込み中のファイル
+        self.executor: ThreadPoolExecutor | None = None
+
+        self.pack_path: str | None = "assets.pack" #変換済み画像のパック（Noneなら使わない）
+        self.pack: "AssetPack | None" = None #読み込めたパック
+
+    def _convert(self, surf: pg.Surface, alpha: bool) -> pg.Surface:
+        """
+        画面が作られていれば画面の画素形式に変換する
+        引数1：変換するSurface
+        引数2：透過を残すかのbool値
+        """
+        if pg.display.get_surface() is None:
+            return surf
+        return surf.convert_alpha() if alpha else surf.convert()
+
+    def load(self, path: str, alpha: bool = True) -> pg.Surface:
+        """
+        画像ファイルを読み込む（同じパスは2回目以降ディスクを読まない）
+        引数1：画像ファイルのパス
+        引数2：透過を残すかのbool値（初期値True）
+        戻り値：読み込んだSurface
+        """
+        surf = self.raw.get(path)
+        if surf is None:
+            future = self.pending.pop(path, None)
+            surf = future.result() if future is not None else pg.image.load(path)
+            surf = self._convert(surf, alpha)
+            self.raw[path] = surf
+        return surf
+
+    def image(self, path: str, scale: float | None = None, size: tuple[int, int] | None = None,
+              angle: float = 0, alpha: bool = True) -> pg.Surface:
+        """
+        変換済みの共有Surfaceを返す（書き換えずに使うこと）
+        引数1：画像ファイルのパス
+        引数2：rotozoomの倍率（Noneなら等倍）
+        引数3：transform.scaleのサイズ（Noneなら変更なし）
+        引数4：rotozoomの回転角度（初期値0）
+        引数5：透過を残すかのbool値（初期値True）
+        戻り値：変換済みのSurface
+        """
+        key = (path, scale, size, angle, alpha)
+        surf = self.images.get(key)
+        if surf is not None:
+            self.hits += 1
+            return surf
+
+        self.misses += 1
+        surf = self.load(path, alpha)
+        if size is not None:
+            surf = pg.transform.scale(surf, size)
+        if scale is not None or angle != 0:
+            surf = pg.transform.rotozoom(surf, angle, 1.0 if scale is None else scale)
+        surf = self._convert(surf, alpha)
+        self.images[key] = surf
+        return surf
+
+    def preload(self, specs: list[tuple]) -> None:
+        """
+        fig/ の画像をすべて読み込み、指定された変換済み画像を作っておく
+        （パックを読み込めたときは、パックに無い画像の元ファイルだけを読む）
+        引数：image() に渡す引数タプルのリスト
+        """
+        if self.pack is None:
+            for name in sorted(os.listdir("fig")):
+                if name.endswith((".png", ".gif")):
+                    self.load(f"fig/{name}", name != "back_ground.png")
+        for spec in specs:
+            self.image(*spec)
+
+    def preload_background(self, workers: int = 4) -> None:
+        """
+        fig/ の画像と sound/ の音声の読み込み（デコード）を裏のスレッドで始める
+        読み込みが終わる前に load() や sound() で使われたら、そのファイルだけ待つ
+        引数：スレッド数（初期値4）
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix="assets")
+        submit = self.executor.submit
+        for name in sorted(os.listdir("fig")) if self.pack is None else (): #パックがあれば画像はデコードしない
+            path = f"fig/{name}"
+            if name.endswith((".png", ".gif")) and path not in self.raw and path not in self.pending:
+                self.pending[path] = submit(pg.image.load, path)
+        for name in sorted(os.listdir("sound")):
+            path = f"sound/{name}"
+            if name.endswith(".wav") and path not in self.pending:
+                self.pending[path] = submit(pg.mixer.Sound, path)
+
+    def font(self, path: str | None, size: int, bold: bool = False) -> pg.font.Font:
+        """
+        フォントを返す（同じパス・サイズは共有し、ファイルは1回だけ読む）
+        引数1：フォントファイルのパス（Noneならpygame標準フォント）
+        引数2：フォントサイズ
+        引数3：太字にするかのbool値（初期値False）
+        戻り値：Font（設定を書き換えずに使うこと）
+        """
+        key = (path, size, bold)
+        font = self.fonts.get(key)
+        if font is None:
+            if path is None:
+                font = pg.font.Font(None, size)
+            else:
+                data = self.font_data.get(path)
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    self.font_data[path] = data
+                font = pg.font.Font(io.BytesIO(data), size)
+            font.set_bold(bold)
+            self.fonts[key] = font
+        return font
+
+    def sysfont(self, name: str, size: int, bold: bool = False, fallback: str | None = None) -> pg.font.Font:
+        """
+        システムフォントを返す（use_sysfontがFalseならシステムフォントを探さずfallbackを使う）
+        引数1：システムフォント名
+        引数2：フォントサイズ
+        引数3：太字にするかのbool値（初期値False）
+        引数4：代わりに使うフォントファイルのパス（Noneならpygame標準フォント）
+        戻り値：Font（設定を書き換えずに使うこと）
+        """
+        if not self.use_sysfont:
+            return self.font(fallback, size, bold)
+        key = ("sysfont:" + name, size, bold)
+        font = self.fonts.get(key)
+        if font is None:
+            font = pg.font.SysFont(name, size, bold=bold)
+            self.fonts[key] = font
+        return font
+
+    def sound(self, path: str, volume: float = 1.0) -> pg.mixer.Sound:
+        """
+        効果音を返す（同じパス・音量は共有する）
+        引数1：音声ファイルのパス
+        引数2：音量（初期値1.0）
+        戻り値：Sound（音量を書き換えずに使うこと）
+        """
+        key = (path, volume)
+        snd = self.sounds.get(key)
+        if snd is None:
+            future = self.pending.pop(path, None)
+            snd = future.result() if future is not None else pg.mixer.Sound(path)
+            snd.set_volume(volume)
+            self.sounds[key] = snd
+        return snd
+
+    def stats(self) -> dict[str, int]:
+        """
+        キャッシュの利用状況を返す
+        戻り値：ヒット数、ミス数、保持しているSurface数などの辞書
+        """
+        return {"hits": self.hits, "misses": self.misses, "images": len(self.images), "files": len(self.raw),
+                "fonts": len(self.fonts), "sounds": len(self.sounds), "pending": len(self.pending)}
+
+
+assets = AssetRegistry() #プロセス全体で共有する画像レジストリ
+
+
+class AssetPack:
+    """
+    変換済みの画像をまとめて1つのファイル（画素の生データ＋索引）に保存・読み込みするクラス
+    読み込みはmmapした領域をpg.image.frombufferでそのままSurfaceにする（PNGをデコードしない）
+    索引には fig/ の素材ファイルのサイズ・更新時刻・ハッシュを入れ、素材が変わったパックは使わない
+    """
+    MAGIC = b"TUTPACK\0"
+    VERSION = 2 #画像の作り方（倍率や色など）や索引の形を変えたら上げる
+    ALIGN = 64 #画素データの先頭を揃える境界
+
+    def __init__(self, path: str):
+        """
+        初期化処理
+        引数：パックファイルのパス
+        """
+        self.path = path
+        self.surfaces: dict[tuple, pg.Surface] = {} #キー -> 読み込んだSurface
+        self.mm: mmap.mmap | None = None
+
+    @staticmethod
+    def sources(known: dict | None = None) -> dict[str, list]:
+        """
+        fig/ の素材ファイルごとの [サイズ, 更新時刻(ns), SHA-1] を返す（パックの版の判定用）
+        サイズと更新時刻が known と同じファイルは読まずに記録済みのハッシュを使う（起動のたびに全ファイルを読まない）
+        引数：パックの索引に入っていた同じ形の辞書（Noneなら全てのファイルを読む）
+        """
+        known = known or {}
+        out = {}
+        for name in sorted(os.listdir("fig")):
+            path = f"fig/{name}"
+            st = os.stat(path)
+            prev = known.get(name)
+            if isinstance(prev, list) and len(prev) == 3 and prev[:2] == [st.st_size, st.st_mtime_ns]:
+                digest = prev[2]
+            else:
+                with open(path, "rb") as f:
+                    digest = hashlib.sha1(f.read()).hexdigest()
+            out[name] = [st.st_size, st.st_mtime_ns, digest]
+        return out
+
+    def load(self) -> bool:
+        """
+        パックを読み込む（画素データはmmapした領域を共有する）
+        戻り値：使えるパックならTrue、無い・壊れている・素材と版が違うならFalse
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "rb") as f:
+            head = f.read(len(self.MAGIC) + 4)
+            if len(head) < len(self.MAGIC) + 4 or head[:len(self.MAGIC)] != self.MAGIC:
+                return False
+            (index_len,) = struct.unpack("<I", head[len(self.MAGIC):])
+            try:
+                index = json.loads(f.read(index_len).decode("utf-8"))
+            except ValueError:
+                return False
+            known = index.get("sources")
+            if index.get("version") != self.VERSION or not isinstance(known, dict):
+                return False
+            #更新時刻だけ変わった（中身は同じ）素材はハッシュで比べるので、パックはそのまま使える
+            digests = {name: entry[2] for name, entry in self.sources(known).items()}
+            if digests != {name: entry[2] for name, entry in known.items() if isinstance(entry, list) and len(entry) == 3}:
+                return False
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        screen = pg.display.get_surface()
+        native = screen is not None and pg.Surface((1, 1), pg.SRCALPHA).convert_alpha().get_masks()
+        view = memoryview(mm)
+        data_start = index["data"]
+        surfaces = {}
+        for entry in index["entries"]:
+            w, h = entry["size"]
+            start = data_start + entry["offset"]
+            surf = pg.image.frombuffer(view[start:start + w * h * 4], (w, h), "BGRA")
+            if screen is not None:
+                if not entry["alpha"]:
+                    surf = surf.convert() #不透明な画像（背景）は画面の形式にする
+                elif surf.get_masks() != native:
+                    surf = surf.convert_alpha()
+            surfaces[_as_tuple(entry["key"])] = surf
+        self.mm = mm
+        self.surfaces = surfaces
+        return True
+
+    def save(self, entries: list[tuple[tuple, pg.Surface]]) -> int:
+        """
+        Surfaceをまとめてパックに書き出す（一時ファイルに書いてから置き換える）
+        引数：(キー, Surface) のリスト（キーはJSONにできる値のタプル）
+        戻り値：書き出したバイト数
+        """
+        index_entries = []
+        offset = 0
+        for key, surf in entries:
+            w, h = surf.get_size()
+            alpha = bool(surf.get_flags() & pg.SRCALPHA)
+            index_entries.append({"key": key, "size": [w, h], "alpha": alpha, "offset": offset})
+            offset += -(-w * h * 4 // self.ALIGN) * self.ALIGN
+
+        index = {"version": self.VERSION, "sources": self.sources(), "data": 0, "entries": index_entries}
+        #索引の長さが決まるまでデータの開始位置を合わせ直す
+        while True:
+            blob = json.dumps(index, separators=(",", ":")).encode("utf-8")
+            head_len = len(self.MAGIC) + 4 + len(blob)
+            data_start = -(-head_len // self.ALIGN) * self.ALIGN
+            if index["data"] == data_start:
+                break
+            index["data"] = data_start
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.MAGIC + struct.pack("<I", len(blob)) + blob)
+            for entry, (key, surf) in zip(index_entries, entries):
+                f.seek(data_start + entry["offset"])
+                f.write(pg.image.tobytes(surf, "BGRA"))
+            size = f.tell()
+        os.replace(tmp, self.path)
+        return size
+
+
+def _as_tuple(value):
+    """
+    JSONから読んだリストを（入れ子も含めて）タプルに戻す
+    """
+    return tuple(_as_tuple(v) for v in value) if isinstance(value, list) else value
+
+
+class RotationCache:
+    """
+    画像を一定の角度刻みで回転させたものを前もって作っておくクラス
+    毎フレームの回転処理を、角度から求めた番号での表引きに置き換える
+    周回する武器用に、同じ刻みの周回位置テーブルも作れる
+    """
+    def __init__(self, base: pg.Surface, steps: int = 128, smooth: bool = False):
+        """
+        初期化処理
+        引数1：回転させる元画像（0度の向き）
+        引数2：1周の分割数（初期値128）
+        引数3：rotozoomで滑らかに回転させるかのbool値（Falseならtransform.rotate）
+        """
+        self.steps = steps
+        converted = pg.display.get_surface() is not None
+        self.images: list[pg.Surface] = []
+        for i in range(steps):
+            angle = 360 * i / steps
+            img = pg.transform.rotozoom(base, angle, 1.0) if smooth else pg.transform.rotate(base, angle)
+            self.images.append(img.convert_alpha() if converted else img)
+        self.orbits: dict[float, list[tuple[float, float]]] = {} #半径 -> 周回位置テーブル
+
+    @classmethod
+    def from_images(cls, images: list[pg.Surface]) -> "RotationCache":
+        """
+        回転済みの画像のリスト（パックから読んだものなど）からキャッシュを作る
+        引数：0度から1刻みずつ回転させた画像のリスト
+        """
+        cache = cls.__new__(cls)
+        cache.steps = len(images)
+        cache.images = list(images)
+        cache.orbits = {}
+        return cache
+
+    def index(self, degrees: float) -> int:
+        """
+        角度(度)に一番近い刻みの番号を返す
+        """
+        return round(degrees * self.steps / 360) % self.steps
+
+    def index_rad(self, radians: float) -> int:
+        """
+        角度(ラジアン)に一番近い刻みの番号を返す
+        """
+        return round(radians * self.steps / math.tau) % self.steps
+
+    def image(self, degrees: float) -> pg.Surface:
+        """
+        角度(度)に一番近い刻みで回転済みの画像を返す
+        """
+        return self.images[self.index(degrees)]
+
+    def orbit(self, radius: float) -> list[tuple[float, float]]:
+        """
+        半径radiusの円周上の位置(中心からのずれ)を刻みごとに並べたテーブルを返す
+        """
+        table = self.orbits.get(radius)
+        if table is None:
+            table = [(radius * math.cos(math.tau * i / self.steps), radius * math.sin(math.tau * i / self.steps))
+                     for i in range(self.steps)]
+            self.orbits[radius] = table
+        return table
+
+
+class TintCache:
+    """
+    画像に色を掛けたもの（被弾時の赤い点滅など）を一度だけ作って共有するクラス
+    元のSurfaceをキーにするので、共有している画像（assetsやクラスのキャッシュ）に使うこと
+    """
+    def __init__(self, color: tuple[int, int, int, int] = (255, 0, 0, 255)):
+        """
+        初期化処理
+        引数：BLEND_RGBA_MULTで掛ける色（初期値は赤）
+        """
+        self.color = color
+        self.images: dict[pg.Surface, pg.Surface] = {} #元の画像 -> 色を掛けた画像
+
+    def get(self, surf: pg.Surface) -> pg.Surface:
+        """
+        色を掛けた画像を返す（初回だけ作る）
+        引数：元の画像
+        戻り値：色を掛けた画像（書き換えずに使うこと）
+        """
+        tinted = self.images.get(surf)
+        if tinted is None:
+            tinted = surf.copy()
+            tinted.fill(self.color, special_flags=pg.BLEND_RGBA_MULT)
+            self.images[surf] = tinted
+        return tinted
+
+    def preload(self, surfs) -> None:
+        """
+        まとめて色を掛けた画像を作っておく
+        引数：元の画像の並び
+        """
+        for surf in surfs:
+            self.get(surf)
+
+
+hit_tints = TintCache() #被弾時の赤い点滅用
+
+
+class ShapeCache:
+    """
+    当たり判定の形（pg.maskのマスク）を一度だけ作って共有するクラス
+    矩形が重なったあとの精密な判定にだけ使う（毎フレームマスクを作らない）
+    スプライトの collide_mode で形を選ぶ："rect"（矩形）、"circle"（矩形に内接する円）、"mask"（画像の不透明部分）
+    "capsule"（レーザー）は SpatialHash.capsule_hits() で判定し、ここでは画像の不透明部分として扱う
+    """
+    def __init__(self):
+        self.masks: dict[pg.Surface, pg.mask.Mask] = {} #画像 -> 不透明部分のマスク
+        self.boxes: dict[tuple[int, int], pg.mask.Mask] = {} #大きさ -> 全面のマスク
+        self.circles: dict[int, pg.mask.Mask] = {} #半径 -> 円のマスク
+        self.tests = 0 #精密な判定をした回数
+
+    def image_mask(self, surf: pg.Surface) -> pg.mask.Mask:
+        """
+        画像の不透明部分のマスクを返す（初回だけ作る）
+        引数：共有している画像（assetsやクラスのキャッシュのもの）
+        """
+        mask = self.masks.get(surf)
+        if mask is None:
+            mask = self.masks[surf] = pg.mask.from_surface(surf)
+        return mask
+
+    def preload(self, surfs) -> None:
+        """
+        まとめてマスクを作っておく
+        引数：画像の並び
+        """
+        for surf in surfs:
+            self.image_mask(surf)
+
+    def shape(self, obj: "pg.sprite.Sprite | pg.Rect") -> tuple[pg.mask.Mask, tuple[int, int]]:
+        """
+        スプライトまたはRectの当たり判定の形を返す
+        引数：collide_mode を持つスプライト（無ければ"rect"）か、Rect
+        戻り値：マスク, マスクの左上の画面座標
+        """
+        if isinstance(obj, pg.Rect):
+            rect, mode = obj, "rect"
+        else:
+            rect, mode = obj.rect, getattr(obj, "collide_mode", "rect")
+        if mode in ("mask", "capsule"):
+            return self.image_mask(obj.image), rect.topleft
+        if mode == "circle":
+            r = min(rect.w, rect.h) // 2
+            mask = self.circles.get(r)
+            if mask is None:
+                surf = pg.Surface((2 * r + 1, 2 * r + 1), pg.SRCALPHA)
+                pg.draw.circle(surf, (255, 255, 255), (r, r), r)
+                mask = self.circles[r] = pg.mask.from_surface(surf)
+            return mask, (rect.centerx - r, rect.centery - r)
+        size = rect.size
+        mask = self.boxes.get(size)
+        if mask is None:
+            mask = self.boxes[size] = pg.mask.Mask(size, fill=True)
+        return mask, rect.topleft
+
+    def collide(self, a: "pg.sprite.Sprite | pg.Rect", b: pg.sprite.Sprite) -> bool:
+        """
+        矩形が重なっている2つの当たり判定の形が重なるかを返す
+        引数1：武器やこうかとんのスプライト、またはRect
+        引数2：敵のスプライト
+        """
+        self.tests += 1
+        mask_a, (ax, ay) = self.shape(a)
+        mask_b, (bx, by) = self.shape(b)
+        return mask_b.overlap(mask_a, (ax - bx, ay - by)) is not None
+
+
+shapes = ShapeCache() #精密な当たり判定用
+
+
+class CompactSprite:
+    """
+    __dict__ を持たない軽いスプライトの基底クラス（敵・武器・爆発のように大量に作るもの用）
+    pg.sprite.Sprite と同じメソッドを持つので pg.sprite.Group にも入るが、出し入れを速くするため SpriteGroup に入れる
+    （pg.sprite.Sprite を継承すると __slots__ を書いても __dict__ が残るので継承しない）
+    入っているGroupは1～2個なので、空でも200バイトを超えるsetではなくtupleで持つ
+    サブクラスはインスタンスで使う属性を全て __slots__ に書くこと
+    """
+    __slots__ = ("__g", "image", "rect")
+
+    def __init__(self, *groups):
+        """
+        初期化処理
+        引数：最初に入れるGroup
+        """
+        self.__g: tuple = () #入っているGroup
+        if groups:
+            self.add(*groups)
+
+    def add(self, *groups) -> None:
+        """
+        Groupに入れる（pg.sprite.Sprite.add と同じ）
+        """
+        for group in groups:
+            if hasattr(group, "_spritegroup"):
+                if group not in self.__g:
+                    group.add_internal(self)
+                    self.add_internal(group)
+            else:
+                self.add(*group)
+
+    def remove(self, *groups) -> None:
+        """
+        Groupから外す（pg.sprite.Sprite.remove と同じ）
+        """
+        for group in groups:
+            if hasattr(group, "_spritegroup"):
+                if group in self.__g:
+                    group.remove_internal(self)
+                    self.remove_internal(group)
+            else:
+                self.remove(*group)
+
+    def add_internal(self, group) -> None:
+        self.__g += (group,)
+
+    def remove_internal(self, group) -> None:
+        g = self.__g
+        i = g.index(group)
+        self.__g = g[:i] + g[i + 1:]
+
+    def update(self, *args, **kwargs) -> None:
+        pass
+
+    def kill(self) -> None:
+        """
+        すべてのGroupから外す
+        """
+        for group in self.__g:
+            group.remove_internal(self)
+        self.__g = ()
+
+    def groups(self) -> list:
+        return list(self.__g)
+
+    def alive(self) -> bool:
+        return bool(self.__g)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} Sprite(in {len(self.__g)} groups)>"
+
+
+class SpriteGroup(pg.sprite.Group):
+    """
+    CompactSprite を入れるためのsprite.Group（それ以外は pg.sprite.Group と同じ）
+    pg.sprite.Group の add/remove/has は pg.sprite.Sprite でないものを一度展開しようとして
+    TypeError を出してから登録するので、スプライトは直接 add_internal/remove_internal で出し入れする
+    """
+    kinds = (CompactSprite, pg.sprite.Sprite) #直接出し入れするスプライトの型（リストやGroupは pg.sprite.Group と同じく展開する）
+
+    def add(self, *sprites):
+        for sprite in sprites:
+            if isinstance(sprite, SpriteGroup.kinds):
+                if sprite not in self.spritedict:
+                    self.add_internal(sprite)
+                    sprite.add_internal(self)
+            else:
+                super().add(sprite)
+
+    def remove(self, *sprites):
+        for sprite in sprites:
+            if isinstance(sprite, SpriteGroup.kinds):
+                if sprite in self.spritedict:
+                    self.remove_internal(sprite)
+                    sprite.remove_internal(self)
+            else:
+                super().remove(sprite)
+
+    def has(self, *sprites):
+        if not sprites:
+            return False
+        for sprite in sprites:
+            if isinstance(sprite, SpriteGroup.kinds):
+                if sprite not in self.spritedict:
+                    return False
+            elif not super().has(sprite):
+                return False
+        return True
+
+
+class SpritePool:
+    """
+    kill()されたスプライトを捨てずに取っておき、次の生成で使い回すクラス
+    弾や爆発のように大量に作っては消すオブジェクトの生成とGCの負担を減らす
+    """
+    def __init__(self, cls: type, max_size: int = 256):
+        """
+        初期化処理
+        引数1：プールするスプライトのクラス（reset()を持つこと）
+        引数2：取っておく最大数（超えた分は捨てる）
+        """
+        self.cls = cls
+        self.max_size = max_size
+        self.free: list[pg.sprite.Sprite] = []
+        self.created = 0 #新しく作った数
+        self.reused = 0 #使い回した数
+        self.released = 0 #プールに戻した数
+        self.dropped = 0 #プールが満杯で捨てた数
+
+    def acquire(self, *args, **kwargs) -> pg.sprite.Sprite:
+        """
+        プールから1つ取り出してreset()で初期化する（空なら新しく作る）
+        引数：クラスの初期化処理と同じ引数
+        戻り値：初期化済みのスプライト
+        """
+        if self.free:
+            sprite = self.free.pop()
+            sprite.reset(*args, **kwargs)
+            self.reused += 1
+        else:
+            sprite = self.cls(*args, **kwargs)
+            self.created += 1
+        sprite.pooled = False
+        return sprite
+
+    def release(self, sprite: pg.sprite.Sprite) -> None:
+        """
+        使い終わったスプライトをプールに戻す
+        引数：どのGroupにも属していないスプライト
+        """
+        if len(self.free) < self.max_size:
+            self.free.append(sprite)
+            self.released += 1
+        else:
+            self.dropped += 1
+
+    def stats(self) -> dict[str, int]:
+        """
+        プールの利用状況を返す
+        戻り値：生成数、再利用数、返却数、破棄数、待機数の辞書
+        """
+        return {"created": self.created, "reused": self.reused, "released": self.released,
+                "dropped": self.dropped, "free": len(self.free), "max": self.max_size}
+
+
+class PooledSprite(CompactSprite):
+    """
+    SpritePoolで使い回すスプライトの基底クラス
+    サブクラスは初期化処理の中身を reset(self, ...) に書き、spawn()で生成する
+    reset() は __init__ と acquire のたびに呼ばれ、前回の状態を残さず生成直後と同じにしなければならない
+    reset() を持たないサブクラスはクラス定義の時点で TypeError になる
+    """
+    __slots__ = ("pooled",)
+    pool_size = 256 #サブクラスごとのプールの最大数
+    pool: SpritePool
+
+    def __init_subclass__(cls, **kwargs):
+        """
+        サブクラスごとに専用のプールを用意する
+        """
+        super().__init_subclass__(**kwargs)
+        if not callable(getattr(cls, "reset", None)):
+            raise TypeError(f"{cls.__name__} は reset() を定義してください")
+        cls.pool = SpritePool(cls, cls.pool_size)
+
+    def __init__(self, *args, **kwargs):
+        """
+        初期化処理
+        引数：reset()と同じ引数
+        """
+        super().__init__()
+        self.pooled = False
+        self.reset(*args, **kwargs)
+
+    @classmethod
+    def spawn(cls, *args, **kwargs) -> "PooledSprite":
+        """
+        プールから取り出して初期化したインスタンスを返す
+        引数：reset()と同じ引数
+        """
+        return cls.pool.acquire(*args, **kwargs)
+
+    def kill(self) -> None:
+        """
+        すべてのGroupから外し、プールに戻す（2回目以降のkill()では戻さない）
+        """
+        super().kill()
+        if not self.pooled:
+            self.pooled = True
+            type(self).pool.release(self)
+
+
+def pool_stats() -> dict[str, dict[str, int]]:
+    """
+    プールを持つクラスごとの利用状況を返す
+    戻り値：クラス名 -> SpritePool.stats() の辞書
+    """
+    return {cls.__name__: cls.pool.stats() for cls in PooledSprite.__subclasses__()}
+
+
+class SurfaceLRU:
+    """
+    表示する値をキーにして描画済みのSurfaceを保持するLRUキャッシュ
+    HUDのように同じ値が何フレームも続くものを、値が変わったときだけ描き直す
+    """
+    def __init__(self, maxsize: int = 16):
+        """
+        初期化処理
+        引数：保持する最大数（超えたら一番使われていないものから捨てる）
+        """
+        self.maxsize = maxsize
+        self.items: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, make):
+        """
+        keyの描画済みSurfaceを返す（なければmake()で作って保持する）
+        引数1：表示する値などのハッシュ可能なキー
+        引数2：キャッシュにないときに呼ぶ引数なしの関数
+        戻り値：make() の戻り値
+        """
+        items = self.items
+        value = items.get(key)
+        if value is not None:
+            items.move_to_end(key)
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = make()
+        items[key] = value
+        if len(items) > self.maxsize:
+            items.popitem(last=False)
+        return value
+
+
 class Bird(pg.sprite.Sprite):
     """
     ゲームキャラクター（こうかとん）に関するクラス
@@ -37,21 +1162,38 @@ class Bird(pg.sprite.Sprite):
         pg.K_LEFT: (-1, 0),
         pg.K_RIGHT: (+1, 0),
     }
+    img_scale = 0.9 #画像の倍率
+    imgs_cache: dict[int, dict[tuple[int, int], pg.Surface]] = {} #画像番号 -> 向きごとの画像
+    collide_mode = "mask" #精密な判定をする敵（ラスボス）との当たり判定の形
+
+    @classmethod
+    def direction_images(cls, num: int) -> dict[tuple[int, int], pg.Surface]:
+        """
+        向きごとのこうかとん画像を返す（画像番号ごとに初回だけ作る）
+        引数：こうかとん画像ファイル名の番号
+        戻り値：向き(x, y) -> 画像の辞書
+        """
+        imgs = cls.imgs_cache.get(num)
+        if imgs is None:
+            img0 = assets.image(f"fig/{num}.png", cls.img_scale)
+            img = pg.transform.flip(img0, True, False)
+            imgs = {
+                (+1, 0): img,
+                (+1, -1): pg.transform.rotozoom(img, 45, 0.9),
+                (0, -1): pg.transform.rotozoom(img, 90, 0.9),
+                (-1, -1): pg.transform.rotozoom(img0, -45, 0.9),
+                (-1, 0): img0,
+                (-1, +1): pg.transform.rotozoom(img0, 45, 0.9),
+                (0, +1): pg.transform.rotozoom(img, -90, 0.9),
+                (+1, +1): pg.transform.rotozoom(img, -45, 0.9),
+            }
+            cls.imgs_cache[num] = imgs
+        hit_tints.preload(imgs.values()) #ダメージエフェクト用の赤い画像も作っておく
+        return imgs
 
     def __init__(self, num: int, xy: tuple[int, int]) -> None:
         super().__init__()
-        img0 = pg.transform.rotozoom(pg.image.load(f"fig/{num}.png"), 0, 0.9)
-        img = pg.transform.flip(img0, True, False)
-        self.imgs = {
-            (+1, 0): img,
-            (+1, -1): pg.transform.rotozoom(img, 45, 0.9),
-            (0, -1): pg.transform.rotozoom(img, 90, 0.9),
-            (-1, -1): pg.transform.rotozoom(img0, -45, 0.9),
-            (-1, 0): img0,
-            (-1, +1): pg.transform.rotozoom(img0, 45, 0.9),
-            (0, +1): pg.transform.rotozoom(img, -90, 0.9),
-            (+1, +1): pg.transform.rotozoom(img, -45, 0.9),
-        }
+        self.imgs = __class__.direction_images(num)
         self.dire = (+1, 0)
         self.image = self.imgs[self.dire]
         self.rect = self.image.get_rect()
@@ -62,7 +1204,7 @@ class Bird(pg.sprite.Sprite):
         self.hp = 10
            
         if os.path.exists("sound/damage.wav"):
-            self.dmg_sound = pg.mixer.Sound("sound/damage.wav") #ダメージエフェクト(elseはエラー回避用)
+            self.dmg_sound = assets.sound("sound/damage.wav") #ダメージエフェクト(elseはエラー回避用)
         else:
             self.dmg_sound = None
 
@@ -149,14 +1291,14 @@ class Bird(pg.sprite.Sprite):
         引数1 num：こうかとん画像ファイル名の番号
         引数2 screen：画面Surface
         """
-        self.image = pg.transform.rotozoom(pg.image.load(f"fig/{num}.png"), 0, 0.9)
+        self.image = assets.image(f"fig/{num}.png", __class__.img_scale)
         screen.blit(self.image, self.rect)
 
-    def update(self, key_lst: list[bool], screen: pg.Surface):
+    def update(self, key_lst: list[bool], screen: pg.Surface | None = None):
         """
         押下キーに応じてこうかとんを移動させる
         引数1 key_lst：押下キーの真理値リスト
-        引数2 screen：画面Surface
+        引数2 screen：画面Surface（Noneなら描画は呼び出し側で行う）
         """
         sum_mv = [0, 0]
         for k, mv in __class__.delta.items():
@@ -171,15 +1313,16 @@ class Bird(pg.sprite.Sprite):
             self.rect.move_ip(-self.speed*sum_mv[0], -self.speed*sum_mv[1])
         if not (sum_mv[0] == 0 and sum_mv[1] == 0):
             self.dire = tuple(sum_mv)
-            self.image = self.imgs[self.dire]
 
-        #ダメージエフェクト追加
+        #ダメージエフェクト追加（赤い画像は作り置きを使う）
         if self.dmg_eff_time > 0:
             self.dmg_eff_time -= 1
-            self.image = self.image.copy()
-            self.image.fill((255, 0, 0, 255), special_flags=pg.BLEND_RGBA_MULT)
+            self.image = hit_tints.get(self.imgs[self.dire])
+        else:
+            self.image = self.imgs[self.dire]
 
-        screen.blit(self.image, self.rect)
+        if screen is not None:
+            screen.blit(self.image, self.rect)
 
 
 class Gravity(pg.sprite.Sprite):
@@ -202,11 +1345,15 @@ class Gravity(pg.sprite.Sprite):
 
         # 2. 決めセリフの準備（追加箇所）
         # フォントサイズ80, 赤色(255, 0, 0) で文字を作成
-        self.font = pg.font.Font(None, 100)
+        self.font = assets.font(None, 100)
         self.text_img = self.font.render("Game Over", True, (255, 0, 0))
         self.text_rect = self.text_img.get_rect()
         self.text_rect.center = (width // 2, height // 2)
 
+        # 3. 黒い画面と文字は変わらないので一度だけ重ねておく
+        pg.draw.rect(self.image, (0, 0, 0), (0, 0, width, height))
+        self.image.blit(self.text_img, self.text_rect)
+
     def update(self):
         """
         時間経過で透明度を上げ、徐々に明るくする
@@ -215,14 +1362,9 @@ class Gravity(pg.sprite.Sprite):
         if self.alpha < 0:
             self.alpha = 0
 
-        # 1. 毎回画面を黒く塗りつぶす（前のフレームの絵を消す）
-        pg.draw.rect(self.image, (0, 0, 0), (0, 0, width, height))
-
-        # 2. 黒い画面の上に文字を重ねる（追加箇所）
-        self.image.blit(self.text_img, self.text_rect)
-
-        # 3. 透明度をセット（背景と文字、両方が薄くなる）
-        self.image.set_alpha(self.alpha)
+        # 透明度をセット（背景と文字、両方が薄くなる。値が変わったときだけ）
+        if int(self.alpha) != self.image.get_alpha():
+            self.image.set_alpha(self.alpha)
 
         self.life -= 1
         if self.life < 0:
@@ -247,33 +1389,49 @@ class Hpbar:
         self.image = pg.Surface((self.width, self.height))
         self.rect = self.image.get_rect()
         self.rect.center = 110, height - 40
+        #HPバーと名前を描く範囲（差分描画で毎フレーム描き直す）
+        self.area = pg.Rect(0, self.rect.top - 40, self.rect.right + 10, self.rect.height + 50)
 
-        self.font = pg.font.SysFont("meiryo", 20, bold=True) #フォント設定
+        self.font = assets.sysfont("meiryo", 20, True, "misaki_mincho.ttf") #フォント設定
+
+        #名前は変わらないので一度だけ描く
+        bird_txt = f"こうかとん"
+        self.txt_img = self.font.render(bird_txt, True, (255, 255, 255))
+        self.txt_rect = self.txt_img.get_rect()
+        self.txt_rect.centerx = self.rect.centerx
+        self.txt_rect.bottom = self.rect.top - 5
+
+        self.bars = SurfaceLRU(16) #緑部分の幅 -> 描画済みのHPバー
+
+    def render_bar(self, green_width: int) -> pg.Surface:
+        """
+        緑部分の幅に合わせたHPバーを描く
+        引数：緑部分の整数幅
+        戻り値：HPバーのSurface
+        """
+        image = pg.Surface((self.width, self.height))
+        image.fill((255, 0, 0))
+        pg.draw.rect(image, (0, 255, 0), (0, 0, green_width, self.height)) #HP緑部分
+        pg.draw.rect(image, (255, 255, 255), (0, 0, self.width, self.height), 2) #枠
+        return image
 
     def update(self, screen: pg.Surface):
         """
-        描画処理
+        描画処理（HPの表示幅が変わったときだけバーを描き直す）
         引数：Surfaceオブジェクト
         """
         #HPバーの表示
-        self.image.fill((255, 0, 0))
         if self.bird.hp < 0:
             current_hp = 0
         else:
             current_hp = self.bird.hp
         ratio = current_hp / self.max_hp  # 現在HPの割合
         green_width = int(self.width * ratio)
-        pg.draw.rect(self.image, (0, 255, 0), (0, 0, green_width, self.height)) #HP緑部分
-        pg.draw.rect(self.image, (255, 255, 255), (0, 0, self.width, self.height), 2) #枠
+        self.image = self.bars.get(green_width, lambda: self.render_bar(green_width))
         screen.blit(self.image, self.rect) #ダメージ食らった割合
         
         #レベル表示
-        bird_txt = f"こうかとん"
-        bird_txt_img = self.font.render(bird_txt, True, (255, 255, 255))
-        txt_rect = bird_txt_img.get_rect()
-        txt_rect.centerx = self.rect.centerx
-        txt_rect.bottom = self.rect.top - 5
-        screen.blit(bird_txt_img, txt_rect)
+        screen.blit(self.txt_img, self.txt_rect)
         
         
 class Score:
@@ -286,7 +1444,7 @@ class Score:
         初期化処理
         変数の宣言
         """
-        self.font = pg.font.Font(None, 36)
+        self.font = assets.font(None, 36)
         self.color = (255, 255, 255)
         self.shadow_color = (0, 0, 0)
         self.value = 0
@@ -296,26 +1454,44 @@ class Score:
         # ゲージ位置とサイズ
         self.exp_bar_position = (130, 20)
         self.exp_bar_size = (width-200, 24)
+        self.parts = SurfaceLRU(16) #(レベル, 進捗) -> 描画済みのテキストとゲージ
+        #HUDを描く範囲（差分描画で毎フレーム描き直す）
+        self.area = pg.Rect(0, 0, width, self.exp_bar_position[1] + self.exp_bar_size[1] + 10)
 
     def update(self, screen: pg.Surface):
         """
-        描画処理
+        描画処理（レベルか進捗が変わったときだけテキストとゲージを描き直す）
         引数：Surfaceオブジェクト
         レベル、経験値ゲージの描画
         """
         # レベルと進捗を計算
         level = int(self.value / 10)
         progress = self.value % 10  # 0..9 (10で次レベル)
+        shadow_surface, text_surface, exp_Surface, prog_surface = self.parts.get(
+            (level, progress), lambda: self.render(level, progress))
 
+        gx, gy = self.exp_bar_position
+        gw, gh = self.exp_bar_size
+        screen.blits([
+            (shadow_surface, (self.text_posision[0] + 2, self.text_posision[1] + 2)), # レベル表示（影付き）
+            (text_surface, self.text_posision),
+            (exp_Surface, (gx, gy)), # ゲージ
+            (prog_surface, (gx + gw + 10, gy - 2)), # 進捗テキスト
+        ], False)
+
+    def render(self, level: int, progress: int) -> tuple[pg.Surface, pg.Surface, pg.Surface, pg.Surface]:
+        """
+        レベル表示と経験値ゲージのSurfaceを作る
+        引数1：表示するレベル
+        引数2：次のレベルまでの進捗（0..9）
+        戻り値：(影, レベル表示, ゲージ, 進捗テキスト) のSurface
+        """
         # レベル表示（影付き）
         text = f"Level: {level}"
         shadow_surface = self.font.render(text, True, self.shadow_color)
         text_surface = self.font.render(text, True, self.color)
-        screen.blit(shadow_surface, (self.text_posision[0] + 2, self.text_posision[1] + 2))
-        screen.blit(text_surface, self.text_posision)
 
         # ゲージ描画
-        gx, gy = self.exp_bar_position
         gw, gh = self.exp_bar_size
 
         # ゲージ描写のSurfaceを作成(透明度設定)
@@ -332,12 +1508,11 @@ class Score:
 
         #alpha値の設定
         exp_Surface.set_alpha(240)
-        screen.blit(exp_Surface,(gx,gy))
 
         # 進捗テキスト（例: 3/10）を右側に表示
         prog_text = f"{progress}/10"
         prog_surface = self.font.render(prog_text, True, self.color)
-        screen.blit(prog_surface, (gx + gw + 10, gy - 2))
+        return shadow_surface, text_surface, exp_Surface, prog_surface
 
     def check_level_up(self) -> bool:
         """
@@ -364,34 +1539,80 @@ class Starting:
         パラメータ宣言
         """
         #フォント設定
-        self.title = pg.font.Font("misaki_mincho.ttf", 150)
-        self.font = pg.font.Font("misaki_mincho.ttf", 36)
+        self.title = assets.font("misaki_mincho.ttf", 150)
+        self.font = assets.font("misaki_mincho.ttf", 36)
 
         self.color = (255, 255, 255)
-        img = pg.image.load("fig/2.png")
-        img2 = pg.image.load("fig/serihu_pass_icon.png")
-        self.chicken_image = pg.transform.rotozoom(img, 0, 1.0)
-        self.chicken_image2 = pg.transform.rotozoom(img, 0, 1.0)
+        self.chicken_image = assets.image("fig/2.png", 1.0)
+        self.chicken_image2 = assets.image("fig/2.png", 1.0)
         # 左右反転してテキストの両脇に置く
         self.chicken_image3 = pg.transform.flip(self.chicken_image2, True, False)
-        self.triangle=pg.transform.rotozoom(img2,30,0.06)
+        self.triangle = assets.image("fig/serihu_pass_icon.png", 0.06, angle=30)
 
         # メニュー状態
         self.options = ["start", "quit"]
         self.selected = 0
 
-    def update(self, screen: pg.Surface):
+        #変わらない部分の作り置き
+        self.overlay: pg.Surface | None = None #半透明オーバーレイ
+        self.base: pg.Surface | None = None #背景にオーバーレイ・タイトル・チキン画像を重ねた画面
+        self.base_bg: pg.Surface | None = None #baseを作ったときの背景
+        self.option_imgs: dict[tuple[int, bool], pg.Surface] = {} #(番号, 選択中か) -> 描画済みの選択肢
+
+    def state(self):
+        """
+        表示内容が変わったかの判定に使う値を返す
+        """
+        return ("start", self.selected)
+
+    def update(self, screen: pg.Surface, bg: pg.Surface | None = None):
         """
         描画処理
-        引数：Surfaceオブジェクト
+        引数1：Surfaceオブジェクト
+        引数2：背景Surface（指定すると背景ごと作り置きした画面を1回で描く）
         タイトル画面の表示
         """
+        if bg is None:
+            self.draw_static(screen)
+        else:
+            if self.base_bg is not bg:
+                self.base = bg.copy()
+                self.draw_static(self.base)
+                self.base_bg = bg
+            screen.blit(self.base, (0, 0))
+
+        # メニュー（選択肢）を描画
+        start_y = height // 2
+        for i, opt in enumerate(self.options):
+            key = (i, i == self.selected)
+            opt_surf = self.option_imgs.get(key)
+            if opt_surf is None:
+                color = (255, 255, 0) if i == self.selected else self.color
+                opt_surf = self.font.render(opt, True, color)
+                self.option_imgs[key] = opt_surf
+            ox = width // 2 - opt_surf.get_width() // 2
+            oy = start_y + i * (opt_surf.get_height() + 10)
+            screen.blit(opt_surf, (ox, oy))
+            # 選択中の項目に合わせて三角形を表示
+            if i == self.selected and self.triangle:
+                tri_w = self.triangle.get_width()
+                tri_h = self.triangle.get_height()
+                tx = ox - tri_w - 12
+                ty = oy + (opt_surf.get_height() - tri_h) // 2
+                screen.blit(self.triangle, (tx, ty))
+
+    def draw_static(self, screen: pg.Surface):
+        """
+        選択によって変わらない部分（オーバーレイ・タイトル・チキン画像）を描く
+        引数：Surfaceオブジェクト
+        """
         title = "tut伝説"
 
         # 背景の半透明オーバーレイを描く
-        overlay = pg.Surface((width, height), pg.SRCALPHA)
-        overlay.fill((0, 0, 0, 120))
-        screen.blit(overlay, (0, 0))
+        if self.overlay is None:
+            self.overlay = pg.Surface((width, height), pg.SRCALPHA)
+            self.overlay.fill((0, 0, 0, 120))
+        screen.blit(self.overlay, (0, 0))
 
         title_surf = self.title.render(title, True, self.color)
         tx = width // 2 - title_surf.get_width() // 2
@@ -410,22 +1631,6 @@ class Starting:
             screen.blit(self.chicken_image, (left_x, iy))
             screen.blit(self.chicken_image3, (right_x, iy))
 
-        # メニュー（選択肢）を描画
-        start_y = height // 2
-        for i, opt in enumerate(self.options):
-            color = (255, 255, 0) if i == self.selected else self.color
-            opt_surf = self.font.render(opt, True, color)
-            ox = width // 2 - opt_surf.get_width() // 2
-            oy = start_y + i * (opt_surf.get_height() + 10)
-            screen.blit(opt_surf, (ox, oy))
-            # 選択中の項目に合わせて三角形を表示
-            if i == self.selected and self.triangle:
-                tri_w = self.triangle.get_width()
-                tri_h = self.triangle.get_height()
-                tx = ox - tri_w - 12
-                ty = oy + (opt_surf.get_height() - tri_h) // 2
-                screen.blit(self.triangle, (tx, ty))
-
 
 class LevelUpSelector:
     """
@@ -436,8 +1641,8 @@ class LevelUpSelector:
         """
         初期化処理
         """
-        self.font = pg.font.Font("misaki_mincho.ttf", 36)
-        self.title_font = pg.font.Font("misaki_mincho.ttf", 50)
+        self.font = assets.font("misaki_mincho.ttf", 36)
+        self.title_font = assets.font("misaki_mincho.ttf", 50)
         self.color = (255, 255, 255)
         self.selected_color = (255, 255, 0)
         
@@ -451,22 +1656,33 @@ class LevelUpSelector:
         ]
         self.selected = 0
 
-    def update(self, screen: pg.Surface, bird: "Bird" = None):
+        #変わらない部分の作り置き
+        self.overlay: pg.Surface | None = None #半透明オーバーレイ
+        self.base: pg.Surface | None = None #背景にオーバーレイとタイトルを重ねた画面
+        self.base_bg: pg.Surface | None = None #baseを作ったときの背景
+
+    def state(self, bird: "Bird" = None):
         """
-        選択画面の描画
-        引数: screen: Surfaceオブジェクト, bird: Birdインスタンス（武器レベルチェック用）
+        表示内容が変わったかの判定に使う値を返す
+        引数：Birdインスタンス（武器レベルチェック用）
         """
-        # 半透明の背景オーバーレイ
-        overlay = pg.Surface((width, height), pg.SRCALPHA)
-        overlay.fill((0, 0, 0, 180))
-        screen.blit(overlay, (0, 0))
+        levels = () if bird is None else tuple(None if it is None else it.get("level") for it in bird.get_items())
+        return ("levelup", self.selected, levels)
 
-        # タイトル表示
-        title_text = "武器を選択してください"
-        title_surf = self.title_font.render(title_text, True, self.selected_color)
-        title_x = width // 2 - title_surf.get_width() // 2
-        title_y = height // 4
-        screen.blit(title_surf, (title_x, title_y))
+    def update(self, screen: pg.Surface, bird: "Bird" = None, bg: pg.Surface | None = None):
+        """
+        選択画面の描画
+        引数: screen: Surfaceオブジェクト, bird: Birdインスタンス（武器レベルチェック用）,
+              bg: 背景Surface（指定すると背景ごと作り置きした画面を1回で描く）
+        """
+        if bg is None:
+            self.draw_static(screen)
+        else:
+            if self.base_bg is not bg:
+                self.base = bg.copy()
+                self.draw_static(self.base)
+                self.base_bg = bg
+            screen.blit(self.base, (0, 0))
 
         # 武器選択肢の表示（レベル5に達した武器は表示しない）
         start_y = height // 2
@@ -488,6 +1704,24 @@ class LevelUpSelector:
             screen.blit(weapon_surf, (weapon_x, weapon_y))
             display_index += 1
 
+    def draw_static(self, screen: pg.Surface):
+        """
+        選択によって変わらない部分（オーバーレイとタイトル）を描く
+        引数：Surfaceオブジェクト
+        """
+        # 半透明の背景オーバーレイ
+        if self.overlay is None:
+            self.overlay = pg.Surface((width, height), pg.SRCALPHA)
+            self.overlay.fill((0, 0, 0, 180))
+        screen.blit(self.overlay, (0, 0))
+
+        # タイトル表示
+        title_text = "武器を選択してください"
+        title_surf = self.title_font.render(title_text, True, self.selected_color)
+        title_x = width // 2 - title_surf.get_width() // 2
+        title_y = height // 4
+        screen.blit(title_surf, (title_x, title_y))
+
 
 # class Ending:
 #     """
@@ -507,11 +1741,14 @@ class LevelUpSelector:
 
 
 # 武器に関するクラス
-class Bomb_Weapon(pg.sprite.Sprite):
+class Bomb_Weapon(CompactSprite):
     """
     ボム武器に関するクラス
     爆弾を設置する。これ自体に攻撃性は持たせない
     """
+    __slots__ = ("cnt",)
+    img_size = (100, 100) #画像サイズ
+
     def __init__(self, bird: "Bird"):
         """
         初期化処理
@@ -520,8 +1757,7 @@ class Bomb_Weapon(pg.sprite.Sprite):
         super().__init__()
 
         #画像設定
-        self.image = pg.image.load("fig/bomb.png")
-        self.image = pg.transform.scale(self.image, (100, 100))
+        self.image = assets.image("fig/bomb.png", size=__class__.img_size)
         #Rect取得
         self.rect = self.image.get_rect()
         self.rect.center = bird.rect.center
@@ -529,43 +1765,56 @@ class Bomb_Weapon(pg.sprite.Sprite):
         #ステータス設定
         self.cnt = 100 #表示時間
 
-    def update(self, screen: pg.Surface):
+    def update(self, screen: pg.Surface | None = None):
         """
         描画処理
-        引数：表示用Surface
+        引数：表示用Surface（Noneなら描画はGroup.drawで行う）
         カウンタが0になるまで表示する
         """
         self.cnt -= 1
-        screen.blit(self.image, self.rect) #自己描画
+        if screen is not None:
+            screen.blit(self.image, self.rect) #自己描画
 
         #カウンタが0になったら削除
         if self.cnt == 0:
             self.kill()
 
 
-class Laser_Weapon(pg.sprite.Sprite):
+class Laser_Weapon(PooledSprite):
     """
     レーザー武器に関するクラス
     レーザーを発射する
     """
+    __slots__ = ("vx", "vy", "atk", "speed", "geom", "origin")
+    pool_size = 64 #使い回すレーザーの最大数
+    linear = True #ProjectileSwarmで一括移動できるか
+    collide_mode = "capsule" #当たり判定は画像の矩形ではなく光線の線分（SpatialHash.capsule_hits）
     #軽量化のために一回だけ読み込むようにする
     base_img: pg.Surface | None = None
+    #元画像の光線部分の (中心からのずれx, ずれy, 半分の長さ, 半分の太さ)
+    beam: tuple[float, float, float, float] | None = None
     #キャッシュを保存するための辞書
     cache: dict[tuple[int, int, int, bool, bool], pg.Surface] = {}
+    #当たり判定の線分のキャッシュ（画像と同じキー、同じ向きのレーザーで共有する）
+    geoms: dict[tuple[int, int, int, bool, bool], tuple[float, ...]] = {}
     
-    def __init__(self, bird: "Bird", level: int, reverse: bool = False, angle_change: bool = False):
+    def reset(self, bird: "Bird", level: int, reverse: bool = False, angle_change: bool = False):
         """
-        初期化処理
+        初期化処理（プールから取り出したときにも呼ばれる）
         引数1：Birdインスタンス
         引数2：武器の整数レベル
         引数3：方向反転のbool値(初期値False)
         引数4：縦方向のbool値(初期値False)
         """
-        super().__init__()
         #一度だけ読み込む
         if Laser_Weapon.base_img is None:
-            Laser_Weapon.base_img = pg.image.load("fig/laser.png").convert_alpha()
-            Laser_Weapon.base_img = pg.transform.scale(Laser_Weapon.base_img, (200, 200))
+            Laser_Weapon.base_img = assets.image("fig/laser.png", size=(200, 200))
+        if Laser_Weapon.beam is None:
+            #不透明部分を囲む矩形を光線の線分にする（ぼんやり光る半透明の縁は含めない）
+            rects = shapes.image_mask(Laser_Weapon.base_img).get_bounding_rects()
+            box = rects[0].unionall(rects[1:])
+            w, h = Laser_Weapon.base_img.get_size()
+            Laser_Weapon.beam = (box.x + box.w / 2 - w / 2, box.y + box.h / 2 - h / 2, box.w / 2, box.h / 2)
 
         #角度設定
         self.vx, self.vy = bird.dire #鳥の角度を取得
@@ -601,6 +1850,36 @@ class Laser_Weapon(pg.sprite.Sprite):
         self.atk = 5 * level #攻撃力
         self.speed = 20 - level #レーザーの速さ
 
+        #当たり判定の線分（画像と同じだけ回転・拡大する）
+        geom = Laser_Weapon.geoms.get(key)
+        if geom is None:
+            ox, oy, half, thick = Laser_Weapon.beam
+            c = math.cos(math.radians(angle)) * scale
+            s = math.sin(math.radians(angle)) * scale
+            ax, ay = half * c, -half * s #光線の中心から先端へのベクトル
+            sx, sy = int(self.speed * self.vx), int(self.speed * self.vy) #1フレームの移動量（move_ipと同じ切り捨て）
+            if ax * sx + ay * sy < 0: #進む向きの先端を向ける
+                ax, ay = -ax, -ay
+            #(Rectの中心から光線の中心へのずれx, y, 先端へのベクトルx, y, 半径, 1フレームの移動量x, y)
+            geom = Laser_Weapon.geoms[key] = (ox * c + oy * s, oy * c - ox * s, ax, ay, thick * scale, sx, sy)
+        self.geom = geom
+        self.origin = self.rect.center #出現した位置
+
+    def capsule(self) -> tuple[float, float, float, float, float]:
+        """
+        当たり判定のカプセル（半径のある線分）を返す
+        前回の判定から今回までに動いた分も線分に含める（速い光線が敵をすり抜けないようにする）
+        戻り値：線分の両端の座標 x0, y0, x1, y1 と半径（(x1, y1)が進む向きの先端）
+        """
+        ox, oy, ax, ay, radius, sx, sy = self.geom
+        cx = self.rect.centerx + ox
+        cy = self.rect.centery + oy
+        x0, y0 = cx - ax, cy - ay
+        if self.rect.center != self.origin: #出現したフレームはまだ動いていない
+            x0 -= sx
+            y0 -= sy
+        return x0, y0, cx + ax, cy + ay, radius
+
     def update(self):
         """
         描画処理
@@ -614,50 +1893,65 @@ class Laser_Weapon(pg.sprite.Sprite):
             self.kill()
 
 
-class Missile_Weapon(pg.sprite.Sprite):
+class Missile_Weapon(PooledSprite):
     """
     追尾ミサイル武器に関するクラス
     ランダムな敵をターゲットに追尾し続ける
     """
+    __slots__ = ("target", "atk", "spd", "cnt", "vx", "vy")
+    pool_size = 64 #使い回すミサイルの最大数
+    homing = "random" #ターゲットの選び方（"random"：ランダムな敵、"nearest"：近い敵）
     #画像を1回だけ読み込む
     base_img: pg.Surface | None = None
-    
-    def __init__(self, bird: "Bird", emys: pg.sprite.Group):
+    #回転済み画像のキャッシュ（rotation_steps刻み）
+    rotation_steps = 128
+    rot_cache: RotationCache | None = None
+
+    @classmethod
+    def rotations(cls) -> RotationCache:
         """
-        初期化処理
+        回転済み画像のキャッシュを返す（初回だけ作る）
+        """
+        if cls.rot_cache is None or cls.rot_cache.steps != cls.rotation_steps:
+            if cls.base_img is None:
+                cls.base_img = assets.image("fig/missile.png", size=(100, 50))
+            cls.rot_cache = RotationCache(cls.base_img, cls.rotation_steps, smooth=True)
+        return cls.rot_cache
+
+    def reset(self, bird: "Bird", emys: pg.sprite.Group, target: "Enemy | None" = None):
+        """
+        初期化処理（プールから取り出したときにも呼ばれる）
         引数1：Birdインスタンス
         引数2：Enemyオブジェクトを格納するsprite.Group
+        引数3：狙う敵（Noneならランダム）
         """
-        super().__init__()
-
-        #ターゲット設定(ランダム)
-        if len(emys) == 0:
-            self.kill()
-            return
-        self.target = random.choice(emys.sprites())
+        #ターゲット設定(ランダム、敵がいないならupdateで決め直す)
+        if target is None and len(emys) > 0:
+            target = rng.choice(emys.sprites())
+        self.target = target
 
         #画像設定
         if Missile_Weapon.base_img is None: #一回だけ読み込む
-            img = pg.image.load("fig/missile.png").convert_alpha()
-            Missile_Weapon.base_img = pg.transform.scale(img, (100, 50))
+            Missile_Weapon.base_img = assets.image("fig/missile.png", size=(100, 50))
 
         self.image = Missile_Weapon.base_img
         self.rect = self.image.get_rect() #Rect取得
         self.rect.center = bird.rect.center #Rectの中央を鳥のRectの中央に合わせる
 
         #ステータス設定
-        self.atk = random.randint(50, 100) #攻撃力
-        self.spd = 15 - random.randint(0, 5) #速度
+        self.atk = rng.randint(50, 100) #攻撃力
+        self.spd = 15 - rng.randint(0, 5) #速度
         
         #出現用カウンタ
-        self.cnt = random.randint(1, 5)
+        self.cnt = rng.randint(1, 5)
 
-    def update(self, emys: pg.sprite.Group):
+    def update(self, emys: pg.sprite.Group, grid: SpatialHash | None = None):
         """
         描画処理
-        引数：敵を格納するsprite.Group
+        引数1：敵を格納するsprite.Group
+        引数2：敵の当たり判定用グリッド（homingが"nearest"のとき近い敵を探すのに使う）
         ターゲットにぶつかるまで、常にターゲットした敵の方向に向いて移動する。
-        ターゲットが消えたらまたランダムにターゲットにする。
+        ターゲットが消えたらまたランダムに（nearestなら一番近い敵を）ターゲットにする。
         """
         #遅延処理
         if self.cnt > 0:
@@ -669,7 +1963,10 @@ class Missile_Weapon(pg.sprite.Sprite):
             if len(emys) == 0: #敵がいないなら消失
                 self.kill()
                 return
-            self.target = random.choice(emys.sprites())
+            target = None
+            if __class__.homing == "nearest" and grid is not None:
+                target = grid.nearest(self.rect.center)
+            self.target = target if target is not None else rng.choice(emys.sprites())
 
         #敵の中心とミサイル中心のx,y成分
         dx = self.target.rect.centerx - self.rect.centerx
@@ -687,38 +1984,38 @@ class Missile_Weapon(pg.sprite.Sprite):
         angle = math.degrees(math.atan2(-self.vy, self.vx))
 
         center = self.rect.center #中央の保持
-        #画像の角度変更
-        self.image = pg.transform.rotozoom(Missile_Weapon.base_img, angle, 1.0)
+        #画像の角度変更（回転済み画像の表引き）
+        self.image = Missile_Weapon.rotations().image(angle)
         self.rect = self.image.get_rect(center=center)
 
         #移動
         self.rect.move_ip(self.spd * self.vx, self.spd * self.vy)
 
 
-class Gun_Weapon(pg.sprite.Sprite):
+class Gun_Weapon(PooledSprite):
     """
     連続弾武器に関するクラス
     連続的に弾を射出する
     """
+    __slots__ = ("vx", "vy", "atk", "speed")
+    pool_size = 256 #使い回す弾の最大数
+    linear = True #ProjectileSwarmで一括移動できるか
     #軽量化のため一度だけ画像を読み込む
     base_img: pg.Surface | None = None
     #キャッシュ
     cache: dict[tuple[int, int], pg.Surface] = {}
     
-    def __init__(self, bird: "Bird", space: int, level: int):
+    def reset(self, bird: "Bird", space: int, level: int):
         """
-        初期化処理
+        初期化処理（プールから取り出したときにも呼ばれる）
         引数1：Birdインスタンス
         引数2：鳥中心からのずらし整数値
         引数3：武器レベル
         """
-        super().__init__()
-
         #画像設定
         #画像は最初の1回だけ
         if Gun_Weapon.base_img is None:
-            img = pg.image.load("fig/bullet.png").convert_alpha()
-            Gun_Weapon.base_img = pg.transform.scale(img, (20, 20))
+            Gun_Weapon.base_img = assets.image("fig/bullet.png", size=(20, 20))
         
         dire = bird.dire
         vx0, vy0 = dire
@@ -762,10 +2059,24 @@ class Gun_Weapon(pg.sprite.Sprite):
             self.kill()
 
 
-class Sword_Wepon(pg.sprite.Sprite):
+class Sword_Wepon(CompactSprite):
     """
     円の軌道で周回する剣武器に関するクラス
-    """   
+    """
+    __slots__ = ("bird", "angle", "base_image", "atk", "radius", "spd")
+    #回転済み画像と周回位置テーブルのキャッシュ（rotation_steps刻み）
+    rotation_steps = 128
+    rot_cache: RotationCache | None = None
+
+    @classmethod
+    def rotations(cls) -> RotationCache:
+        """
+        回転済み画像のキャッシュを返す（初回だけ作る）
+        """
+        if cls.rot_cache is None or cls.rot_cache.steps != cls.rotation_steps:
+            cls.rot_cache = RotationCache(assets.image("fig/sword.png", size=(100, 100)), cls.rotation_steps)
+        return cls.rot_cache
+
     def __init__(self, bird: "Bird", angle: float = 0.0):
         """
         初期化処理
@@ -778,8 +2089,7 @@ class Sword_Wepon(pg.sprite.Sprite):
         self.angle = angle #初期化角度
 
         #画像設定
-        self.base_image = pg.image.load("fig/sword.png")
-        self.base_image = pg.transform.scale(self.base_image, (100, 100))
+        self.base_image = assets.image("fig/sword.png", size=(100, 100))
 
         self.image = self.base_image
         self.rect = self.image.get_rect() #Rect取得
@@ -797,51 +2107,47 @@ class Sword_Wepon(pg.sprite.Sprite):
         self.angle += self.spd #角度の変化
         cx, cy  = self.bird.rect.center #鳥の中心を取得
 
-        #中心座標の決定
-        x = cx + self.radius * math.cos(self.angle)
-        y = cy + self.radius * math.sin(self.angle)
-        center = (x, y)
+        #角度に一番近い刻みの番号で周回位置と回転済み画像を表引きする
+        cache = Sword_Wepon.rotations()
+        i = cache.index_rad(self.angle)
+        dx, dy = cache.orbit(self.radius)[i]
+        center = (cx + dx, cy + dy) #中心座標の決定
 
-        #画像角度の決定
-        dx = x - cx
-        dy = y - cy
-        image_angle = -math.degrees(math.atan2(dy, dx))
-
-        #画像角度の変更
-        self.image = pg.transform.rotate(self.base_image, image_angle)
+        #画像は周回角度と逆向きに回転させる
+        self.image = cache.images[-i]
         self.rect = self.image.get_rect(center=center)
 
 
-class Explosion(pg.sprite.Sprite):
+class Explosion(PooledSprite):
     """
-    爆発に関するクラス（敵撃破時と敵への攻撃用の兼用）
-    敵の撃破時に発生、ボム武器の攻撃判定ありの爆破
+    爆発に関するクラス
+    敵の撃破時に発生する（ボムの攻撃範囲はBombBlastが同じ画像で描く）
     """
+    __slots__ = ("imgs", "life", "atk")
+    pool_size = 512 #使い回す爆発の最大数
     #軽量化のため画像を一回だけ読み込む
     base_img: pg.Surface | None = None
     #キャッシュを保存するための辞書
     cache: dict[tuple[bool, bool], list[pg.Surface]] = {}
 
-    def __init__(self, obj: "Enemy|Bomb_Weapon", life: int, wep_mode: bool = False, add: bool = False, step: tuple[int, int] = (0, 0)):
+    @classmethod
+    def variants(cls, wep_mode: bool, add: bool) -> list[pg.Surface]:
         """
-        爆弾が爆発するエフェクトを生成する
-        引数1：爆発するBombまたは敵機インスタンス
-        引数2：爆発整数時間
-        引数3：武器モード有効化bool値
-        引数4：追撃モード有効化bool値
-        引数5：爆破エフェクトが出来るだけ完全に重なることがないようにずらすためのタプル係数(x, y)
+        色を変えた爆発画像と、その上下左右反転画像を返す（初回だけ作る）
+        引数1：武器モード有効化bool値
+        引数2：追撃モード有効化bool値
+        戻り値：[通常, 反転] の画像リスト
         """
-        super().__init__()
-        if Explosion.base_img is None:
-            Explosion.base_img = pg.image.load("fig/explosion.gif").convert_alpha()
-        
         key = (wep_mode, add)
         #キャッシュ呼び出し
-        imgs = Explosion.cache.get(key)
+        imgs = cls.cache.get(key)
         #キャッシュがないなら
         if imgs is None:
+            if cls.base_img is None:
+                cls.base_img = assets.load("fig/explosion.gif")
+
             #画像色変更
-            img = Explosion.base_img.copy()
+            img = cls.base_img.copy()
             if wep_mode:
                 img.fill((255, 0, 255), special_flags=pg.BLEND_RGB_MULT)
             if add:
@@ -849,20 +2155,30 @@ class Explosion(pg.sprite.Sprite):
 
             #キャッシュ保存
             imgs = [img, pg.transform.flip(img, 1, 1)]
-            Explosion.cache[key] = imgs
+            cls.cache[key] = imgs
+        return imgs
 
-        self.imgs = imgs
+    def reset(self, obj: "Enemy|Bomb_Weapon", life: int, wep_mode: bool = False, add: bool = False, step: tuple[int, int] = (0, 0)):
+        """
+        爆弾が爆発するエフェクトを生成する（プールから取り出したときにも呼ばれる）
+        引数1：爆発するBombまたは敵機インスタンス
+        引数2：爆発整数時間
+        引数3：武器モード有効化bool値
+        引数4：追撃モード有効化bool値
+        引数5：爆破エフェクトが出来るだけ完全に重なることがないようにずらすためのタプル係数(x, y)
+        """
+        self.imgs = Explosion.variants(wep_mode, add)
         self.image = self.imgs[0]
         
         self.rect = self.image.get_rect()
         self.rect.center = obj.rect.center
         if add: #レベルが上がるたびに追撃爆破を発生させる
-            self.rect.centerx += random.randint(-50, 50) + step[0] * 10
-            self.rect.centery += random.randint(-50, 50) + step[1] * 10
+            self.rect.centerx += rng.randint(-50, 50) + step[0] * 10
+            self.rect.centery += rng.randint(-50, 50) + step[1] * 10
             
         self.life = life
         
-        self.atk = 100 - add * random.randint(1, 5) * 10 #攻撃力(自機のボムから出たときのみ有効)
+        self.atk = 100 - add * rng.randint(1, 5) * 10 #攻撃力(自機のボムから出たときのみ有効)
 
     def update(self):
         """
@@ -875,6 +2191,153 @@ class Explosion(pg.sprite.Sprite):
             self.kill()
 
 
+class BombBlast(CompactSprite):
+    """
+    ボム1回分の攻撃範囲に関するクラス
+    追撃爆破とメイン爆破を爆発1つずつのスプライトにせず、矩形と攻撃力の並びとして持つ
+    当たり判定と描画はBlastGroupがまとめて行う
+    """
+    __slots__ = ("boxes", "atks", "adds", "box_arr", "atk_arr", "life")
+    lifetime = 100 #攻撃範囲が残る時間
+
+    def __init__(self, center: tuple[int, int], level: int):
+        """
+        初期化処理
+        引数1：爆発の中心座標
+        引数2：ボムレベル（2以上で追撃爆破、4以上で横一列、5で縦一列にも広がる）
+        """
+        super().__init__()
+        steps = []
+        if level < 4:
+            #(レベル-1)*2個分、ボム座標の周囲に追撃爆破を発生させる
+            for i in range(level - 1):
+                steps += [(i, i), (i, i)]
+        else:
+            #横軸に爆発を並べる
+            for i in range(10):
+                steps += [(i * 10, 0), (i * -10, 0)]
+        if level >= 5:
+            #縦軸にも爆発を並べる
+            for i in range(10):
+                steps += [(0, i * 10), (0, i * -10)]
+
+        size = Explosion.variants(True, True)[0].get_rect()
+        self.boxes: list[pg.Rect] = [] #爆発ごとの範囲
+        self.atks: list[int] = [] #爆発ごとの攻撃力
+        for step in steps:
+            box = size.copy()
+            box.center = center
+            box.centerx += rng.randint(-50, 50) + step[0] * 10
+            box.centery += rng.randint(-50, 50) + step[1] * 10
+            self.boxes.append(box)
+            self.atks.append(100 - rng.randint(1, 5) * 10)
+        self.adds = len(self.boxes) #先頭からいくつが追撃爆破か
+
+        #メイン爆破（追撃爆破と同じく攻撃力の乱数を1つ使う）
+        rng.randint(1, 5)
+        self.rect = Explosion.variants(True, False)[0].get_rect(center=center)
+        self.boxes.append(self.rect.copy())
+        self.atks.append(100)
+        if np is not None:
+            self.box_arr = np.array([(b.left, b.top, b.right, b.bottom) for b in self.boxes], dtype=np.int64)
+            self.atk_arr = np.array(self.atks, dtype=np.int64)
+        self.life = __class__.lifetime
+
+    def update(self):
+        """
+        残り時間を1減らし、なくなったら消す
+        """
+        self.life -= 1
+        if self.life < 0:
+            self.kill()
+
+
+class BlastGroup(SpriteGroup):
+    """
+    BombBlastをまとめるsprite.Group
+    当たり判定は全ての爆発の矩形と敵の矩形を（NumPyがあれば配列で）一度に比べ、
+    描画は爆発画像を並べて貼るだけにする
+    """
+    def __init__(self):
+        super().__init__()
+        self.drawn: list[pg.Rect] = [] #前回のdraw()で描いた範囲
+
+    def boxes(self) -> list[pg.Rect]:
+        """
+        全ての爆発の範囲を追加した順に返す
+        """
+        return [box for blast in self for box in blast.boxes]
+
+    def damage(self, grid: SpatialHash) -> dict[pg.sprite.Sprite, int]:
+        """
+        爆発の範囲と重なる敵ごとに、重なった爆発の攻撃力の合計を返す
+        引数：rebuild() 済みの敵のグリッド
+        戻り値：{敵: ダメージ} の辞書（敵の登録順）
+        """
+        blasts = self.sprites()
+        if not blasts:
+            return {}
+        if np is None:
+            hits: dict = {}
+            for blast in blasts:
+                for box, atk in zip(blast.boxes, blast.atks):
+                    for emy in grid.query(box):
+                        hits[emy] = hits.get(emy, 0) + atk
+            return dict(sorted(hits.items(), key=lambda item: grid.order[item[0]]))
+
+        if not grid.rects:
+            return {}
+        emys = list(grid.order)
+        er = np.array(grid.rects, dtype=np.int64)
+        members = grid.members
+        live = [i for i, emy in enumerate(emys) if emy in members]
+        if len(live) != len(emys): #グリッドを作ったあとに倒れた敵を外す
+            emys = [emys[i] for i in live]
+            er = er[live]
+        if not emys:
+            return {}
+        boxes = np.concatenate([blast.box_arr for blast in blasts])
+        atks = np.concatenate([blast.atk_arr for blast in blasts])
+        #Rect.colliderect と同じ判定を 敵×爆発 の表でまとめて行う
+        over = ((er[:, None, 0] < boxes[None, :, 2]) & (boxes[None, :, 0] < er[:, None, 2])
+                & (er[:, None, 1] < boxes[None, :, 3]) & (boxes[None, :, 1] < er[:, None, 3]))
+        dmg = over.astype(np.int64) @ atks
+        hit = np.flatnonzero(over.any(axis=1)).tolist()
+        dmg = dmg.tolist()
+        all_boxes = None #全ての爆発の範囲を並べたリスト（形で判定し直す敵がいたときに1回だけ作る）
+        out = {}
+        for i in hit:
+            emy = emys[i]
+            if getattr(emy, "collide_mode", "rect") != "rect":
+                #ラスボスなどは矩形が重なった爆発だけ形で判定し直す
+                if all_boxes is None:
+                    all_boxes = [box for blast in blasts for box in blast.boxes]
+                    all_atks = atks.tolist()
+                dmg[i] = sum(all_atks[j] for j in np.flatnonzero(over[i]).tolist()
+                             if shapes.collide(all_boxes[j], emy))
+                if not dmg[i]:
+                    continue
+            out[emy] = dmg[i]
+        return out
+
+    def draw(self, surface: pg.Surface) -> list[pg.Rect]:
+        """
+        爆発画像を範囲ごとに貼る（残り時間に応じて画像を切り替える）
+        引数：描画先Surface
+        戻り値：描いた範囲のリスト
+        """
+        add_imgs = Explosion.variants(True, True)
+        main_imgs = Explosion.variants(True, False)
+        seq = []
+        for blast in self:
+            i = blast.life // 10 % 2
+            n = blast.adds
+            seq.extend((add_imgs[i], box) for box in blast.boxes[:n])
+            seq.append((main_imgs[i], blast.boxes[n]))
+        self.drawn = surface.blits(seq) if seq else []
+        return self.drawn
+
+
 class Weapon_Control:
     """
     武器顕現のルールやレベル別の処理の一部を扱うクラス
@@ -887,23 +2350,17 @@ class Weapon_Control:
         カウンタの宣言
         """
         #武器顕現時の効果音
-        self.bb_se = pg.mixer.Sound("sound/bb.wav")
-        self.bb_se.set_volume(0.4)
+        self.bb_se = assets.sound("sound/bb.wav", 0.4)
         
-        self.exp_se = pg.mixer.Sound("sound/bb_effct.wav")
-        self.exp_se.set_volume(0.2)
+        self.exp_se = assets.sound("sound/bb_effct.wav", 0.2)
 
-        self.laser_se = pg.mixer.Sound("sound/laser.wav")
-        self.laser_se.set_volume(0.1)
+        self.laser_se = assets.sound("sound/laser.wav", 0.1)
 
-        self.mssl_se = pg.mixer.Sound("sound/mssle.wav")
-        self.mssl_se.set_volume(0.4)
+        self.mssl_se = assets.sound("sound/mssle.wav", 0.4)
         
-        self.gun_se = pg.mixer.Sound("sound/gun.wav")
-        self.gun_se.set_volume(0.1)
+        self.gun_se = assets.sound("sound/gun.wav", 0.1)
         
-        self.swrd_se = pg.mixer.Sound("sound/sword.wav")
-        self.swrd_se.set_volume(0.1)
+        self.swrd_se = assets.sound("sound/sword.wav", 0.1)
         
         #武器レベル管理
         self.bomb_level = 1
@@ -916,6 +2373,12 @@ class Weapon_Control:
         self.laser_power = 100 #レーザー射出管理
         self.sword_recast = 500 #剣群持続時間
 
+    def levels(self) -> list[int]:
+        """
+        武器レベルを武器番号順(ボム、レーザー、ミサイル、銃、剣)のリストで返す
+        """
+        return [self.bomb_level, self.laser_level, self.mssl_level, self.gun_level, self.swrd_level]
+
     def bomb_act(self, tmr: int, bb_wep: pg.sprite.Group, bb_effect: pg.sprite.Group, bird: "Bird") -> tuple[pg.sprite.Group, pg.sprite.Group]:
         """
         ボムの挙動を扱うメゾッド
@@ -932,30 +2395,18 @@ class Weapon_Control:
         for bb in bb_wep:
             #爆弾エフェクト発生
             if bb.cnt == 1: 
-                if self.bomb_level < 4:
-                    #レベル2以上4未満の場合はボム座標の周囲に追撃爆破を発生させる
-                    #(レベル-1)*2個分追撃を発生させる
-                    for i in range(self.bomb_level - 1):
-                        bb_effect.add(Explosion(bb, 100, True, True, (i, i)))
-                        bb_effect.add(Explosion(bb, 100, True, True, (i, i)))
-
-                else:
-                    #レベルが4以上ならボム座標から横軸に爆発エフェクトを発生させる
-                    for i in range(10):
-                        bb_effect.add(Explosion(bb, 100, True, True, (i * 10, 0)))
-                        bb_effect.add(Explosion(bb, 100, True, True, (i * -10, 0)))
-                
-                if self.bomb_level >= 5:
-                    #レベルが5以上ならボム座標から縦軸にも爆発エフェクトを発生させる
-                    for i in range(10):
-                        bb_effect.add(Explosion(bb, 100, True, True, (0, i * 10)))
-                        bb_effect.add(Explosion(bb, 100, True, True, (0, i * -10)))
-
-                #メイン爆破エフェクト
-                bb_effect.add(Explosion(bb, 100, True)) #攻撃判定エフェクトの追加
-                self.exp_se.play()
+                self.detonate(bb, bb_effect)
         
         return bb_wep, bb_effect
+
+    def detonate(self, bb: "Bomb_Weapon", bb_effect: pg.sprite.Group) -> None:
+        """
+        ボムを爆発させ、今のボムレベルの攻撃範囲(BombBlast)を追加する
+        引数1 : 爆発させるBomb_Weaponインスタンス
+        引数2 : 攻撃用爆発エフェクトのBlastGroup
+        """
+        bb_effect.add(BombBlast(bb.rect.center, self.bomb_level))
+        self.exp_se.play()
     
     def laser_act(self, tmr: int, lsr_wep: pg.sprite.Group, bird: "Bird") -> pg.sprite.Group:
         """
@@ -969,14 +2420,14 @@ class Weapon_Control:
             self.laser_power -= 1
 
             if self.laser_power > 80 - (self.laser_level - 1) * 20: #射出上限（レベルで緩和）
-                lsr_wep.add(Laser_Weapon(bird, self.laser_level)) #レーザー武器追加
+                lsr_wep.add(Laser_Weapon.spawn(bird, self.laser_level)) #レーザー武器追加
 
                 if self.laser_level >= 4:
-                    lsr_wep.add(Laser_Weapon(bird, self.laser_level, True))
+                    lsr_wep.add(Laser_Weapon.spawn(bird, self.laser_level, True))
 
                 if self.laser_level == 5:
-                    lsr_wep.add(Laser_Weapon(bird, self.laser_level, False, True))
-                    lsr_wep.add(Laser_Weapon(bird, self.laser_level, True, True))
+                    lsr_wep.add(Laser_Weapon.spawn(bird, self.laser_level, False, True))
+                    lsr_wep.add(Laser_Weapon.spawn(bird, self.laser_level, True, True))
 
                 self.laser_se.play()
                 
@@ -986,20 +2437,26 @@ class Weapon_Control:
             
         return lsr_wep
 
-    def mssl_act(self, tmr: int, mssl_wep: pg.sprite.Group, bird: "Bird", emys: pg.sprite.Group) -> pg.sprite.Group:
+    def mssl_act(self, tmr: int, mssl_wep: pg.sprite.Group, bird: "Bird", emys: pg.sprite.Group,
+                 grid: SpatialHash | None = None) -> pg.sprite.Group:
         """
         追撃ミサイルの挙動を扱うメゾッド
         引数1 : main用の整数カウンタ
         引数2 : ミサイルのsprite.Group
         引数3 : Birdクラスのインスタンス
         引数4 : 敵を格納するsprite.Group
+        引数5 : 敵の当たり判定用グリッド（homingが"nearest"のとき近い敵を狙う）
         戻り値 : ミサイルのsprite.Group
         """
         if tmr % (100 - (self.mssl_level - 1) * 10) == 0: #クールタイム（レベルで緩和）
-            mssl_wep.add(Missile_Weapon(bird, emys)) #ミサイル武器追加
-            #(レベル-1)分、ミサイルを追加する
-            for _ in range(self.mssl_level - 1):
-                mssl_wep.add(Missile_Weapon(bird, emys)) #ミサイル武器追加
+            #nearestなら鳥に近い順の敵に1発ずつ割り振る
+            targets = []
+            if Missile_Weapon.homing == "nearest" and grid is not None:
+                targets = grid.k_nearest(bird.rect.center, self.mssl_level)
+            #レベル分、ミサイルを追加する
+            for i in range(self.mssl_level):
+                target = targets[i % len(targets)] if targets else None
+                mssl_wep.add(Missile_Weapon.spawn(bird, emys, target)) #ミサイル武器追加
                 
             self.mssl_se.play()
     
@@ -1016,25 +2473,25 @@ class Weapon_Control:
         if tmr % 5 == 0:
             #連続弾追加
             if self.gun_level == 1: #レベル1の場合は一列
-                gun_wep.add(Gun_Weapon(bird, 0, self.gun_level))
+                gun_wep.add(Gun_Weapon.spawn(bird, 0, self.gun_level))
             elif self.gun_level == 2: #レベル2の場合は二列
-                gun_wep.add(Gun_Weapon(bird, 10, self.gun_level))
-                gun_wep.add(Gun_Weapon(bird, -10, self.gun_level))
+                gun_wep.add(Gun_Weapon.spawn(bird, 10, self.gun_level))
+                gun_wep.add(Gun_Weapon.spawn(bird, -10, self.gun_level))
             elif self.gun_level == 3: #レベル3の場合は三列
-                gun_wep.add(Gun_Weapon(bird, 15, self.gun_level))
-                gun_wep.add(Gun_Weapon(bird, 0, self.gun_level))
-                gun_wep.add(Gun_Weapon(bird, -15, self.gun_level))    
+                gun_wep.add(Gun_Weapon.spawn(bird, 15, self.gun_level))
+                gun_wep.add(Gun_Weapon.spawn(bird, 0, self.gun_level))
+                gun_wep.add(Gun_Weapon.spawn(bird, -15, self.gun_level))    
             elif self.gun_level == 4: #レベル4の場合は四列
-                gun_wep.add(Gun_Weapon(bird, 30, self.gun_level))
-                gun_wep.add(Gun_Weapon(bird, 10, self.gun_level))
-                gun_wep.add(Gun_Weapon(bird, -10, self.gun_level))
-                gun_wep.add(Gun_Weapon(bird, -30, self.gun_level))
+                gun_wep.add(Gun_Weapon.spawn(bird, 30, self.gun_level))
+                gun_wep.add(Gun_Weapon.spawn(bird, 10, self.gun_level))
+                gun_wep.add(Gun_Weapon.spawn(bird, -10, self.gun_level))
+                gun_wep.add(Gun_Weapon.spawn(bird, -30, self.gun_level))
             elif self.gun_level == 5: #レベル5の場合は五列
-                gun_wep.add(Gun_Weapon(bird, 30, self.gun_level))
-                gun_wep.add(Gun_Weapon(bird, 15, self.gun_level))
-                gun_wep.add(Gun_Weapon(bird, 0, self.gun_level))
-                gun_wep.add(Gun_Weapon(bird, -15, self.gun_level))
-                gun_wep.add(Gun_Weapon(bird, -30, self.gun_level))
+                gun_wep.add(Gun_Weapon.spawn(bird, 30, self.gun_level))
+                gun_wep.add(Gun_Weapon.spawn(bird, 15, self.gun_level))
+                gun_wep.add(Gun_Weapon.spawn(bird, 0, self.gun_level))
+                gun_wep.add(Gun_Weapon.spawn(bird, -15, self.gun_level))
+                gun_wep.add(Gun_Weapon.spawn(bird, -30, self.gun_level))
 
             self.gun_se.play()
             
@@ -1106,10 +2563,43 @@ class Weapon_Control:
     
 
 # 敵に関するクラス群
-class Enemy(pg.sprite.Sprite):
+class EnemyStats:
+    """
+    敵1体ごとのステータス（HP, 速さ, 攻撃力）
+    Waveごとの元の値（Enemy.waves）は全ての敵で共有するtupleなので、ダメージはこちらにだけ書き込む
+    """
+    __slots__ = ("hp", "speed", "attack")
+
+    def __init__(self, hp: int, speed: float, attack: int):
+        """
+        引数1：HP
+        引数2：1フレームに進む速さ
+        引数3：こうかとんにぶつかったときに減らすHP
+        """
+        self.hp = hp
+        self.speed = speed
+        self.attack = attack
+
+
+class Enemy(CompactSprite):
     """
     Enemy の Docstring
     """
+    __slots__ = ("base_image", "stats", "pos", "dmg_eff_time")
+    vectorized = True #EnemySwarmで一括移動できるか
+    img_paths = {0: "fig/report.png", 1: "fig/clock.png", 2: "fig/ai.png", 3: "fig/guard.png", 4: "fig/teacher.png"}
+    img_scale = 0.1 #画像の倍率
+    flash_time = 6 #被弾時に赤く点滅するフレーム数
+    collide_mode = "rect" #当たり判定の形（"rect"：矩形、"circle"：円、"mask"：画像の不透明部分）
+    #Waveごとの (HP, 速さ, 攻撃力)（全ての敵で共有するので書き換えられないtupleにする）
+    waves = ((20, 2, 1), (50, 3, 1), (180, 4, 1), (260, 5, 1), (310, 6, 1))
+
+    @classmethod
+    def preload_tints(cls) -> None:
+        """
+        全Waveの敵画像について、被弾時の赤い画像を作っておく
+        """
+        hit_tints.preload(assets.image(path, cls.img_scale) for path in cls.img_paths.values())
 
     def __init__(self, lv: int):
         """
@@ -1119,39 +2609,47 @@ class Enemy(pg.sprite.Sprite):
 
         wave = lv // 3
         if lv >= 15:wave = 4
-        enemy_fid_dic = {0: "fig/report.png", 1: "fig/clock.png", 2: "fig/ai.png", 3: "fig/guard.png", 4: "fig/teacher.png"}
-        #HP, spd
-        enemy_stats = [
-            [20,2], 
-            [50,3], 
-            [180,4],
-            [260,5],
-            [310,6]
-        ]
-        self.image = pg.transform.rotozoom(pg.image.load(enemy_fid_dic[wave]), 0, 0.1)
+        self.base_image = assets.image(__class__.img_paths[wave], __class__.img_scale)
+        self.image = self.base_image
         self.rect = self.image.get_rect()
-        #HP,attack,defense,speed
-        self.stats = enemy_stats[int(wave)]
-        if random.choice([True, False]):
-            self.rect.centerx = random.choice([0, width])
-            self.rect.centery = random.randint(0, height)
+        #HP, 速さ, 攻撃力（1体ごとに持つ）
+        self.stats = EnemyStats(*__class__.waves[int(wave)])
+        if rng.choice([True, False]):
+            self.rect.centerx = rng.choice([0, width])
+            self.rect.centery = rng.randint(0, height)
         else:
-            self.rect.centerx = random.randint(0, width)
-            self.rect.centery = random.choice([0, height])
+            self.rect.centerx = rng.randint(0, width)
+            self.rect.centery = rng.choice([0, height])
 
         self.pos = pg.Vector2(self.rect.center)
-        self.speed = self.stats[1]
         
-        self.dmg_eff_time = 0
+        self.dmg_eff_time = 0 #被弾エフェクトの残りフレーム数
+
+    def flash(self) -> None:
+        """
+        被弾エフェクトを始める（作り置きの赤い画像に切り替える）
+        """
+        self.dmg_eff_time = self.flash_time
+        self.image = hit_tints.get(self.base_image)
+
+    def tick_flash(self) -> None:
+        """
+        被弾エフェクトを1フレーム進め、終わったら元の画像に戻す
+        """
+        self.dmg_eff_time -= 1
+        if self.dmg_eff_time <= 0:
+            self.image = self.base_image
 
     def update(self, bird_pos):
         target_vector = pg.math.Vector2(bird_pos)
         direction = target_vector - self.pos
 
         if direction.length() != 0:
-            velocity  = direction.normalize() * self.speed
+            velocity  = direction.normalize() * self.stats.speed
             self.pos += velocity
         self.rect.center = self.pos
+        if self.dmg_eff_time > 0:
+            self.tick_flash()
 
 
 class LastBoss(Enemy):
@@ -1160,32 +2658,244 @@ class LastBoss(Enemy):
     ラスボスに関するクラス
     画面を埋め尽くす巨大な敵で、上から徐々に降りてくる
     """
+    __slots__ = ()
+    vectorized = False #独自の動きをするので一括移動しない
+    img_scale = 2.5 #画像の倍率
+    collide_mode = "mask" #透明な余白が大きいので画像の形で判定する
+
     def __init__(self):
         super().__init__(15)  # レベル設定（画像決定用、中身は何でも良い）
 
         # 画面を埋め尽くすサイズに画像を拡大 (元の画像を2倍にするなど)
-        original_img = pg.image.load(f"fig/fantasy_maou_devil.png")
-        self.image = pg.transform.rotozoom(original_img, 0, 2.5)
-        self.stats = [1000000000000000,1]  # HP, speed
+        self.image = self.base_image = assets.image("fig/fantasy_maou_devil.png", __class__.img_scale)
+        self.stats = EnemyStats(1000000000000000, 1, 1)  # HP, 速さ（じりじりと襲ってくる低速）, 攻撃力
 
         self.rect = self.image.get_rect()
         self.rect.centerx = width / 2  # 横位置は画面中央
         self.rect.bottom = 0           # 初期位置は画面の上外
 
         self.pos = pg.Vector2(self.rect.center)
-        self.speed = 1  # じりじりと襲ってくる（低速）
 
     def update(self, bird_pos):
         """
         こうかとんの位置に関係なく、じりじりと下に降りてくる
         """
-        self.pos.y += self.speed
+        self.pos.y += self.stats.speed
         self.rect.centery = int(self.pos.y)
 
         # 画面下まで来たら止まる（あるいはゲームオーバー判定など）
         if self.rect.top > height:
             self.rect.top = height  # とりあえず止める処理
 
+
+class SwarmStats:
+    """
+    EnemySwarmの配列に置かれた敵のHPと速さを
+    EnemyStats と同じ emy.stats.hp -= dmg の書き方で読み書きするためのクラス
+    """
+    __slots__ = ("swarm", "slot", "attack")
+
+    def __init__(self, swarm: "EnemySwarm", slot: int, attack: int):
+        """
+        引数1：配列を持つEnemySwarm
+        引数2：敵の配列上の整数位置
+        引数3：攻撃力（配列には置かない）
+        """
+        self.swarm = swarm
+        self.slot = slot
+        self.attack = attack
+
+    @property
+    def hp(self) -> int:
+        return self.swarm.hp[self.slot].item()
+
+    @hp.setter
+    def hp(self, value: int) -> None:
+        self.swarm.hp[self.slot] = value
+
+    @property
+    def speed(self) -> float:
+        return self.swarm.speed[self.slot].item()
+
+    @speed.setter
+    def speed(self, value: float) -> None:
+        self.swarm.speed[self.slot] = value
+
+
+class EnemySwarm(SpriteGroup):
+    """
+    敵の位置・速度・HPをNumPy配列でまとめて持つsprite.Group（NumPyが必要）
+    update() で全ての敵を一度の配列演算でこうかとんの方へ進め、Rectに書き戻す
+    描画や当たり判定は通常のGroupと同じようにRectを使える
+    """
+    def __init__(self, capacity: int = 256):
+        """
+        初期化処理
+        引数：最初に確保する敵の数（足りなくなったら倍に増やす）
+        """
+        super().__init__()
+        self.pos = np.zeros((capacity, 2)) #中心座標(x, y)
+        self.speed = np.zeros(capacity) #速さ（空き枠は0）
+        self.hp = np.zeros(capacity, dtype=np.int64) #HP
+        self.slots: dict[pg.sprite.Sprite, int] = {} #敵 -> 配列上の位置
+        self.others: dict[pg.sprite.Sprite, None] = {} #一括移動しない敵（ラスボスなど）
+        self.free: list[int] = [] #空いている位置
+        self.used = 0 #一度でも使った位置の数
+
+    def _grow(self) -> None:
+        """
+        配列の容量を2倍にする
+        """
+        cap = len(self.speed) * 2
+        for name in ("pos", "speed", "hp"):
+            old = getattr(self, name)
+            new = np.zeros((cap,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        if not getattr(sprite, "vectorized", False):
+            self.others[sprite] = None
+            return
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.used == len(self.speed):
+                self._grow()
+            slot = self.used
+            self.used += 1
+        self.pos[slot] = sprite.pos
+        self.speed[slot] = sprite.stats.speed
+        self.hp[slot] = sprite.stats.hp
+        sprite.stats = SwarmStats(self, slot, sprite.stats.attack) #HPの読み書きを配列に向ける
+        self.slots[sprite] = slot
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.others.pop(sprite, None)
+        slot = self.slots.pop(sprite, None)
+        if slot is None:
+            return
+        #グループから外れた敵には通常のステータスを戻す
+        sprite.stats = EnemyStats(self.hp[slot].item(), self.speed[slot].item(), sprite.stats.attack)
+        sprite.pos = pg.Vector2(self.pos[slot].tolist())
+        self.speed[slot] = 0
+        self.free.append(slot)
+
+    def update(self, bird_pos) -> None:
+        """
+        全ての敵をこうかとんの方向へ速さ分だけ進める
+        Enemy.update と同じ計算（正規化した方向×速さ）を配列でまとめて行う
+        引数：こうかとんの中心座標
+        """
+        n = self.used
+        if n:
+            pos = self.pos[:n]
+            d = np.asarray(bird_pos, dtype=float) - pos
+            dist = np.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1])
+            moving = dist != 0
+            step = np.divide(d, dist[:, None], out=np.zeros_like(d), where=moving[:, None])
+            pos += step * self.speed[:n, None]
+            centers = pos.tolist()
+            for sprite, slot in self.slots.items():
+                sprite.rect.center = centers[slot]
+                if sprite.dmg_eff_time > 0:
+                    sprite.tick_flash()
+
+        #ラスボスなど一括移動しない敵は個別に動かす
+        for sprite in list(self.others):
+            sprite.update(bird_pos)
+
+
+class ProjectileSwarm(SpriteGroup):
+    """
+    まっすぐ飛ぶ弾（連続弾・レーザー）の位置と速度をNumPy配列でまとめて持つsprite.Group（NumPyが必要）
+    update() で全ての弾を一度の配列演算で進め、画面外に出た弾をまとめて消す
+    描画や当たり判定は通常のGroupと同じようにRectを使える
+    """
+    def __init__(self, capacity: int = 256):
+        """
+        初期化処理
+        引数：最初に確保する弾の数（足りなくなったら倍に増やす）
+        """
+        super().__init__()
+        self.pos = np.zeros((capacity, 2), dtype=np.int64) #Rectの左上(x, y)
+        self.vel = np.zeros((capacity, 2), dtype=np.int64) #1フレームの移動量（空き枠は0）
+        self.size = np.zeros((capacity, 2), dtype=np.int64) #Rectの幅と高さ
+        self.active = np.zeros(capacity, dtype=bool) #使っている位置か
+        self.owners: list[pg.sprite.Sprite | None] = [None] * capacity #位置 -> 弾
+        self.slots: dict[pg.sprite.Sprite, int] = {} #弾 -> 配列上の位置
+        self.others: dict[pg.sprite.Sprite, None] = {} #まっすぐ飛ばない弾
+        self.free: list[int] = [] #空いている位置
+        self.used = 0 #一度でも使った位置の数
+
+    def _grow(self) -> None:
+        """
+        配列の容量を2倍にする
+        """
+        cap = len(self.active) * 2
+        for name in ("pos", "vel", "size", "active"):
+            old = getattr(self, name)
+            new = np.zeros((cap,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        self.owners.extend([None] * (cap - len(self.owners)))
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        if not getattr(sprite, "linear", False):
+            self.others[sprite] = None
+            return
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.used == len(self.active):
+                self._grow()
+            slot = self.used
+            self.used += 1
+        rect = sprite.rect
+        self.pos[slot] = rect.topleft
+        #move_ipは小数の移動量を0方向に切り捨てるので、整数の移動量にしておく
+        self.vel[slot] = (int(sprite.speed * sprite.vx), int(sprite.speed * sprite.vy))
+        self.size[slot] = rect.size
+        self.active[slot] = True
+        self.owners[slot] = sprite
+        self.slots[sprite] = slot
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.others.pop(sprite, None)
+        slot = self.slots.pop(sprite, None)
+        if slot is None:
+            return
+        self.vel[slot] = 0
+        self.active[slot] = False
+        self.owners[slot] = None
+        self.free.append(slot)
+
+    def update(self) -> None:
+        """
+        全ての弾を移動量だけ進め、画面外に出た弾を消す
+        Gun_Weapon.update / Laser_Weapon.update と同じ計算（move_ipとcheck_bound）を配列でまとめて行う
+        """
+        n = self.used
+        if n:
+            pos = self.pos[:n]
+            pos += self.vel[:n]
+            far = pos + self.size[:n]
+            out = self.active[:n] & ((pos[:, 0] < 0) | (far[:, 0] > width) | (pos[:, 1] < 0) | (far[:, 1] > height))
+            topleft = pos.tolist()
+            for sprite, slot in self.slots.items():
+                sprite.rect.topleft = topleft[slot]
+            #画面外への移動で削除
+            owners = self.owners
+            for slot in np.flatnonzero(out).tolist():
+                owners[slot].kill()
+
+        for sprite in list(self.others):
+            sprite.update()
+
 # 武器の選択に関する処理クラス
 class Weapon_select:
     """
@@ -1257,283 +2967,2148 @@ class Weapon_select:
         elif weapon_index == 4:
             self.weap_ctrl.swrd_level = new_level
 
-def main():
-    global width, height #画面幅、画面高さのグローバル変数を呼び出す
+#起動時に読み込んでおく変換済み画像（AssetRegistry.image の引数）
+PRELOAD_IMAGES = [
+    *((f"fig/{num}.png", Bird.img_scale) for num in (3, 8)),
+    *((path, Enemy.img_scale) for path in Enemy.img_paths.values()),
+    ("fig/fantasy_maou_devil.png", LastBoss.img_scale),
+    ("fig/bomb.png", None, Bomb_Weapon.img_size),
+    ("fig/laser.png", None, (200, 200)),
+    ("fig/missile.png", None, (100, 50)),
+    ("fig/bullet.png", None, (20, 20)),
+    ("fig/sword.png", None, (100, 100)),
+    ("fig/2.png", 1.0),
+    ("fig/serihu_pass_icon.png", 0.06, None, 30),
+]
 
-    screen = pg.display.set_mode((width, height), pg.FULLSCREEN)
-    width, height = screen.get_size()
-    
-    #背景写真
-    bg_img = pg.image.load(f"fig/back_ground.png")
-    bg_img = pg.transform.scale(bg_img, (width, height))
-
-    #爆発効果音
-    exp_se = pg.mixer.Sound("sound/bb_effct.wav")
-    exp_se.set_volume(0.2)
-
-    score = Score()
-    start_screen = Starting()
-    level_up_selector = LevelUpSelector()  # レベルアップ選択画面
-    mode = "start"  # "start" or "play"
-    level_up_mode = None  # None: 通常, "selecting": 武器選択中
-
-    bird = Bird(3, (900, 400))
-    hpbar = Hpbar(bird)
-    
-    weap_ctrl = Weapon_Control()
-    weapon_selector = Weapon_select(bird, weap_ctrl)  # 武器選択システムを初期化
-
-    bb_wep = pg.sprite.Group() #ボムの武器のグループ
-    bb_effect = pg.sprite.Group() #ボム演出後の攻撃用エフェクトグループ
-    lsr_wep = pg.sprite.Group() #レーザー武器のグループ
-    mssl_wep = pg.sprite.Group() #ミサイル武器のグループ
-    gun_wep = pg.sprite.Group() #連続弾武器のグループ
-    swrd_wep = pg.sprite.Group() #周回軌道武器のグループ
-    exps = pg.sprite.Group() #敵爆破演出のグループ
-    gravity = pg.sprite.Group() #ボス出現演出用のグループ
-    emys = pg.sprite.Group() #敵本体のグループ
-    
-    tmr = 0
 
-    clock = pg.time.Clock()
-    
-    ending = False #ラストフェーズかのフラグ
-    boss_flag = False #ボスは既に出現したかのフラグ
-
-    #武器の設定
-    bird.set_item(1,"Bomb",1,1)
-    bird.set_item(2,"Laser",1,1)
-    bird.set_item(3,"Missile",1,1)
-    bird.set_item(4,"Gun",1,1)
-    bird.set_item(5,"Sword",1,1)
-
-    while True:
-        key_lst = pg.key.get_pressed()
-        for event in pg.event.get():
-            if event.type == pg.QUIT:
-                return 0
-            if event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE:
-                return 0
-
-            # 武器選択画面用のイベント処理
-            if level_up_mode == "selecting":
-                if event.type == pg.KEYDOWN:
-                    if event.key == pg.K_1 and weap_ctrl.bomb_level < 5:
-                        weapon_selector.select_weapon(0)  # ボム
-                        level_up_mode = None
-                    elif event.key == pg.K_2 and weap_ctrl.laser_level < 5:
-                        weapon_selector.select_weapon(1)  # レーザー
-                        level_up_mode = None
-                    elif event.key == pg.K_3 and weap_ctrl.mssl_level < 5:
-                        weapon_selector.select_weapon(2) # ミサイル
-                        level_up_mode = None
-                    elif event.key == pg.K_4 and weap_ctrl.gun_level < 5:
-                        weapon_selector.select_weapon(3) # 銃
-                        level_up_mode = None
-                    elif event.key == pg.K_5 and weap_ctrl.swrd_level < 5:
-                        weapon_selector.select_weapon(4)  # 剣
-                        level_up_mode = None
-                continue
+#1フレームの処理の区切り（PhaseTimerで計測する単位）
+PHASES = ("spawn", "weapons", "collision", "update", "missile", "draw", "hud", "overlay", "flip")
 
-            # スタート画面用のイベント処理　enterかspacekeyで決定
-            if mode == "start":
-                if event.type == pg.KEYDOWN:
-                    if event.key == pg.K_UP:
-                        start_screen.selected = max(0, start_screen.selected - 1)
-                    elif event.key == pg.K_DOWN:
-                        start_screen.selected = min(len(start_screen.options) - 1, start_screen.selected + 1)
-                    elif event.key == pg.K_RETURN or event.key == pg.K_SPACE:
-                        if start_screen.selected == 0:
-                            mode = "play"
-                        else:
-                            return 0
-                continue
 
-        screen.blit(bg_img, [0, 0]) #背景描画
+class PhaseTimer:
+    """
+    フレーム内の処理ごとの経過時間を記録するクラス
+    samples[処理名] に1フレームごとの秒数が入る（"total"はフレーム全体）
+    同じフレームで同じ処理名を何度lap()しても合計が1つの値になる
+    """
+    def __init__(self, keep: int | None = None):
+        """
+        引数：保持するフレーム数（Noneなら全フレーム）
+        """
+        self.samples: dict[str, deque[float]] = {name: deque(maxlen=keep) for name in PHASES + ("total",)}
+        self.frame: dict[str, float] = {} #計測中のフレームの処理ごとの秒数
+        self.running = False
+        self.t0 = 0.0
+        self.last = 0.0
 
-        # 武器選択画面を表示している場合はゲーム処理をスキップ
-        if level_up_mode == "selecting":
-            level_up_selector.update(screen, bird)  # birdパラメータを渡して武器レベルをチェック
-            pg.display.update()
-            clock.tick(50)
-            continue
+    def start(self) -> None:
+        """
+        フレームの計測を始める
+        """
+        self.frame.clear()
+        self.running = True
+        self.t0 = self.last = time.perf_counter()
 
-        # スタート画面を表示している場合はゲーム処理をスキップ
-        if mode == "start":
-            start_screen.update(screen)
-            pg.display.update()
-            tmr += 1
-            clock.tick(50)
-            continue
+    def lap(self, phase: str) -> None:
+        """
+        前回のlap()からの経過時間を処理名に加える（計測中でなければ何もしない）
+        引数：PHASESの処理名
+        """
+        if not self.running:
+            return
+        now = time.perf_counter()
+        self.frame[phase] = self.frame.get(phase, 0.0) + now - self.last
+        self.last = now
 
-        if tmr % 20 == 0 and not ending:  # 200フレームに1回，敵機を出現させる
-            emys.add(Enemy(score.value // 10))
+    def stop(self) -> bool:
+        """
+        フレームの計測を終えて記録する
+        戻り値：記録したならTrue（start()していなければFalse）
+        """
+        if not self.running:
+            return False
+        self.running = False
+        for phase, sec in self.frame.items():
+            self.samples[phase].append(sec)
+        self.samples["total"].append(self.last - self.t0)
+        return True
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """
+        処理ごとの平均・p95・p99・最大をミリ秒で返す
+        """
+        out = {}
+        for name, values in self.samples.items():
+            ms = sorted(v * 1000 for v in values)
+            if not ms:
+                continue
+            out[name] = {
+                "mean_ms": sum(ms) / len(ms),
+                "p95_ms": percentile(ms, 95),
+                "p99_ms": percentile(ms, 99),
+                "max_ms": ms[-1],
+            }
+        return out
 
-        #武器処理
-        bb_wep, bb_effect = weap_ctrl.bomb_act(tmr, bb_wep, bb_effect, bird)
-        lsr_wep = weap_ctrl.laser_act(tmr, lsr_wep, bird)
-        mssl_wep = weap_ctrl.mssl_act(tmr, mssl_wep, bird, emys)
-        gun_wep = weap_ctrl.gun_act(tmr, gun_wep, bird)
-        swrd_wep = weap_ctrl.swrd_act(swrd_wep, bird)
 
-        #ボム衝突イベント
-        #敵との衝突（Weapon_Control.bomb_actと同様の処理）
-        for emy, bb_mine in pg.sprite.groupcollide(emys, bb_wep, False, True).items():
-            for bb in bb_mine:
-                if weap_ctrl.bomb_level < 4:
-                    for i in range(weap_ctrl.bomb_level - 1):
-                        bb_effect.add(Explosion(bb, 100, True, True, (i, i)))
-                        bb_effect.add(Explosion(bb, 100, True, True, (i, i)))
-                
-                else:
-                    for i in range(10):
-                        bb_effect.add(Explosion(bb, 100, True, True, (i * 10, 0)))
-                        bb_effect.add(Explosion(bb, 100, True, True, (i * -10, 0)))
-                        
-                if weap_ctrl.bomb_level >= 5:
-                    for i in range(10):
-                        bb_effect.add(Explosion(bb, 100, True, True, (0, i * 10)))
-                        bb_effect.add(Explosion(bb, 100, True, True, (0, i * -10)))
-                
-                bb_effect.add(Explosion(bb, 100, True)) #攻撃判定エフェクトの追加
-                weap_ctrl.exp_se.play()
+def percentile(sorted_values: list[float], q: float) -> float:
+    """
+    昇順に並んだ値の q パーセンタイルを最近順位法で返す関数
+    """
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
 
-                exp_se.play()
 
-        #敵×武器衝突イベント
-        if not ending: #もし、エンディングじゃないなら
-            #爆発エフェクト
-            hits = pg.sprite.groupcollide(emys, bb_effect, False, False)  # dict: {emy: [effect,...]}
-            for emy, eff_list in hits.items():
-                # 当たっている爆風(複数あり得る)のatk合計だけ減らす
-                dmg = sum(eff.atk for eff in eff_list)
-                emy.stats[0] -= dmg
-
-                if emy.stats[0] <= 0:
-                    exps.add(Explosion(emy, 100))
-                    emy.kill()
-                    score.value += 1
-                    
-            #レーザー
-            hits = pg.sprite.groupcollide(emys, lsr_wep, False, False)  # dict: {emy: [laser,...]}
-            for emy, lasers in hits.items():
-                dmg = sum(l.atk for l in lasers)
-                emy.stats[0] -= dmg
-
-                if emy.stats[0] <= 0:
-                    exps.add(Explosion(emy, 100))
-                    emy.kill()
-                    score.value += 1
-                    
-            #追尾ミサイル
-            hits = pg.sprite.groupcollide(emys, mssl_wep, False, True)  # dict: {emy: [missile,...]}
-            for emy, missiles in hits.items():
-                dmg = sum(m.atk for m in missiles)
-                emy.stats[0] -= dmg
-
-                if emy.stats[0] <= 0:
-                    exps.add(Explosion(emy, 100))
-                    emy.kill()
-                    score.value += 1
-
-            #連続弾
-            hits = pg.sprite.groupcollide(emys, gun_wep, False, True)  # dict: {emy: [bullet,...]}
-            for emy, bullets in hits.items():
-                dmg = sum(b.atk for b in bullets)
-                emy.stats[0] -= dmg
-
-                if emy.stats[0] <= 0:
-                    exps.add(Explosion(emy, 100))
-                    emy.kill()
-                    score.value += 1
-
-            #剣
-            hits = pg.sprite.groupcollide(emys, swrd_wep, False, False)  # dict: {emy: [sword,...]}
-            for emy, swords in hits.items():
-                dmg = sum(s.atk for s in swords)
-                emy.stats[0] -= dmg
-
-                if emy.stats[0] <= 0:
-                    exps.add(Explosion(emy, 100))
-                    emy.kill()
-                    score.value += 1
+class FrameProfiler:
+    """
+    ゲーム中の処理ごとの時間とグループごとのスプライト数を記録するクラス
+    F3キーで画面左上に表示し、CSV(毎フレーム)やJSON(直近の集計)に書き出せる
+    表示も書き出しもしないときは Game.timer を None にして計測しない
+    """
+    def __init__(self, window: int = 300, csv_path: str | None = None, json_path: str | None = None,
+                 dump_every: int = 250):
+        """
+        初期化処理
+        引数1：集計に使う直近のフレーム数（初期値300）
+        引数2：毎フレームの記録を追記するCSVファイル（Noneなら書かない）
+        引数3：直近の集計を上書きするJSONファイル（Noneなら書かない）
+        引数4：JSONとCSVを書き出す間隔のフレーム数（初期値250）
+        """
+        self.timer = PhaseTimer(window)
+        self.overlay = False #画面に表示するか
+        self.json_path = json_path
+        self.dump_every = dump_every
+        self.frames = 0
+        self.counts: dict[str, int] = {}
+        self.font: pg.font.Font | None = None
+
+        self.csv_file = None
+        self.csv_writer = None
+        if csv_path:
+            self.csv_file = open(csv_path, "w", newline="", encoding="utf-8")
+            self.csv_writer = csv.writer(self.csv_file)
+            self.csv_writer.writerow(["frame", "tmr", *(f"{p}_ms" for p in PHASES), "total_ms", *Game.COUNT_GROUPS])
+
+    def active(self) -> bool:
+        """
+        計測が必要か（表示中か書き出し先があるか）を返す
+        """
+        return self.overlay or self.csv_writer is not None or self.json_path is not None
+
+    def attach(self, game: "Game") -> None:
+        """
+        計測が必要なときだけGameにタイマーを渡す
+        引数：計測するGameインスタンス
+        """
+        game.timer = self.timer if self.active() else None
+
+    def toggle_overlay(self, game: "Game") -> None:
+        """
+        画面表示を切り替える（F3キー）
+        引数：計測するGameインスタンス
+        """
+        self.overlay = not self.overlay
+        self.attach(game)
+
+    def end_frame(self, game: "Game") -> None:
+        """
+        1フレームの計測を終えて記録・書き出しを行う
+        引数：計測したGameインスタンス
+        """
+        timer = self.timer
+        frame = dict(timer.frame)
+        if not timer.stop():
+            return
+        self.frames += 1
+        self.counts = game.sprite_counts()
+        if self.csv_writer is not None:
+            self.csv_writer.writerow([
+                self.frames, game.tmr,
+                *(f"{frame.get(p, 0.0) * 1000:.4f}" for p in PHASES),
+                f"{timer.samples['total'][-1] * 1000:.4f}",
+                *self.counts.values(),
+            ])
+        if self.frames % self.dump_every == 0:
+            self.dump()
+
+    def dump(self) -> None:
+        """
+        CSVを書き出し、直近の集計をJSONファイルに上書きする
+        """
+        if self.csv_file is not None:
+            self.csv_file.flush()
+        if self.json_path:
+            report = {"frames": self.frames, "window": len(self.timer.samples["total"]),
+                      "phases": self.timer.summary(), "sprites": self.counts, "pools": pool_stats()}
+            with open(self.json_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+
+    def draw(self, screen: pg.Surface) -> None:
+        """
+        直近の処理時間の平均とスプライト数を画面左上に表示する
+        引数：画面Surface
+        """
+        if not self.overlay:
+            return
+        if self.font is None:
+            self.font = assets.font(None, 22)
+        summary = self.timer.summary()
+        total = summary.get("total", {}).get("mean_ms", 0.0)
+        lines = [f"frame {total:6.2f} ms  ({1000 / total if total else 0:5.1f} fps max)"]
+        for phase in PHASES:
+            if phase in summary:
+                st = summary[phase]
+                lines.append(f"{phase:<10}{st['mean_ms']:7.3f} ms  p95 {st['p95_ms']:7.3f}")
+        lines.append("  ".join(f"{k}:{v}" for k, v in self.counts.items()))
+
+        y = 60
+        for line in lines:
+            surf = self.font.render(line, True, (255, 255, 0), (0, 0, 0))
+            screen.blit(surf, (20, y))
+            y += surf.get_height()
+        self.timer.lap("overlay")
+
+    def close(self) -> None:
+        """
+        残りを書き出してファイルを閉じる
+        """
+        self.dump()
+        if self.csv_file is not None:
+            self.csv_file.close()
+            self.csv_file = self.csv_writer = None
+
+
+def make_profiler(args: argparse.Namespace) -> FrameProfiler:
+    """
+    コマンドライン引数からFrameProfilerを作る関数
+    """
+    csv_path = os.path.join(launch_dir, args.profile_csv) if args.profile_csv else None
+    json_path = os.path.join(launch_dir, args.profile_json) if args.profile_json else None
+    profiler = FrameProfiler(csv_path=csv_path, json_path=json_path)
+    profiler.overlay = getattr(args, "profile", False)
+    return profiler
+
+
+class DirtyRenderer:
+    """
+    前のフレームとの差分だけを描き直す描画クラス
+    前のフレームでスプライトやHUDを描いた範囲だけ背景を戻し、変わった範囲だけを画面に送る
+    重力フィールドのような全画面の演出中や、差分が多すぎるときは画面全体を描き直す
+    """
+    def __init__(self, max_rects: int = 400, max_area: float = 0.5):
+        """
+        初期化処理
+        引数1：差分の範囲がこの数を超えたら全体を描き直す（初期値400）
+        引数2：差分の面積が画面のこの割合を超えたら画面全体を更新する（初期値0.5）
+        """
+        self.max_rects = max_rects
+        self.max_area = max_area
+        self.prev: list[pg.Rect] | None = None #前のフレームで描いた範囲（Noneなら全体を描き直す）
+        self.frame = -1 #最後に描いたGame.frames
+        self.full = True #このフレームを全体で描いたか
+        self.full_frames = 0
+        self.dirty_frames = 0
+
+    def invalidate(self) -> None:
+        """
+        次のフレームを画面全体で描き直させる（差分の管理外で画面に描いたとき）
+        """
+        self.prev = None
+
+    def begin(self, game: "Game") -> bool:
+        """
+        前のフレームで描いた範囲の背景を戻す
+        引数：描画するGameインスタンス
+        戻り値：背景を戻したならTrue、画面全体の描き直しが必要ならFalse
+        """
+        prev = self.prev
+        #前に描いたのが直前のフレームか、同じフレームの描き直し（補間表示）なら差分で描ける
+        self.full = (prev is None or game.frames - self.frame > 1
+                     or len(game.gravity) > 0 or len(prev) > self.max_rects)
+        if self.full:
+            self.full_frames += 1
+            return False
+        bg = game.bg_img
+        game.screen.blits([(bg, r, r) for r in prev], False)
+        self.dirty_frames += 1
+        return True
+
+    def hold(self, game: "Game") -> None:
+        """
+        描画を飛ばしたフレームで呼ぶ（画面は前のフレームのままなので差分の基準を引き継ぐ）
+        引数：Gameインスタンス
+        """
+        if self.frame == game.frames - 1:
+            self.frame = game.frames
+
+    def finish(self, game: "Game") -> list[pg.Rect] | None:
+        """
+        このフレームで描いた範囲を記録し、画面に送る範囲を返す
+        引数：描画したGameインスタンス
+        戻り値：pg.display.update() に渡す範囲のリスト（Noneなら画面全体）
+        """
+        screen_rect = game.screen.get_rect()
+        rects = [game.bird.rect.clip(screen_rect), game.score.area, game.hpbar.area]
+        for name in Game.DRAW_GROUPS:
+            group = getattr(game, name)
+            if isinstance(group, BlastGroup):
+                rects.extend(r for r in group.drawn if r)
+            else:
+                rects.extend(r for r in group.spritedict.values() if r) #Group.drawで描いた範囲
+        prev = self.prev
+        self.frame = game.frames
+        self.prev = None if len(game.gravity) > 0 else rects #全画面の演出が残っているなら次も全体
+        if self.full:
+            return None
+
+        dirty = prev + rects
+        area = sum(r.w * r.h for r in dirty)
+        if area > self.max_area * screen_rect.w * screen_rect.h:
+            return None
+        return dirty
+
+
+class CombatResolver:
+    """
+    敵×武器の当たり判定をまとめて解決するクラス
+    全ての武器の当たりを敵ごとのダメージ合計に集め、HPは1tickに1回だけ減らす
+    倒した敵は(敵, とどめの武器名)の撃破リストで返し、爆発やスコアは呼び出し側でまとめて処理する
+    武器を増やすときは resolve() に渡す武器の並びに足すだけでよい
+    """
+    def __init__(self):
+        self.damage: dict[pg.sprite.Sprite, int] = {} #このtickの敵ごとのダメージ合計
+
+    def resolve(self, grid: SpatialHash, sources) -> list[tuple[pg.sprite.Sprite, str]]:
+        """
+        武器ごとに当たり判定をして、敵のHPを減らす
+        このtickで倒れる敵は以降の武器の判定から外す（弾が倒れた敵に吸われないようにする）
+        生き残った被弾した敵は被弾エフェクトを出す
+        引数1：rebuild() 済みの敵のグリッド
+        引数2：(武器名, 武器のsprite.GroupかBlastGroup, 当たった武器を消すか) の並び（判定する順）
+        戻り値：倒した敵と、とどめを刺した武器名のリスト（倒した順）
+        """
+        damage = self.damage
+        damage.clear()
+        kills = []
+        members = grid.members
+        alive = members #倒れる敵を外した生存判定用（最初に倒れる敵が出たときに複製する）
+        for name, group, dokill in sources:
+            if isinstance(group, BlastGroup):
+                hits = group.damage(grid)
+            else:
+                hits = {emy: sum(w.atk for w in weapons) for emy, weapons in grid.groupcollide(group, dokill).items()}
+            for emy, dmg in hits.items():
+                total = damage.get(emy, 0) + dmg
+                damage[emy] = total
+                if emy.stats.hp <= total:
+                    kills.append((emy, name))
+                    if alive is members:
+                        alive = grid.members = dict(members)
+                    del alive[emy]
+        grid.members = members
+
+        for emy, total in damage.items():
+            emy.stats.hp -= total
+            if emy in alive:
+                emy.flash() #被弾エフェクト
+        return kills
+
+
+class Game:
+    """
+    ゲーム1回分の状態と1フレームの処理をまとめたクラス
+    main() の通常プレイとヘッドレス実行の両方から使う
+    """
+    LERP_LIMIT = 64 #補間表示でこれより大きく動いたスプライトは補間しない（ワープ・使い回し）
+    #kills で数える武器の名前（武器番号順）
+    WEAPON_NAMES = ("bomb", "laser", "missile", "gun", "sword")
+    #sprite_counts() で数えるグループ
+    COUNT_GROUPS = ("emys", "bb_wep", "bb_effect", "lsr_wep", "mssl_wep", "gun_wep", "swrd_wep", "exps")
+    #鳥の上に描くグループ（上に書いたものほど下）
+    DRAW_GROUPS = ("bb_wep", "bb_effect", "lsr_wep", "mssl_wep", "gun_wep", "swrd_wep", "emys", "exps")
+
+    def __init__(self, screen: pg.Surface, swarm: bool = False, start_level: int = 0):
+        """
+        初期化処理
+        引数1：画面Surface
+        引数2：敵と弾の移動にNumPy配列（EnemySwarm, ProjectileSwarm）を使うかのbool値（初期値False）
+        引数3：開始時のLevel（初期値0）
+        """
+        self.screen = screen
+
+        #背景写真
+        self.bg_img = assets.image("fig/back_ground.png", size=(width, height), alpha=False)
+
+        #爆発効果音
+        self.exp_se = assets.sound("sound/bb_effct.wav", 0.2)
+
+        self.score = Score()
+        self.score.value = start_level * 10
+        self.score.prev_level = start_level
+        self.start_screen = Starting()
+        self.level_up_selector = LevelUpSelector()  # レベルアップ選択画面
+        self.mode = "start"  # "start" or "play"
+        self.level_up_mode = None  # None: 通常, "selecting": 武器選択中
+
+        self.bird = Bird(3, (900, 400))
+        self.hpbar = Hpbar(self.bird)
+
+        self.weap_ctrl = Weapon_Control()
+        self.weapon_selector = Weapon_select(self.bird, self.weap_ctrl)  # 武器選択システムを初期化
+
+        self.bb_wep = SpriteGroup() #ボムの武器のグループ
+        self.bb_effect = BlastGroup() #ボム演出後の攻撃範囲のグループ
+        vectorized = swarm and np is not None #NumPy配列でまとめて動かすか
+        self.lsr_wep = ProjectileSwarm() if vectorized else SpriteGroup() #レーザー武器のグループ
+        self.mssl_wep = SpriteGroup() #ミサイル武器のグループ
+        self.gun_wep = ProjectileSwarm() if vectorized else SpriteGroup() #連続弾武器のグループ
+        self.swrd_wep = SpriteGroup() #周回軌道武器のグループ
+        self.exps = SpriteGroup() #敵爆破演出のグループ
+        self.gravity = SpriteGroup() #ボス出現演出用のグループ
+        #敵本体のグループ（NumPyがあれば配列でまとめて動かせる）
+        self.emys = EnemySwarm() if vectorized else SpriteGroup()
+        self.emy_grid = SpatialHash() #敵の当たり判定用グリッド
+        self.combat = CombatResolver() #敵×武器のダメージの集計
+
+        self.tmr = 0
+        self.frames = 0 #step()を呼んだ回数
+        self.boss_score = 150 #ラスボスが出現するスコア
+        self.kills = dict.fromkeys(__class__.WEAPON_NAMES, 0) #武器ごとに倒した敵の数
+        self.timer: PhaseTimer | None = None #処理ごとの時間計測（benchなどで設定する）
+        self.renderer: DirtyRenderer | None = None #差分描画（Noneなら毎フレーム全体を描く）
+        self.dirty_rects: list[pg.Rect] | None = None #画面に送る範囲（Noneなら画面全体）
+        self.menu_shown = None #画面に出ているメニューの表示内容（Noneならメニュー以外）
+        self.interpolate = False #描画をtickの間で補間するか
+        self.snapshot: dict[pg.sprite.Sprite, tuple[int, int]] = {} #直前のtickのスプライトの左上座標
+        self.pending_draw = False #進めたが描いていないtickがあるか
+
+        self.ending = False #ラストフェーズかのフラグ
+        self.boss_flag = False #ボスは既に出現したかのフラグ
+
+        #武器の設定
+        self.bird.set_item(1,"Bomb",1,1)
+        self.bird.set_item(2,"Laser",1,1)
+        self.bird.set_item(3,"Missile",1,1)
+        self.bird.set_item(4,"Gun",1,1)
+        self.bird.set_item(5,"Sword",1,1)
+
+    def handle_event(self, event: pg.event.Event) -> bool:
+        """
+        イベントを1つ処理する
+        引数：pg.event.get() などで得たイベント
+        戻り値：ゲームを続けるならTrue、終了するならFalse
+        """
+        weap_ctrl = self.weap_ctrl
+        if event.type == pg.QUIT:
+            return False
+        if event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE:
+            return False
+
+        # 武器選択画面用のイベント処理
+        if self.level_up_mode == "selecting":
+            if event.type == pg.KEYDOWN:
+                if event.key == pg.K_1 and weap_ctrl.bomb_level < 5:
+                    self.weapon_selector.select_weapon(0)  # ボム
+                    self.level_up_mode = None
+                elif event.key == pg.K_2 and weap_ctrl.laser_level < 5:
+                    self.weapon_selector.select_weapon(1)  # レーザー
+                    self.level_up_mode = None
+                elif event.key == pg.K_3 and weap_ctrl.mssl_level < 5:
+                    self.weapon_selector.select_weapon(2) # ミサイル
+                    self.level_up_mode = None
+                elif event.key == pg.K_4 and weap_ctrl.gun_level < 5:
+                    self.weapon_selector.select_weapon(3) # 銃
+                    self.level_up_mode = None
+                elif event.key == pg.K_5 and weap_ctrl.swrd_level < 5:
+                    self.weapon_selector.select_weapon(4)  # 剣
+                    self.level_up_mode = None
+            return True
+
+        # スタート画面用のイベント処理　enterかspacekeyで決定
+        if self.mode == "start":
+            start_screen = self.start_screen
+            if event.type == pg.KEYDOWN:
+                if event.key == pg.K_UP:
+                    start_screen.selected = max(0, start_screen.selected - 1)
+                elif event.key == pg.K_DOWN:
+                    start_screen.selected = min(len(start_screen.options) - 1, start_screen.selected + 1)
+                elif event.key == pg.K_RETURN or event.key == pg.K_SPACE:
+                    if start_screen.selected == 0:
+                        self.mode = "play"
+                    else:
+                        return False
+        return True
+
+    def step(self, key_lst, draw: bool = True) -> bool:
+        """
+        1フレーム分ゲームを進めて画面に描く（画面の更新は呼び出し側で行う）
+        引数1：押下キーの真理値リスト（key_lst[pg.K_UP] のように引けるもの）
+        引数2：プレイ画面を描くかのbool値（Falseならゲームだけ進めて描画を飛ばす）
+        戻り値：ゲームを続けるならTrue、ゲームオーバーならFalse
+        """
+        screen = self.screen
+        self.frames += 1
+        self.dirty_rects = None
+
+        # 武器選択画面を表示している場合はゲーム処理をスキップ
+        if self.level_up_mode == "selecting":
+            self.snapshot.clear()
+            self.pending_draw = False
+            selector = self.level_up_selector
+            state = selector.state(self.bird)
+            if state == self.menu_shown:
+                self.dirty_rects = [] #前のフレームと同じなので描き直さない
+            else:
+                selector.update(screen, self.bird, self.bg_img)  # birdパラメータを渡して武器レベルをチェック
+                self.menu_shown = state
+            return True
+
+        # スタート画面を表示している場合はゲーム処理をスキップ
+        if self.mode == "start":
+            self.snapshot.clear()
+            self.pending_draw = False
+            state = self.start_screen.state()
+            if state == self.menu_shown:
+                self.dirty_rects = [] #前のフレームと同じなので描き直さない
+            else:
+                self.start_screen.update(screen, self.bg_img)
+                self.menu_shown = state
+            self.tmr += 1
+            return True
+        self.menu_shown = None
+
+        #処理ごとの時間計測（timerがNoneなら計測しない、1回の描画で複数tick進めたときは合計する）
+        timer = self.timer
+        if timer is not None and not timer.running:
+            timer.start()
+        if self.interpolate:
+            self.snapshot = self._positions()
+        self._spawn()
+        if timer is not None:
+            timer.lap("spawn")
+        self._act_weapons()
+        if timer is not None:
+            timer.lap("weapons")
+        self._collide()
+        if timer is not None:
+            timer.lap("collision")
+
+        bird = self.bird
+        if bird.hp<=0:
+            #ゲームオーバー
+            screen.blit(self.bg_img, [0, 0]) #背景描画
+            bird.change_img(8, screen)  # こうかとん悲しみエフェクト
+            self.hpbar.update(screen)
+            pg.mixer.stop()
+            return False
+
+        # レベルアップチェック
+        if self.score.check_level_up():
+            self.level_up_mode = "selecting"  # 武器選択画面に遷移
+            pg.mixer.stop()  #効果音を止める
+
+        self._update(key_lst)
+        if timer is not None:
+            timer.lap("update")
+        if draw:
+            self._draw()
+            self.pending_draw = False
+        else:
+            self.dirty_rects = [] #描画を飛ばしたので画面は送らない
+            self.pending_draw = True
+            if self.renderer is not None:
+                self.renderer.hold(self)
+        self.tmr += 1
+        return True
+
+    def run_ticks(self, key_lst, ticks: int, alpha: float | None = None) -> bool:
+        """
+        固定の刻みでticks回ゲームを進め、最後に1回だけ描く（描画が間に合わないときのフレーム飛ばし）
+        ticksが0でも補間するなら、同じ状態をalphaの位置で描き直す
+        引数1：押下キーの真理値リスト
+        引数2：進めるtick数
+        引数3：直前のtickから今のtickまでの補間の割合（0〜1、Noneなら補間しない）
+        戻り値：ゲームを続けるならTrue、ゲームオーバーならFalse
+        """
+        rects: list[pg.Rect] | None = []
+        for _ in range(ticks):
+            alive = self.step(key_lst, False)
+            #メニューで描いた範囲も含めて、このフレームで画面に送る範囲をまとめる
+            rects = None if rects is None or self.dirty_rects is None else rects + self.dirty_rects
+            if not alive:
+                self.dirty_rects = None
+                return False
+        interpolating = alpha is not None and self.snapshot and not self.in_menu()
+        if self.pending_draw or interpolating:
+            if ticks == 0 and self.timer is not None:
+                self.timer.start()
+            self._draw(alpha if interpolating else None)
+            self.pending_draw = False
+            rects = None if rects is None or self.dirty_rects is None else rects + self.dirty_rects
+        self.dirty_rects = rects
+        return True
+
+    def in_menu(self) -> bool:
+        """
+        スタート画面か武器選択画面を表示しているかを返す
+        """
+        return self.mode == "start" or self.level_up_mode == "selecting"
+
+    def invalidate(self) -> None:
+        """
+        画面をstep()の外で書き換えたときに呼び、次のフレームで全体を描き直させる
+        """
+        self.menu_shown = None
+        if self.renderer is not None:
+            self.renderer.invalidate()
+
+    def _spawn(self) -> None:
+        """
+        敵の出現処理
+        """
+        if self.tmr % 20 == 0 and not self.ending:  # 200フレームに1回，敵機を出現させる
+            self.emys.add(Enemy(self.score.value // 10))
+
+    def _act_weapons(self) -> None:
+        """
+        武器ごとの出現処理
+        """
+        weap_ctrl, tmr, bird = self.weap_ctrl, self.tmr, self.bird
+        #敵グリッドを1フレームに1回だけ作り直す（このtickに出現した敵と今の位置をミサイルの狙いにも使う）
+        #ここから当たり判定までの間に敵は動かず増減もしないので、_collide() でもそのまま使う
+        self.emy_grid.rebuild(self.emys)
+        self.bb_wep, self.bb_effect = weap_ctrl.bomb_act(tmr, self.bb_wep, self.bb_effect, bird)
+        self.lsr_wep = weap_ctrl.laser_act(tmr, self.lsr_wep, bird)
+        self.mssl_wep = weap_ctrl.mssl_act(tmr, self.mssl_wep, bird, self.emys, self.emy_grid)
+        self.gun_wep = weap_ctrl.gun_act(tmr, self.gun_wep, bird)
+        self.swrd_wep = weap_ctrl.swrd_act(self.swrd_wep, bird)
+
+    def _collide(self) -> None:
+        """
+        当たり判定（ボム、敵×武器、ラスボス出現、こうかとん×敵）
+        """
+        weap_ctrl, bird, score = self.weap_ctrl, self.bird, self.score
+        emys, bb_effect, exps = self.emys, self.bb_effect, self.exps
+        emy_grid = self.emy_grid #_act_weapons() で作り直し済み
+
+        #ボム衝突イベント
+        #敵との衝突（Weapon_Control.bomb_actと同様の処理）
+        for emy, bb_mine in emy_grid.groupcollide(self.bb_wep, True).items():
+            for bb in bb_mine:
+                weap_ctrl.detonate(bb, bb_effect)
+                self.exp_se.play()
+
+        #敵×武器衝突イベント
+        if not self.ending: #もし、エンディングじゃないなら
+            #全ての武器の当たりを敵ごとのダメージにまとめて1回で減らす
+            kills = self.combat.resolve(emy_grid, (
+                ("bomb", bb_effect, False), #爆発エフェクト
+                ("laser", self.lsr_wep, False), #レーザー
+                ("missile", self.mssl_wep, True), #追尾ミサイル
+                ("gun", self.gun_wep, True), #連続弾
+                ("sword", self.swrd_wep, False), #剣
+            ))
+            #倒した敵をまとめて処理する
+            for emy, weapon in kills:
+                exps.add(Explosion.spawn(emy, 100))
+                emy.kill()
+                self.kills[weapon] += 1
+            score.value += len(kills)
         else:
             #エンディング処理用
-            pg.sprite.groupcollide(emys, bb_wep, False, True)
-            pg.sprite.groupcollide(emys, lsr_wep, False, True)
-            pg.sprite.groupcollide(emys, mssl_wep, False, True)
-            pg.sprite.groupcollide(emys, gun_wep, False, True)            
+            emy_grid.groupcollide(self.bb_wep, True)
+            emy_grid.groupcollide(self.lsr_wep, True)
+            emy_grid.groupcollide(self.mssl_wep, True)
+            emy_grid.groupcollide(self.gun_wep, True)
 
-        if score.value >= 150 and not ending:
-            if not boss_flag:
+        if score.value >= self.boss_score and not self.ending:
+            if not self.boss_flag:
                 emys.empty()
-                boss_flag = True
+                self.boss_flag = True
                 
-            gravity.add(Gravity(400))
-            ending = True
-            emys.add(LastBoss())
+            self.gravity.add(Gravity(400))
+            self.ending = True
+            boss = LastBoss()
+            emys.add(boss)
+            emy_grid.insert(boss) #再構築済みのグリッドにも登録する
         
         #最終フェーズではないとき
-        if not ending: 
-            for emy in pg.sprite.spritecollide(bird, emys, True):  # こうかとんと衝突した爆弾リスト
-                bird.hp-=1 #HPが減る
+        if not self.ending: 
+            for emy in emy_grid.spritecollide(bird, True):  # こうかとんと衝突した爆弾リスト
+                bird.hp-=emy.stats.attack #HPが減る
                 bird.dmg_eff_time = 50
                 if bird.dmg_eff_time and bird.dmg_sound is not None:
                     bird.dmg_sound.play()
         else:
-            for emy in pg.sprite.spritecollide(bird, emys, False):  # こうかとんと衝突した敵リスト
+            for emy in emy_grid.spritecollide(bird, False):  # こうかとんと衝突した敵リスト
                 #敵と衝突したら？
-                bird.hp-=1 #HPが減る
+                bird.hp-=emy.stats.attack #HPが減る
                 bird.dmg_eff_time = 50
                 if bird.dmg_eff_time and bird.dmg_sound is not None:
                     bird.dmg_sound.play()
 
-        if bird.hp<=0:
-            #ゲームオーバー
-            bird.change_img(8, screen)  # こうかとん悲しみエフェクト
-            hpbar.update(screen)
-            
-            pg.mixer.stop()
+    def _update(self, key_lst) -> None:
+        """
+        スプライトの更新（移動・寿命）
+        引数：押下キーの真理値リスト
+        """
+        timer = self.timer
+        self.gravity.update()
+        self.bird.update(key_lst)
+        self.bb_wep.update()
+        self.bb_effect.update()
+        self.lsr_wep.update()
+        if timer is not None:
+            timer.lap("update")
+        self.mssl_wep.update(self.emys, self.emy_grid) #ミサイルの回転は別に計測する
+        if timer is not None:
+            timer.lap("missile")
+        self.gun_wep.update()
+        self.swrd_wep.update()
+        self.emys.update(self.bird.rect.center)
+        self.exps.update()
+
+    def _positions(self) -> dict[pg.sprite.Sprite, tuple[int, int]]:
+        """
+        補間表示用に、こうかとんと描画するスプライトの今の左上座標を返す
+        """
+        pos = {self.bird: self.bird.rect.topleft}
+        for name in __class__.DRAW_GROUPS:
+            for sprite in getattr(self, name):
+                pos[sprite] = sprite.rect.topleft
+        return pos
+
+    def _interpolate(self, alpha: float) -> list[tuple[pg.sprite.Sprite, pg.Rect]]:
+        """
+        スプライトを直前のtickと今のtickの間（割合alpha）の位置に一時的にずらす
+        引数：補間の割合（0なら直前のtick、1なら今のtick）
+        戻り値：元に戻すための(スプライト, 元のRect)のリスト
+        """
+        moved = []
+        back = 1.0 - alpha
+        limit = __class__.LERP_LIMIT
+        for sprite, (x0, y0) in self.snapshot.items():
+            rect = sprite.rect
+            dx, dy = rect.x - x0, rect.y - y0
+            if (dx or dy) and abs(dx) <= limit and abs(dy) <= limit:
+                sprite.rect = rect.move(round(-dx * back), round(-dy * back))
+                moved.append((sprite, rect))
+        return moved
+
+    def _draw(self, alpha: float | None = None) -> None:
+        """
+        背景・スプライト・HUDの描画（重なり順は上に書いたものほど下）
+        引数：補間の割合（Noneなら今のtickの位置で描く）
+        """
+        screen, bird, timer, renderer = self.screen, self.bird, self.timer, self.renderer
+        moved = self._interpolate(alpha) if alpha is not None else ()
+        if renderer is None or not renderer.begin(self):
+            screen.blit(self.bg_img, [0, 0]) #背景描画
+        if timer is not None:
+            timer.lap("draw")
+        self.score.update(screen)
+        if timer is not None:
+            timer.lap("hud")
+        self.gravity.draw(screen)
+        screen.blit(bird.image, bird.rect)
+        for name in __class__.DRAW_GROUPS:
+            getattr(self, name).draw(screen)
+        if timer is not None:
+            timer.lap("draw")
+        self.hpbar.update(screen)
+        if renderer is not None:
+            self.dirty_rects = renderer.finish(self)
+        for sprite, rect in moved: #補間でずらした位置を戻す
+            sprite.rect = rect
+        if timer is not None:
+            timer.lap("hud")
+
+    def sprite_counts(self) -> dict[str, int]:
+        """
+        グループごとのスプライト数を返す
+        """
+        return {name: len(getattr(self, name)) for name in __class__.COUNT_GROUPS}
+
+    def sim_state(self) -> dict:
+        """
+        ゲームの結果に関わる状態を返す（描画の方法などで変わってはいけないもの）
+        こうかとんの位置とHP、スコア、武器レベル、敵の位置とHP、武器・爆発の位置を入れる
+        """
+        bird = self.bird
+        state = {
+            "tmr": self.tmr, "level_up": self.level_up_mode, "ending": self.ending,
+            "bird": [*bird.rect.center, bird.hp, bird.dmg_eff_time],
+            "score": self.score.value, "weapons": self.weap_ctrl.levels(), "kills": list(self.kills.values()),
+            "emys": [[type(emy).__name__, *emy.rect.center, emy.stats.hp] for emy in self.emys],
+        }
+        for name in __class__.DRAW_GROUPS:
+            group = getattr(self, name)
+            if isinstance(group, BlastGroup):
+                state[name] = [[*box.topleft] for box in group.boxes()]
+            elif name != "emys":
+                state[name] = [[*sprite.rect.topleft] for sprite in group]
+        return state
+
+    def checksum(self, state: dict | None = None) -> str:
+        """
+        sim_state() のハッシュ値（16桁の16進数）を返す
+        引数：sim_state() の結果（Noneなら今の状態）
+        """
+        if state is None:
+            state = self.sim_state()
+        blob = json.dumps(state, separators=(",", ":")).encode("utf-8")
+        return hashlib.blake2b(blob, digest_size=8).hexdigest()
+
+
+class ScriptedKeys:
+    """
+    pg.key.get_pressed() の代わりに使う押下キーの集合
+    key_lst[pg.K_UP] のように引くと押されているかを返す
+    """
+    __slots__ = ("pressed",)
+
+    def __init__(self, pressed: frozenset[int]):
+        """
+        引数：押されているキーコードの集合
+        """
+        self.pressed = pressed
+
+    def __getitem__(self, key: int) -> bool:
+        return key in self.pressed
+
+
+#入力スクリプトで使えるキー名
+SCRIPT_KEYS = {
+    "up": pg.K_UP, "down": pg.K_DOWN, "left": pg.K_LEFT, "right": pg.K_RIGHT,
+    "1": pg.K_1, "2": pg.K_2, "3": pg.K_3, "4": pg.K_4, "5": pg.K_5,
+}
+
+
+def parse_input_script(text: str) -> list[tuple[frozenset[int], int]]:
+    """
+    "right:50,up+left:30,none:20" の形式の入力スクリプトを解析する関数
+    「キー名を+でつないだもの:フレーム数」をカンマか改行で区切って並べる（noneは何も押さない）
+    引数：入力スクリプトの文字列
+    戻り値：(押すキーの集合, 続けるフレーム数) のリスト
+    """
+    script = []
+    for part in text.replace("\n", ",").split(","):
+        part = part.strip()
+        if not part or part.startswith("#"):
+            continue
+        names, _, frames = part.partition(":")
+        keys = set()
+        for name in names.lower().split("+"):
+            name = name.strip()
+            if name in ("", "none"):
+                continue
+            if name not in SCRIPT_KEYS:
+                raise ValueError(f"入力スクリプトのキー名が不正です: {name}")
+            keys.add(SCRIPT_KEYS[name])
+        script.append((frozenset(keys), int(frames or 1)))
+    return script
+
+
+class ScriptedInput:
+    """
+    キーボードの代わりに入力スクリプトでゲームを操作するクラス（ヘッドレス用）
+    スクリプトは最後まで進むと最初に戻る
+    武器選択画面ではスクリプトに数字キーが無ければ levelup の順に武器を選ぶ
+    """
+    def __init__(self, script: list[tuple[frozenset[int], int]], levelup: str = "12345"):
+        """
+        引数1：parse_input_script() の結果
+        引数2：自動で選ぶ武器番号の並び（初期値"12345"の順に繰り返す）
+        """
+        self.script = script or [(frozenset(), 1)]
+        self.index = 0
+        self.left = self.script[0][1]
+        self.prev = frozenset() #前フレームの押下キー
+        self.levelup = [int(c) - 1 for c in levelup if c in "12345"]
+        self.levelup_index = 0
+
+    def poll(self, game: "Game") -> tuple[ScriptedKeys, list[pg.event.Event]]:
+        """
+        1フレーム分の入力を返す
+        引数：操作するGameインスタンス（武器選択中かの確認用）
+        戻り値：押下キー, このフレームに発生したイベントのリスト
+        """
+        while self.left <= 0:
+            self.index = (self.index + 1) % len(self.script)
+            self.left = self.script[self.index][1]
+        keys = self.script[self.index][0]
+        self.left -= 1
+
+        #押し始めたキーはKEYDOWNイベントにする
+        events = [pg.event.Event(pg.KEYDOWN, key=k) for k in sorted(keys - self.prev)]
+        self.prev = keys
+
+        if game.level_up_mode == "selecting" and not events and self.levelup:
+            levels = game.weap_ctrl.levels()
+            for _ in range(len(self.levelup)):
+                idx = self.levelup[self.levelup_index % len(self.levelup)]
+                self.levelup_index += 1
+                if levels[idx] < 5:
+                    events.append(pg.event.Event(pg.KEYDOWN, key=pg.K_1 + idx))
+                    break
+        return ScriptedKeys(keys), events
+
+
+class HeuristicInput:
+    """
+    近くの敵から逃げるようにこうかとんを動かす入力（バッチ実行用、ScriptedInputと同じ使い方）
+    近い敵から離れる向きに進み、画面の端に近づいたら中央へ戻る
+    武器選択画面では一番レベルの低い武器を選ぶ
+    """
+    def __init__(self, danger: int = 250, margin: int = 150, nearest: int = 4):
+        """
+        引数1：この距離より近い敵から逃げる（初期値250）
+        引数2：画面の端からこの距離に入ったら中央へ戻る（初期値150）
+        引数3：逃げる向きを決めるのに見る近い敵の数（初期値4）
+        """
+        self.danger = danger
+        self.margin = margin
+        self.nearest = nearest
+
+    def poll(self, game: "Game") -> tuple[ScriptedKeys, list[pg.event.Event]]:
+        """
+        1フレーム分の入力を返す
+        引数：操作するGameインスタンス
+        戻り値：押下キー, このフレームに発生したイベントのリスト
+        """
+        if game.level_up_mode == "selecting":
+            levels = game.weap_ctrl.levels()
+            idx = min(range(len(levels)), key=levels.__getitem__)
+            events = [pg.event.Event(pg.KEYDOWN, key=pg.K_1 + idx)] if levels[idx] < 5 else []
+            return ScriptedKeys(frozenset()), events
+
+        bx, by = game.bird.rect.center
+        dx = dy = 0.0
+        #近い敵から離れる向き（近いほど強く）
+        for emy in game.emy_grid.k_nearest((bx, by), self.nearest):
+            ex, ey = emy.rect.center
+            dist = math.hypot(bx - ex, by - ey)
+            if 0 < dist < self.danger:
+                weight = 1 - dist / self.danger
+                dx += (bx - ex) / dist * weight
+                dy += (by - ey) / dist * weight
+        #画面の端から離れる向き
+        margin = self.margin
+        dx += max(0, 1 - bx / margin) - max(0, 1 - (width - bx) / margin)
+        dy += max(0, 1 - by / margin) - max(0, 1 - (height - by) / margin)
+
+        keys = set()
+        if dx > 0.1:
+            keys.add(pg.K_RIGHT)
+        elif dx < -0.1:
+            keys.add(pg.K_LEFT)
+        if dy > 0.1:
+            keys.add(pg.K_DOWN)
+        elif dy < -0.1:
+            keys.add(pg.K_UP)
+        return ScriptedKeys(frozenset(keys)), []
+
+
+class Replay:
+    """
+    プレイの記録（乱数のシード＋1tickごとの押下キーのビットマスク）
+    ファイルはMAGIC・JSONヘッダ・(マスク, 続くtick数)のuint16の組の並び（ランレングス圧縮）
+    矢印キーは押している間、数字キーは武器選択画面で武器を選んだtickだけビットが立つ
+    """
+    MAGIC = b"TUTRPLY\0"
+    VERSION = 1 #ゲームの進め方を変えて同じ入力で同じ結果にならなくなったら上げる
+    #ビット位置 -> キー
+    KEYS = (pg.K_UP, pg.K_DOWN, pg.K_LEFT, pg.K_RIGHT, pg.K_1, pg.K_2, pg.K_3, pg.K_4, pg.K_5)
+    HELD = 4 #KEYSのうち押している間ビットが立つキーの数（残りは選んだtickだけ）
+    MAX_RUN = 0xFFFF #1組で表せる最大のtick数
+
+    def __init__(self, seed: int, size: tuple[int, int], tmr: int | None = None, options: dict | None = None):
+        """
+        初期化処理
+        引数1：乱数rngのシード
+        引数2：画面サイズ（敵の出現位置や画面外の判定が変わるので同じサイズで再生する）
+        引数3：記録を始めたときのGame.tmr（Noneならまだ始まっていない）
+        引数4：結果が変わる設定（Noneなら今の設定）
+        """
+        self.seed = seed
+        self.size = tuple(size)
+        self.tmr = tmr
+        if options is None:
+            options = {"homing": Missile_Weapon.homing, "rotation_steps": Missile_Weapon.rotation_steps}
+        self.options = options
+        self.runs: list[list[int]] = [] #[マスク, 続くtick数] のリスト
+
+    @property
+    def ticks(self) -> int:
+        """
+        記録したtick数
+        """
+        return sum(count for _, count in self.runs)
+
+    @classmethod
+    def key_mask(cls, key_lst, chosen: int | None = None) -> int:
+        """
+        押下キーをビットマスクにする
+        引数1：押下キーの真理値リスト
+        引数2：このtickの前に武器選択画面で押した数字キー（Noneなら無し）
+        """
+        mask = 0
+        for bit, key in enumerate(cls.KEYS[:cls.HELD]):
+            if key_lst[key]:
+                mask |= 1 << bit
+        if chosen is not None:
+            mask |= 1 << cls.KEYS.index(chosen)
+        return mask
+
+    def append(self, mask: int) -> None:
+        """
+        1tick分のマスクを追加する（前のtickと同じなら数を増やすだけ）
+        """
+        runs = self.runs
+        if runs and runs[-1][0] == mask and runs[-1][1] < self.MAX_RUN:
+            runs[-1][1] += 1
+        else:
+            runs.append([mask, 1])
+
+    def masks(self):
+        """
+        1tickずつマスクを返すジェネレータ
+        """
+        for mask, count in self.runs:
+            for _ in range(count):
+                yield mask
+
+    def apply(self) -> None:
+        """
+        記録したときの設定に合わせる
+        """
+        Missile_Weapon.homing = self.options["homing"]
+        Missile_Weapon.rotation_steps = Sword_Wepon.rotation_steps = self.options["rotation_steps"]
+
+    def save(self, path: str) -> int:
+        """
+        ファイルに書き出す
+        引数：ファイルのパス
+        戻り値：書き出したバイト数
+        """
+        head = {"version": self.VERSION, "seed": self.seed, "size": list(self.size), "tmr": self.tmr,
+                "ticks": self.ticks, "options": self.options}
+        blob = json.dumps(head, separators=(",", ":")).encode("utf-8")
+        flat = [value for run in self.runs for value in run]
+        data = self.MAGIC + struct.pack("<I", len(blob)) + blob + struct.pack(f"<{len(flat)}H", *flat)
+        with open(path, "wb") as f:
+            f.write(data)
+        return len(data)
+
+    @classmethod
+    def load(cls, path: str) -> "Replay":
+        """
+        ファイルから読み込む
+        引数：ファイルのパス
+        戻り値：Replayインスタンス
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        n = len(cls.MAGIC)
+        if data[:n] != cls.MAGIC or len(data) < n + 4:
+            raise ValueError(f"リプレイファイルではありません: {path}")
+        (head_len,) = struct.unpack_from("<I", data, n)
+        head = json.loads(data[n + 4:n + 4 + head_len].decode("utf-8"))
+        if head.get("version") != cls.VERSION:
+            raise ValueError(f"リプレイファイルの版が違います: {head.get('version')}")
+        body = data[n + 4 + head_len:]
+        flat = struct.unpack(f"<{len(body) // 2}H", body[:len(body) // 2 * 2])
+        replay = cls(head["seed"], head["size"], head["tmr"], head["options"])
+        replay.runs = [[flat[i], flat[i + 1]] for i in range(0, len(flat) - 1, 2)]
+        return replay
+
+
+class ReplayInput:
+    """
+    Replayの記録どおりにゲームを操作するクラス（ScriptedInputと同じ使い方）
+    """
+    def __init__(self, replay: Replay):
+        """
+        引数：再生するReplay
+        """
+        self.masks = replay.masks()
+        self.next = next(self.masks, None) #次のtickのマスク（Noneなら最後まで再生した）
+
+    @property
+    def done(self) -> bool:
+        """
+        最後まで再生したか
+        """
+        return self.next is None
+
+    def poll(self, game: "Game") -> tuple[ScriptedKeys, list[pg.event.Event]]:
+        """
+        1tick分の入力を返す
+        引数：操作するGameインスタンス（ScriptedInputと引数を揃えるためのもの）
+        戻り値：押下キー, このtickの前に発生したイベントのリスト
+        """
+        mask = self.next or 0
+        self.next = next(self.masks, None)
+        keys = Replay.KEYS
+        held = frozenset(key for bit, key in enumerate(keys[:Replay.HELD]) if mask >> bit & 1)
+        events = [pg.event.Event(pg.KEYDOWN, key=key)
+                  for bit, key in enumerate(keys) if bit >= Replay.HELD and mask >> bit & 1]
+        return ScriptedKeys(held), events
+
+
+def open_screen(size: tuple[int, int] | None = None, background: bool = False) -> pg.Surface:
+    """
+    画面を作り、グローバル変数width, heightを設定して画像をまとめて読み込む関数
+    引数1：ウィンドウサイズ（Noneなら全画面）
+    引数2：読み込みを裏のスレッドで始めるだけにするかのbool値（残りはpreload_assets()で行う）
+    戻り値：画面Surface
+    """
+    global width, height #画面幅、画面高さのグローバル変数を呼び出す
+
+    if size is None:
+        screen = pg.display.set_mode((width, height), pg.FULLSCREEN)
+    else:
+        screen = pg.display.set_mode(size)
+    width, height = screen.get_size()
+
+    if assets.pack_path:
+        load_pack()
+    if background:
+        assets.preload_background()
+    else:
+        preload_assets()
+    return screen
+
+
+def preload_assets() -> None:
+    """
+    画像をまとめて読み込み、回転済み画像や被弾時の画像を作っておく関数
+    （ゲーム中にディスクを読んだり画像を作ったりしないようにする）
+    """
+    assets.preload([*PRELOAD_IMAGES, ("fig/back_ground.png", None, (width, height), 0, False)])
+    Bird.direction_images(3)
+    Missile_Weapon.rotations()
+    Sword_Wepon.rotations()
+    Enemy.preload_tints()
+    shapes.preload([assets.image("fig/fantasy_maou_devil.png", LastBoss.img_scale)])
+    for wep_mode in (False, True):
+        for add in (False, True):
+            Explosion.variants(wep_mode, add)
+    if assets.pack_path:
+        save_pack()
+
+
+def pack_entries() -> list[tuple[tuple, pg.Surface]]:
+    """
+    パックに入れる変換済み画像を集める関数
+    （assetsの画像、こうかとんの向きごとの画像、爆発の色違い、回転済み画像、被弾時の赤い画像）
+    戻り値：(キー, Surface) のリスト
+    """
+    entries = [(("image",) + key, surf) for key, surf in assets.images.items()]
+    for num, imgs in Bird.imgs_cache.items():
+        entries.extend((("bird", num, dire), surf) for dire, surf in imgs.items())
+    for (wep_mode, add), imgs in Explosion.cache.items():
+        entries.extend((("explosion", wep_mode, add, i), surf) for i, surf in enumerate(imgs))
+    for cls in (Missile_Weapon, Sword_Wepon):
+        if cls.rot_cache is not None:
+            steps = cls.rot_cache.steps
+            entries.extend((("rotation", cls.__name__, steps, i), surf) for i, surf in enumerate(cls.rot_cache.images))
+    #赤い画像は元の画像のキーで引けるようにする
+    keys = {id(surf): key for key, surf in entries}
+    for src, tinted in hit_tints.images.items():
+        if id(src) in keys:
+            entries.append((("tint",) + keys[id(src)], tinted))
+    return entries
+
+
+def install_pack(surfaces: dict[tuple, pg.Surface]) -> None:
+    """
+    パックから読んだ画像を各クラスのキャッシュに入れる関数
+    引数：キー -> Surface の辞書（AssetPack.surfaces）
+    """
+    rotations: dict[tuple[str, int], dict[int, pg.Surface]] = {}
+    for key, surf in surfaces.items():
+        kind = key[0]
+        if kind == "image":
+            assets.images.setdefault(key[1:], surf)
+        elif kind == "bird":
+            Bird.imgs_cache.setdefault(key[1], {})[key[2]] = surf
+        elif kind == "explosion":
+            Explosion.cache.setdefault((key[1], key[2]), [None, None])[key[3]] = surf
+        elif kind == "rotation":
+            rotations.setdefault((key[1], key[2]), {})[key[3]] = surf
+    for cls in (Missile_Weapon, Sword_Wepon):
+        imgs = rotations.get((cls.__name__, cls.rotation_steps))
+        if imgs is not None and len(imgs) == cls.rotation_steps:
+            cls.rot_cache = RotationCache.from_images([imgs[i] for i in range(cls.rotation_steps)])
+
+    for key, surf in surfaces.items():
+        if key[0] == "tint":
+            src = key[1:]
+            if src[0] == "image":
+                src_surf = assets.images.get(src[1:])
+            elif src[0] == "bird":
+                src_surf = Bird.imgs_cache.get(src[1], {}).get(src[2])
+            else:
+                src_surf = None
+            if src_surf is not None:
+                hit_tints.images[src_surf] = surf
+
+
+def load_pack() -> bool:
+    """
+    assets.pack_path のパックを読み込み、使えるなら各キャッシュに入れる関数
+    戻り値：パックを使えたならTrue
+    """
+    pack = AssetPack(assets.pack_path)
+    if not pack.load():
+        return False
+    install_pack(pack.surfaces)
+    assets.pack = pack
+    return True
+
+
+def save_pack() -> int:
+    """
+    パックが無い・古い・足りない画像があるときに、今の変換済み画像でパックを作り直す関数
+    戻り値：書き出したバイト数（作り直さなかったら0）
+    """
+    entries = pack_entries()
+    if assets.pack is not None and all(key in assets.pack.surfaces for key, _ in entries):
+        return 0
+    return AssetPack(assets.pack_path).save(entries)
+
+
+class FixedStepClock:
+    """
+    描画と切り離した固定間隔のゲーム時計（アキュムレータ方式）
+    経過した実時間を貯めて、1tick分たまるごとにゲームを1回進める
+    描画が重くて遅れたときは描画を飛ばして複数tickをまとめて進め、ゲームの速さを保つ
+    """
+    def __init__(self, rate: int = 50, max_ticks: int = 5):
+        """
+        初期化処理
+        引数1：1秒あたりのtick数（初期値50）
+        引数2：1回の描画で進める最大tick数（これ以上遅れた分は捨ててゲームを遅くする）
+        """
+        self.dt = 1 / rate
+        self.max_ticks = max(1, max_ticks)
+        self.acc = 0.0 #まだ進めていない時間（秒）
+        self.last: float | None = None #前回advance()した時刻
+        self.ticks = 0 #進めたtick数
+        self.renders = 0 #tickを進めて描いた回数
+        self.skipped = 0 #描画を飛ばしたtick数
+        self.dropped = 0 #遅れすぎて捨てたtick数
+
+    def reset(self, due: int = 0) -> None:
+        """
+        貯めた時間を捨てる（入力待ちなどで止まっていた時間を取り戻さないようにする）
+        引数：すぐに進めるtick数（初期値0）
+        """
+        self.last = time.perf_counter()
+        self.acc = due * self.dt
+
+    def advance(self) -> int:
+        """
+        経過した時間を貯め、今進めるtick数を返す
+        """
+        now = time.perf_counter()
+        if self.last is None:
+            self.last = now
+        self.acc += now - self.last
+        self.last = now
+        n = int(self.acc / self.dt)
+        self.acc -= n * self.dt
+        if n > self.max_ticks:
+            self.dropped += n - self.max_ticks
+            n = self.max_ticks
+        if n:
+            self.ticks += n
+            self.renders += 1
+            self.skipped += n - 1
+        return n
+
+    @property
+    def alpha(self) -> float:
+        """
+        次のtickまでの進み具合（補間表示の割合、0〜1）
+        """
+        return min(1.0, self.acc / self.dt)
+
+    def wait(self) -> None:
+        """
+        次のtickの時刻まで眠る
+        """
+        rest = self.dt - self.acc - (time.perf_counter() - self.last)
+        if rest > 0:
+            time.sleep(rest)
+
+
+def main(swarm: bool = False, profiler: FrameProfiler | None = None, dirty: bool = False,
+         background: bool = True, interpolate: bool = False, max_ticks: int = 5, record: str | None = None):
+    """
+    ゲーム本体（全画面・キーボード操作・50tick/秒）
+    ゲームは描画と切り離した固定間隔（FixedStepClock）で進め、描画が遅れたら描画を飛ばす
+    引数1：敵と弾の移動にNumPy配列（EnemySwarm, ProjectileSwarm）を使うかのbool値（初期値False）
+    引数2：処理時間の計測・表示に使うFrameProfiler（Noneなら新しく作る）
+    引数3：DirtyRendererで差分だけを描くかのbool値（初期値False）
+    引数4：素材の読み込みを裏で行い、スタート画面を先に出すかのbool値（初期値True）
+    引数5：tickの間を補間して描くかのbool値（初期値False、Trueなら描画は最大120FPS）
+    引数6：1回の描画で進める最大tick数（初期値5、1なら遅れた分ゲームが遅くなる）
+    引数7：プレイをリプレイとして書き出すファイル（Noneなら記録しない）
+    """
+    screen = open_screen(None, background)
+    preloaded = not background
+    game = Game(screen, swarm)
+    game.interpolate = interpolate
+    if dirty:
+        game.renderer = DirtyRenderer()
+    clock = pg.time.Clock()
+    fixed = FixedStepClock(50, max_ticks)
+    if profiler is None:
+        profiler = FrameProfiler()
+    profiler.attach(game)
+    replay = Replay(int.from_bytes(os.urandom(4), "little"), screen.get_size()) if record else None
+    chosen = None #武器選択画面で選んだ数字キー（リプレイ用）
+
+    try:
+        while True:
+            events = pg.event.get()
+            idle = not events and game.in_menu() and game.menu_shown is not None
+            if not preloaded and (idle or not game.in_menu()):
+                #メニューを出したあとの待ち時間か、ゲームが始まる前に残りの準備をする
+                preload_assets()
+                preloaded = True
+            if idle:
+                #メニューの表示中は入力があるまで待つ（画面は変わらないので描き直さない）
+                events = [pg.event.wait()]
+                fixed.reset(1) #待っていた時間は取り戻さず、すぐに1tick進める
+            key_lst = pg.key.get_pressed()
+            for event in events:
+                if event.type == pg.KEYDOWN and event.key == pg.K_F3: #計測結果の表示切り替え
+                    profiler.toggle_overlay(game)
+                    continue
+                selecting = game.level_up_mode == "selecting"
+                if not game.handle_event(event):
+                    return 0
+                if selecting and game.level_up_mode is None:
+                    chosen = event.key
+
+            ticks = fixed.advance()
+            if ticks == 0 and not interpolate:
+                fixed.wait() #次のtickまで画面は変わらない
+                continue
+            if replay is not None and game.mode == "play":
+                if replay.tmr is None: #ゲームが始まったtickから記録する
+                    replay.tmr = game.tmr
+                    rng.seed(replay.seed)
+                for i in range(ticks):
+                    replay.append(Replay.key_mask(key_lst, chosen if i == 0 else None))
+                if ticks:
+                    chosen = None
+            if not game.run_ticks(key_lst, ticks, fixed.alpha if interpolate else None):
+                pg.display.update()
+                time.sleep(2)
+                return
+
+            profiler.draw(screen)
+            if profiler.overlay: #計測表示は差分の管理外なので全体を描き直す
+                game.invalidate()
+                game.dirty_rects = None
+            pg.display.update(game.dirty_rects)
+            if game.timer is not None:
+                game.timer.lap("flip")
+                profiler.end_frame(game)
+            if interpolate:
+                clock.tick(120) #補間表示では描画の回数だけを抑える
+    finally:
+        profiler.close()
+        if replay is not None and replay.tmr is not None:
+            replay.save(os.path.join(launch_dir, record))
+
+
+def run_headless(args: argparse.Namespace) -> int:
+    """
+    画面・音なしで同じゲーム処理をフレーム待ちなしで実行し、処理速度を表示する関数
+    引数：parse_args() の結果
+    戻り値：終了コード
+    """
+    rng.seed(args.seed)
+    screen = open_screen(args.size, args.background_load)
+    game = Game(screen, args.swarm, args.start_level)
+    game.mode = "play" #スタート画面は飛ばす
+    ready = time.perf_counter() - start_clock
+    if args.dirty_rects:
+        game.renderer = DirtyRenderer()
+
+    if args.input_file:
+        with open(os.path.join(launch_dir, args.input_file), encoding="utf-8") as f:
+            script = parse_input_script(f.read())
+    else:
+        script = parse_input_script(args.input)
+    inputs = ScriptedInput(script, args.levelup)
+    profiler = make_profiler(args)
+    profiler.attach(game)
+
+    frames = 0
+    result = "alive"
+    first_frame = None
+    start = time.perf_counter()
+    while frames < args.frames:
+        key_lst, events = inputs.poll(game)
+        if not all(game.handle_event(event) for event in events):
+            result = "quit"
+            break
+        frames += 1
+        draw = frames % max(1, args.frame_skip) == 0 or frames == args.frames #frame_skip回に1回だけ描く
+        if not game.step(key_lst, draw):
+            result = "game over"
+            break
+        if not draw:
+            continue
+        pg.display.update(game.dirty_rects)
+        if first_frame is None:
+            first_frame = time.perf_counter() - start_clock
+        if game.timer is not None:
+            game.timer.lap("flip")
+            profiler.end_frame(game)
+    elapsed = time.perf_counter() - start
+    profiler.close()
+
+    tps = frames / elapsed if elapsed > 0 else float("inf")
+    first_text = "-" if first_frame is None else f"{first_frame * 1000:.1f} ms"
+    print(f"startup: game ready {ready * 1000:.1f} ms  first frame {first_text}  (from module load)")
+    print(f"frames: {frames}  elapsed: {elapsed:.3f}s  ticks/s: {tps:.1f}")
+    print(f"result: {result}  level: {game.score.value // 10}  score: {game.score.value}  hp: {game.bird.hp}  enemies: {len(game.emys)}")
+    for name, st in pool_stats().items():
+        print(f"pool {name:<15}" + "  ".join(f"{k}: {v}" for k, v in st.items()))
+    return 0
+
+
+#ベンチマークのシナリオ名
+BENCH_SCENARIOS = ("wave0", "wave1", "wave2", "wave3", "wave4", "weapons5", "boss", "bomb5", "late_game")
+
+
+def build_scenario(name: str, screen: pg.Surface, enemies: int, swarm: bool = False) -> Game:
+    """
+    ベンチマーク用に既存のクラスから固定の場面を組み立てる関数
+    waveN：Wave N の敵を enemies 体、weapons5：全武器レベル5、boss：ラスボス戦、
+    bomb5：レベル5ボムの起爆直前、late_game：wave4 + 全武器レベル5 + ボム起爆
+    引数1：BENCH_SCENARIOSのシナリオ名
+    引数2：画面Surface
+    引数3：最初に置く敵の数
+    引数4：EnemySwarmを使うかのbool値
+    戻り値：場面を組み立てたGameインスタンス
+    """
+    if name not in BENCH_SCENARIOS:
+        raise ValueError(f"不明なシナリオです: {name}")
+    wave = int(name[4:]) if name.startswith("wave") else 4
+    lv = wave * 3
+    game = Game(screen, swarm, lv)
+    game.mode = "play"
+    game.bird.hp = game.hpbar.max_hp = 10**9 #計測中にゲームオーバーにならないようにする
+    game.score.prev_level = 10**9 #計測中は武器選択画面を出さない
+    game.boss_score = 10**9 #bossシナリオ以外ではラスボスを出さない
+
+    if name == "boss":
+        game.ending = game.boss_flag = True
+        game.gravity.add(Gravity(400))
+        boss = LastBoss()
+        boss.rect.top = 0 #画面内に出しておく
+        boss.pos = pg.Vector2(boss.rect.center)
+        game.emys.add(boss)
+        return game
+
+    for _ in range(enemies):
+        game.emys.add(Enemy(lv))
+    if name in ("weapons5", "late_game"):
+        weap_ctrl = game.weap_ctrl
+        weap_ctrl.bomb_level = weap_ctrl.laser_level = weap_ctrl.mssl_level = 5
+        weap_ctrl.gun_level = weap_ctrl.swrd_level = 5
+    if name in ("bomb5", "late_game"):
+        game.weap_ctrl.bomb_level = 5
+        bb = Bomb_Weapon(game.bird)
+        bb.cnt = 1 #最初のフレームで起爆させる
+        game.bb_wep.add(bb)
+    return game
+
+
+def run_bench(args: argparse.Namespace) -> int:
+    """
+    固定シナリオを決まったフレーム数だけ実行し、処理ごとの時間を表示する関数
+    --json を指定すると結果をJSONで書き出す（"-"なら標準出力）
+    引数：parse_args() の結果
+    戻り値：終了コード
+    """
+    screen = open_screen(args.size)
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    script = parse_input_script(args.input)
+
+    results = {}
+    for name in names:
+        rng.seed(args.seed)
+        game = build_scenario(name, screen, args.enemies, args.swarm)
+        game.timer = PhaseTimer()
+        if args.dirty_rects:
+            game.renderer = DirtyRenderer()
+        inputs = ScriptedInput(script)
+        for _ in range(args.ticks):
+            key_lst, events = inputs.poll(game)
+            for event in events:
+                game.handle_event(event)
+            game.step(key_lst)
+            pg.display.update(game.dirty_rects)
+            game.timer.lap("flip")
+            game.timer.stop()
+
+        summary = game.timer.summary()
+        results[name] = {"ticks": len(game.timer.samples["total"]), "phases": summary, "sprites": game.sprite_counts()}
+        print(f"[{name}] ticks: {results[name]['ticks']}  enemies: {len(game.emys)}")
+        for phase, st in summary.items():
+            print(f"  {phase:<10} mean {st['mean_ms']:8.3f} ms  p95 {st['p95_ms']:8.3f} ms  p99 {st['p99_ms']:8.3f} ms")
+
+    if args.json:
+        report = {
+            "meta": {
+                "seed": args.seed, "ticks": args.ticks, "enemies": args.enemies, "size": list(args.size),
+                "swarm": args.swarm and np is not None, "dirty_rects": args.dirty_rects, "python": sys.version.split()[0], "pygame": pg.version.ver,
+            },
+            "scenarios": results,
+        }
+        text = json.dumps(report, indent=2, ensure_ascii=False)
+        if args.json == "-":
+            print(text)
+        else:
+            with open(os.path.join(launch_dir, args.json), "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+    return 0
+
+
+#バッチ実行のワーカープロセスで使う画面
+batch_screen: pg.Surface | None = None
+
+
+def batch_init(size: tuple[int, int], options: dict) -> None:
+    """
+    バッチ実行のワーカープロセスの初期化（画面・音なしで画面と素材を用意する）
+    引数1：画面サイズ
+    引数2：親プロセスのコマンドライン引数から引き継ぐ設定
+    """
+    global batch_screen
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    Missile_Weapon.rotation_steps = Sword_Wepon.rotation_steps = options["rotation_steps"]
+    Missile_Weapon.homing = options["missile_homing"]
+    assets.use_sysfont = options["use_sysfont"]
+    assets.pack_path = options["pack_path"]
+    pg.init()
+    pg.mixer.init()
+    batch_screen = open_screen(size)
+
+
+def simulate_game(job: dict) -> dict:
+    """
+    ヘッドレスでゲームを1回、ゲームオーバーか最大フレーム数まで描画なしで進める関数（バッチ実行用）
+    引数：シード・入力方法などを入れた辞書（run_batch() が作る）
+    戻り値：生存フレーム数・Level・武器ごとの撃破数・1フレームの処理時間などの辞書
+    """
+    rng.seed(job["seed"])
+    game = Game(batch_screen, job["swarm"], job["start_level"])
+    game.mode = "play"
+    if job["boss_score"] is not None:
+        game.boss_score = job["boss_score"]
+    if job["policy"] == "heuristic":
+        inputs = HeuristicInput()
+    else:
+        inputs = ScriptedInput(parse_input_script(job["input"]), job["levelup"])
+
+    frames = 0
+    result = "alive"
+    start = time.perf_counter()
+    while frames < job["frames"]:
+        key_lst, events = inputs.poll(game)
+        for event in events:
+            game.handle_event(event)
+        frames += 1
+        if not game.step(key_lst, False):
+            result = "game over"
+            break
+    elapsed = time.perf_counter() - start
+    return {
+        "seed": job["seed"], "frames": frames, "seconds": frames / 50, "result": result,
+        "level": game.score.value // 10, "score": game.score.value, "boss": game.ending,
+        "kills": dict(game.kills), "tick_ms": elapsed * 1000 / frames if frames else 0.0,
+    }
+
+
+def summarize_batch(games: list[dict]) -> dict:
+    """
+    バッチ実行の結果をまとめる関数
+    引数：simulate_game() の結果のリスト
+    戻り値：生存時間・Level・撃破数・処理時間の集計の辞書
+    """
+    n = len(games)
+    seconds = sorted(g["seconds"] for g in games)
+    levels = sorted(g["level"] for g in games)
+    tick_ms = sorted(g["tick_ms"] for g in games)
+    kills = {name: sum(g["kills"][name] for g in games) for name in Game.WEAPON_NAMES}
+    total_kills = sum(kills.values())
+    level_counts: dict[int, int] = {}
+    for lv in levels:
+        level_counts[lv] = level_counts.get(lv, 0) + 1
+    return {
+        "games": n,
+        "survived": sum(g["result"] == "alive" for g in games),
+        "boss": sum(g["boss"] for g in games),
+        "seconds": {"mean": sum(seconds) / n, "p10": percentile(seconds, 10), "median": percentile(seconds, 50),
+                    "p90": percentile(seconds, 90)},
+        "level": {"mean": sum(levels) / n, "median": percentile(levels, 50), "max": levels[-1], "counts": level_counts},
+        "kills_per_game": {name: count / n for name, count in kills.items()},
+        "kill_share": {name: count / total_kills if total_kills else 0.0 for name, count in kills.items()},
+        "tick_ms": {"mean": sum(tick_ms) / n, "p95": percentile(tick_ms, 95), "max": tick_ms[-1]},
+        "cpu_seconds": sum(g["tick_ms"] * g["frames"] for g in games) / 1000,
+    }
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    """
+    シードを変えたヘッドレスのゲームを全CPUコアで並列に実行し、バランス調整用の集計を表示する関数
+    --json で集計と全ゲームの結果を、--csv で1ゲーム1行の結果を書き出す
+    引数：parse_args() の結果
+    戻り値：終了コード
+    """
+    #変換済み画像のパックを先に作っておく（ワーカーが同時に書き出さないようにする）
+    open_screen(args.size)
+    options = {
+        "rotation_steps": args.rotation_steps, "missile_homing": args.missile_homing,
+        "use_sysfont": assets.use_sysfont, "pack_path": assets.pack_path,
+    }
+    jobs = [{
+        "seed": args.seed + i, "frames": args.frames, "policy": args.policy, "input": args.input,
+        "levelup": args.levelup, "swarm": args.swarm, "start_level": args.start_level, "boss_score": args.boss_score,
+    } for i in range(args.games)]
+    workers = args.workers or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    #pygameの状態を引き継がないように、ワーカーはforkせずに新しく起動する
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, context, batch_init, (args.size, options)) as executor:
+        chunk = max(1, len(jobs) // (workers * 4))
+        games = list(executor.map(simulate_game, jobs, chunksize=chunk))
+    wall = time.perf_counter() - start
+    if not games:
+        print("games: 0")
+        return 0
+
+    summary = summarize_batch(games)
+    n = summary["games"]
+    sec, lv, tick = summary["seconds"], summary["level"], summary["tick_ms"]
+    print(f"games: {n}  workers: {workers}  wall: {wall:.1f}s  cpu: {summary['cpu_seconds']:.1f}s  policy: {args.policy}")
+    print(f"survival: mean {sec['mean']:.1f}s  p10 {sec['p10']:.1f}s  median {sec['median']:.1f}s  p90 {sec['p90']:.1f}s"
+          f"  alive at {args.frames} frames: {summary['survived']} ({summary['survived'] / n:.0%})")
+    print(f"level: mean {lv['mean']:.1f}  median {lv['median']}  max {lv['max']}  boss reached: {summary['boss']} ({summary['boss'] / n:.0%})")
+    print("levels: " + "  ".join(f"{k}: {v}" for k, v in sorted(lv["counts"].items())))
+    print("kills/game: " + "  ".join(f"{name} {summary['kills_per_game'][name]:.1f} ({summary['kill_share'][name]:.0%})"
+                                     for name in Game.WEAPON_NAMES))
+    print(f"tick: mean {tick['mean']:.3f} ms  p95 {tick['p95']:.3f} ms  max {tick['max']:.3f} ms")
+
+    if args.csv:
+        with open(os.path.join(launch_dir, args.csv), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["seed", "frames", "result", "level", "score", "boss", "tick_ms"]
+                            + [f"kills_{name}" for name in Game.WEAPON_NAMES])
+            for g in games:
+                writer.writerow([g["seed"], g["frames"], g["result"], g["level"], g["score"], int(g["boss"]),
+                                 f"{g['tick_ms']:.4f}"] + [g["kills"][name] for name in Game.WEAPON_NAMES])
+    if args.json:
+        report = {
+            "meta": {
+                "games": n, "seed": args.seed, "frames": args.frames, "policy": args.policy, "workers": workers,
+                "wall_seconds": wall, "size": list(args.size), "swarm": args.swarm and np is not None,
+                "boss_score": args.boss_score, "python": sys.version.split()[0], "pygame": pg.version.ver,
+            },
+            "summary": summary,
+            "games": games,
+        }
+        text = json.dumps(report, indent=2, ensure_ascii=False)
+        if args.json == "-":
+            print(text)
+        else:
+            with open(os.path.join(launch_dir, args.json), "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+    return 0
+
+
+def run_replay(args: argparse.Namespace) -> int:
+    """
+    リプレイを再生する関数
+    --speed 0（初期値）なら画面・音なしで最高速度で、それ以外は画面に出してその倍速で再生する
+    引数：parse_args() の結果
+    戻り値：終了コード
+    """
+    path = os.path.join(launch_dir, args.file)
+    replay = Replay.load(path)
+    replay.apply()
+    visible = args.speed > 0
+    screen = open_screen(replay.size)
+    rng.seed(replay.seed)
+    game = Game(screen, args.swarm)
+    game.mode = "play"
+    game.tmr = replay.tmr
+    if args.dirty_rects:
+        game.renderer = DirtyRenderer()
+    inputs = ReplayInput(replay)
+    profiler = make_profiler(args)
+    profiler.attach(game)
+    #画面に出すときは倍速の固定間隔で進め、描画が追いつかなければ描画を飛ばす
+    fixed = FixedStepClock(max(1, round(50 * args.speed)), 5 * math.ceil(args.speed)) if visible else None
+
+    frames = 0
+    result = "end of replay"
+    start = time.perf_counter()
+    while not inputs.done:
+        ticks = 1
+        if fixed is not None:
+            if any(e.type == pg.QUIT or (e.type == pg.KEYDOWN and e.key == pg.K_ESCAPE) for e in pg.event.get()):
+                result = "quit"
+                break
+            ticks = fixed.advance()
+            if ticks == 0:
+                fixed.wait()
+                continue
+        alive = True
+        for _ in range(ticks):
+            if inputs.done:
+                break
+            key_lst, events = inputs.poll(game)
+            for event in events:
+                game.handle_event(event)
+            frames += 1
+            alive = game.step(key_lst, fixed is None)
+            if not alive:
+                break
+        if not alive:
+            result = "game over"
+            break
+        if fixed is None:
+            pg.display.update(game.dirty_rects)
+        else:
+            game.run_ticks(None, 0) #まとめて進めた分を1回だけ描く
             pg.display.update()
-            time.sleep(2)
-            return
-        
-        score.update(screen)
-        
-        # レベルアップチェック
-        if score.check_level_up():
-            level_up_mode = "selecting"  # 武器選択画面に遷移
-            pg.mixer.stop()  #効果音を止める
-        
-        gravity.update()
-        gravity.draw(screen)
-        bird.update(key_lst, screen)
-        bb_wep.update(screen)
-        bb_effect.update()
-        bb_effect.draw(screen)
-        lsr_wep.update()
-        lsr_wep.draw(screen)
-        mssl_wep.update(emys)
-        mssl_wep.draw(screen)
-        gun_wep.update()
-        gun_wep.draw(screen)
-        swrd_wep.update()
-        swrd_wep.draw(screen)
-        emys.update(bird.rect.center)
-        emys.draw(screen)
-        exps.update()
-        exps.draw(screen)
-        hpbar.update(screen)
-        
-        pg.display.update()
-        
-        tmr += 1
-        clock.tick(50)
+        if game.timer is not None:
+            game.timer.lap("flip")
+            profiler.end_frame(game)
+    elapsed = time.perf_counter() - start
+    profiler.close()
+
+    tps = frames / elapsed if elapsed > 0 else float("inf")
+    print(f"replay: {args.file}  seed: {replay.seed}  ticks: {replay.ticks}  size: {replay.size[0]}x{replay.size[1]}")
+    print(f"frames: {frames}  elapsed: {elapsed:.3f}s  ticks/s: {tps:.1f}")
+    print(f"result: {result}  level: {game.score.value // 10}  score: {game.score.value}  hp: {game.bird.hp}  enemies: {len(game.emys)}")
+    return 0
+
+
+def parse_engine(text: str) -> dict:
+    """
+    "swarm,dirty-rects,frame-skip=3" の形式のエンジン設定を解析する関数
+    使える名前：swarm（NumPy配列で一括移動）、dirty-rects（差分描画）、frame-skip=N（N tickに1回描く）
+    引数：カンマ区切りの設定（空ならすべて初期値＝基準のエンジン）
+    戻り値：{"swarm": bool, "dirty_rects": bool, "frame_skip": int}
+    """
+    engine = {"swarm": False, "dirty_rects": False, "frame_skip": 1}
+    for part in text.split(","):
+        name, _, value = part.strip().partition("=")
+        if not name:
+            continue
+        if name == "swarm":
+            engine["swarm"] = True
+        elif name == "dirty-rects":
+            engine["dirty_rects"] = True
+        elif name == "frame-skip":
+            engine["frame_skip"] = max(1, int(value or 2))
+        else:
+            raise ValueError(f"不明なエンジン設定です: {name}")
+    return engine
+
+
+class EngineRun:
+    """
+    決まったシード・入力・エンジン設定でゲームを1tickずつ進めるクラス（一致確認用）
+    乱数rngの状態を自分で持つので、複数のゲームを交互に進めても結果が混ざらない
+    """
+    def __init__(self, seed: int, engine: dict, screen: pg.Surface, script: list[tuple[frozenset[int], int]],
+                 levelup: str = "12345", start_level: int = 0):
+        """
+        初期化処理
+        引数1：乱数のシード
+        引数2：parse_engine() の結果
+        引数3：描画先のSurface
+        引数4：parse_input_script() の結果
+        引数5：武器選択で選ぶ武器番号の順
+        引数6：開始時のLevel
+        """
+        saved = rng.getstate()
+        rng.seed(seed)
+        self.game = Game(screen, engine["swarm"], start_level)
+        self.game.mode = "play"
+        if engine["dirty_rects"]:
+            self.game.renderer = DirtyRenderer()
+        self.rng_state = rng.getstate()
+        rng.setstate(saved)
+        self.frame_skip = engine["frame_skip"]
+        self.inputs = ScriptedInput(script, levelup)
+        self.ticks = 0
+        self.alive = True
+
+    def step(self) -> dict:
+        """
+        1tick進めて sim_state() を返す
+        """
+        saved = rng.getstate()
+        rng.setstate(self.rng_state)
+        game = self.game
+        key_lst, events = self.inputs.poll(game)
+        for event in events:
+            game.handle_event(event)
+        self.ticks += 1
+        self.alive = game.step(key_lst, self.ticks % self.frame_skip == 0)
+        self.rng_state = rng.getstate()
+        rng.setstate(saved)
+        return game.sim_state()
+
+
+def state_diff(ref: dict, cand: dict, limit: int = 12) -> list[str]:
+    """
+    2つの sim_state() の違いを1行ずつの文字列にする関数
+    引数1：基準の状態
+    引数2：比べる状態
+    引数3：出力する最大行数
+    戻り値：違いの説明のリスト
+    """
+    lines = []
+    for key in [*ref, *(k for k in cand if k not in ref)]:
+        a, b = ref.get(key), cand.get(key)
+        if a == b:
+            continue
+        if isinstance(a, list) and isinstance(b, list) and a and isinstance(a[0], list):
+            if len(a) != len(b):
+                lines.append(f"{key}: 数 {len(a)} != {len(b)}")
+            for i, (x, y) in enumerate(zip(a, b)):
+                if x != y:
+                    lines.append(f"{key}[{i}]: {x} != {y}")
+        else:
+            lines.append(f"{key}: {a} != {b}")
+    if len(lines) > limit:
+        lines = lines[:limit] + [f"...ほか {len(lines) - limit} 件"]
+    return lines
+
+
+def run_verify(args: argparse.Namespace) -> int:
+    """
+    シードを変えた決まった入力のゲームを基準のエンジンと候補のエンジンで1tickずつ同時に進め、
+    状態のハッシュ値が最初に食い違ったtickとその違いを表示する関数
+    --save で基準のハッシュ値の列を書き出し、--against で書き出したものと比べる（別の版のコードとの比較用）
+    引数：parse_args() の結果
+    戻り値：終了コード（すべて一致すれば0、食い違いがあれば1）
+    """
+    screen = open_screen(args.size)
+    script = parse_input_script(args.input)
+    candidate = parse_engine(args.candidate)
+    levels = [int(lv) for lv in args.start_levels.split(",") if lv.strip()]
+    corpus = [(args.seed + i, lv) for i in range(args.seeds) for lv in levels]
+    saved = None
+    if args.against:
+        with open(os.path.join(launch_dir, args.against), encoding="utf-8") as f:
+            saved = json.load(f)
+    reference = {"swarm": False, "dirty_rects": False, "frame_skip": 1}
+
+    streams = {}
+    diverged = 0
+    start = time.perf_counter()
+    for seed, lv in corpus:
+        name = f"seed {seed} level {lv}"
+        cand = EngineRun(seed, candidate, screen.copy(), script, args.levelup, lv)
+        ref = None if saved is not None else EngineRun(seed, reference, screen, script, args.levelup, lv)
+        expected = saved["runs"].get(f"{seed}:{lv}") if saved is not None else None
+        hashes = []
+        found = None
+        prev_state = None
+        while cand.ticks < args.frames and cand.alive:
+            cand_state = cand.step()
+            digest = cand.game.checksum(cand_state)
+            if ref is not None:
+                ref_state = ref.step()
+                if ref.game.checksum(ref_state) != digest:
+                    found = (cand.ticks, state_diff(ref_state, cand_state))
+                    break
+            elif expected is not None and (cand.ticks > len(expected) or expected[cand.ticks - 1] != digest):
+                lines = [f"基準 {expected[cand.ticks - 1] if cand.ticks <= len(expected) else '（終了済み）'} != {digest}"]
+                if prev_state is not None:
+                    lines += [f"直前のtickからの変化 " + line for line in state_diff(prev_state, cand_state)]
+                found = (cand.ticks, lines)
+                break
+            hashes.append(digest)
+            prev_state = cand_state
+        if found is None and expected is not None and len(expected) != cand.ticks:
+            found = (cand.ticks, [f"基準は {len(expected)} tick、候補は {cand.ticks} tick で終了"])
+        streams[f"{seed}:{lv}"] = hashes
+        if found is None:
+            print(f"{name}: {cand.ticks} ticks  一致  {hashes[-1] if hashes else '-'}")
+            continue
+        diverged += 1
+        print(f"{name}: tick {found[0]} で食い違い")
+        for line in found[1]:
+            print("  " + line)
+    elapsed = time.perf_counter() - start
+    print(f"runs: {len(corpus)}  diverged: {diverged}  candidate: {args.candidate or '基準'}  elapsed: {elapsed:.1f}s")
+
+    if args.save:
+        if diverged:
+            print("食い違いがあったので --save のファイルは書き出しません")
+        else:
+            meta = {"frames": args.frames, "input": args.input, "levelup": args.levelup, "size": list(args.size)}
+            with open(os.path.join(launch_dir, args.save), "w", encoding="utf-8") as f:
+                json.dump({"meta": meta, "runs": streams}, f)
+    return 1 if diverged else 0
+
+
+def run_memory(args: argparse.Namespace) -> int:
+    """
+    敵・武器・爆発を種類ごとに count 個ずつ作り、1個あたりに増えるメモリをtracemallocで測る関数
+    画像などの共有キャッシュは先に作っておくので、インスタンス・Rect・ステータスなど1個ごとの分だけを数える
+    --json を指定すると結果をJSONで書き出す（"-"なら標準出力）
+    引数：parse_args() の結果
+    戻り値：終了コード
+    """
+    screen = open_screen(args.size)
+    rng.seed(args.seed)
+    game = Game(screen)
+    bird = game.bird
+    makers = {
+        "Enemy": lambda: Enemy(rng.randrange(15)),
+        "LastBoss": LastBoss,
+        "Bomb_Weapon": lambda: Bomb_Weapon(bird),
+        "Laser_Weapon": lambda: Laser_Weapon(bird, 5),
+        "Missile_Weapon": lambda: Missile_Weapon(bird, game.emys),
+        "Gun_Weapon": lambda: Gun_Weapon(bird, 0, 5),
+        "Sword_Wepon": lambda: Sword_Wepon(bird),
+        "Explosion": lambda: Explosion(bird, 100),
+        "BombBlast": lambda: BombBlast(bird.rect.center, 5),
+    }
+    for lv in range(0, 15, 3): #全Waveの敵画像を読み込んでおく
+        Enemy(lv)
+
+    results = {}
+    tracemalloc.start()
+    for name, make in makers.items():
+        sample = make() #画像などのキャッシュを作っておく
+        items = [None] * args.count
+        group = SpriteGroup()
+        gc.collect()
+        base = tracemalloc.get_traced_memory()[0]
+        for i in range(args.count):
+            items[i] = make()
+        made = tracemalloc.get_traced_memory()[0]
+        group.add(items)
+        grouped = tracemalloc.get_traced_memory()[0]
+        results[name] = {
+            "bytes": round((made - base) / args.count, 1), #1個あたり
+            "group_bytes": round((grouped - made) / args.count, 1), #Groupに入れたときに1個あたり増える分
+            "dict": hasattr(sample, "__dict__"), #インスタンスが__dict__を持つか
+        }
+        group.empty()
+        del items
+    tracemalloc.stop()
+
+    print(f"{'class':<16}{'bytes/entity':>14}{'+group':>10}  __dict__")
+    for name, st in results.items():
+        print(f"{name:<16}{st['bytes']:>14.1f}{st['group_bytes']:>10.1f}  {'yes' if st['dict'] else 'no'}")
+    if args.json:
+        report = {"meta": {"count": args.count, "seed": args.seed, "python": sys.version.split()[0], "pygame": pg.version.ver},
+                  "classes": results}
+        text = json.dumps(report, indent=2, ensure_ascii=False)
+        if args.json == "-":
+            print(text)
+        else:
+            with open(os.path.join(launch_dir, args.json), "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+    return 0
+
+
+def run_pack(args: argparse.Namespace) -> int:
+    """
+    変換済み画像のパックを作り直す関数（起動時にも古ければ自動で作り直される）
+    引数：parse_args() の結果
+    戻り値：終了コード
+    """
+    path = os.path.join(launch_dir, args.output) if args.output else assets.pack_path
+    assets.pack_path = None #作り直すので古いパックは読まない
+    start = time.perf_counter()
+    open_screen(args.size)
+    entries = pack_entries()
+    size = AssetPack(path).save(entries)
+    print(f"{path}: {len(entries)} images  {size / 1e6:.1f} MB  {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+def parse_size(text: str) -> tuple[int, int]:
+    """
+    "1920x1080" の形式の画面サイズを解析する関数
+    """
+    w, _, h = text.lower().partition("x")
+    return int(w), int(h)
+
+
+def positive_int(text: str) -> int:
+    """
+    1以上の整数を解析する関数（0や負の値はコマンドラインのエラーにする）
+    """
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"1以上の整数を指定してください: {text}")
+    return value
+
+
+def option_parsers(sub: bool) -> tuple[argparse.ArgumentParser, argparse.ArgumentParser, argparse.ArgumentParser]:
+    """
+    トップレベルとサブコマンドの両方で使うオプションの親パーサを作る関数（オプションの定義はここ1か所だけ）
+    サブコマンド用は初期値を argparse.SUPPRESS にして、サブコマンドより前に書いた値を初期値で上書きしないようにする
+    引数：サブコマンド用かのbool値
+    戻り値：全コマンド共通、処理時間の記録、通常プレイ の親パーサ
+    """
+    def default(value):
+        return argparse.SUPPRESS if sub else value
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--swarm", action="store_true", default=default(False), help="敵と弾の移動にNumPy配列(EnemySwarm, ProjectileSwarm)を使う")
+    common.add_argument("--rotation-steps", type=positive_int, default=default(128), help="ミサイルと剣の回転画像の1周の分割数")
+    common.add_argument("--dirty-rects", action="store_true", default=default(False), help="前のフレームとの差分だけを描き直して画面に送る")
+    common.add_argument("--missile-homing", choices=("random", "nearest"), default=default("random"),
+                        help="ミサイルが狙う敵の選び方（random：ランダム、nearest：近い敵）")
+    common.add_argument("--no-sysfont", action="store_true", default=default(False), help="システムフォントを探さず同梱のフォントを使う")
+    common.add_argument("--no-pack", action="store_true", default=default(False), help="変換済み画像のパック(assets.pack)を使わない")
+
+    profiling = argparse.ArgumentParser(add_help=False)
+    profiling.add_argument("--profile-csv", default=default(None), help="毎フレームの処理時間とスプライト数を書き出すCSVファイル")
+    profiling.add_argument("--profile-json", default=default(None), help="直近の処理時間の集計を定期的に上書きするJSONファイル")
+
+    playing = argparse.ArgumentParser(add_help=False)
+    playing.add_argument("--profile", action="store_true", default=default(False), help="処理時間の表示をオンにして始める（F3で切り替え）")
+    playing.add_argument("--sync-load", action="store_true", default=default(False), help="素材をすべて読み込んでからスタート画面を出す")
+    playing.add_argument("--interpolate", action="store_true", default=default(False), help="tickの間を補間して滑らかに描く")
+    playing.add_argument("--max-skip", type=int, default=default(5), help="描画が遅れたときに1回の描画で進める最大tick数")
+    playing.add_argument("--record", default=default(None), help="プレイをリプレイとして書き出すファイル")
+    return common, profiling, playing
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する関数
+    引数なしなら通常プレイ、headless でヘッドレス実行
+    サブコマンドの前後どちらに書いた共通オプションも使われる（後ろに書いた方が優先）
+    """
+    parser = argparse.ArgumentParser(description="目指せ!卒業", parents=option_parsers(False))
+    common, profiling, playing = option_parsers(True)
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("play", parents=[common, profiling, playing], help="通常プレイ（全画面、初期値）")
+
+    headless = sub.add_parser("headless", parents=[common, profiling], help="画面・音なしで最高速度で実行する")
+    headless.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    headless.add_argument("--frames", type=int, default=3000, help="実行するフレーム数")
+    headless.add_argument("--start-level", type=int, default=0, help="開始時のLevel")
+    headless.add_argument("--input", default="right:60,down:60,left:60,up:60",
+                          help='入力スクリプト（例 "right:50,up+left:30,none:20"）')
+    headless.add_argument("--input-file", help="入力スクリプトのファイル")
+    headless.add_argument("--levelup", default="12345", help="武器選択で自動的に選ぶ武器番号の順")
+    headless.add_argument("--size", type=parse_size, default=(1920, 1080), help="画面サイズ（例 1920x1080）")
+    headless.add_argument("--background-load", action="store_true", help="素材を裏のスレッドで読み込む（起動時間の比較用）")
+    headless.add_argument("--frame-skip", type=int, default=1, help="何tickに1回描くか（フレーム飛ばしの確認用）")
+
+    bench = sub.add_parser("bench", parents=[common], help="固定シナリオの処理時間を計測する")
+    bench.add_argument("--scenarios", default=",".join(BENCH_SCENARIOS), help="カンマ区切りのシナリオ名")
+    bench.add_argument("--ticks", type=int, default=300, help="シナリオごとのフレーム数")
+    bench.add_argument("--enemies", type=int, default=200, help="最初に置く敵の数")
+    bench.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    bench.add_argument("--input", default="right:60,down:60,left:60,up:60", help="入力スクリプト")
+    bench.add_argument("--size", type=parse_size, default=(1920, 1080), help="画面サイズ（例 1920x1080）")
+    bench.add_argument("--json", help="結果を書き出すJSONファイル（-なら標準出力）")
+
+    batch = sub.add_parser("batch", parents=[common], help="シードを変えたヘッドレスのゲームを並列に実行して集計する")
+    batch.add_argument("--games", type=int, default=200, help="実行するゲーム数")
+    batch.add_argument("--workers", type=int, default=0, help="ワーカープロセス数（0ならCPUコア数）")
+    batch.add_argument("--seed", type=int, default=0, help="最初のゲームのシード（ゲームごとに1ずつ増やす）")
+    batch.add_argument("--frames", type=int, default=9000, help="1ゲームの最大フレーム数")
+    batch.add_argument("--policy", choices=("heuristic", "script"), default="heuristic",
+                       help="こうかとんの操作（heuristic：敵から逃げる、script：--inputの入力スクリプト）")
+    batch.add_argument("--input", default="right:60,down:60,left:60,up:60", help="入力スクリプト（--policy script）")
+    batch.add_argument("--levelup", default="12345", help="武器選択で選ぶ武器番号の順（--policy script）")
+    batch.add_argument("--start-level", type=int, default=0, help="開始時のLevel")
+    batch.add_argument("--boss-score", type=int, help="ラスボスが出現するスコア（初期値150）")
+    batch.add_argument("--size", type=parse_size, default=(1920, 1080), help="画面サイズ（例 1920x1080）")
+    batch.add_argument("--json", help="集計と全ゲームの結果を書き出すJSONファイル（-なら標準出力）")
+    batch.add_argument("--csv", help="1ゲーム1行の結果を書き出すCSVファイル")
+
+    replay = sub.add_parser("replay", parents=[common, profiling], help="--recordで記録したプレイを再生する")
+    replay.add_argument("file", help="リプレイファイル")
+    replay.add_argument("--speed", type=float, default=0,
+                        help="画面に出して再生する倍速（0なら画面・音なしで最高速度）")
+
+    verify = sub.add_parser("verify", parents=[common], help="候補のエンジン設定が基準と同じ結果になるかを1tickずつ確かめる")
+    verify.add_argument("--candidate", default="swarm,dirty-rects,frame-skip=3",
+                        help="比べるエンジン設定（swarm, dirty-rects, frame-skip=N をカンマ区切り）")
+    verify.add_argument("--seeds", type=int, default=10, help="試すシードの数")
+    verify.add_argument("--seed", type=int, default=0, help="最初のシード")
+    verify.add_argument("--start-levels", default="0,6,12", help="シードごとに試す開始時のLevel（カンマ区切り）")
+    verify.add_argument("--frames", type=int, default=2000, help="1回の最大tick数")
+    verify.add_argument("--input", default="right:60,down:60,left:60,up:60", help="入力スクリプト")
+    verify.add_argument("--levelup", default="12345", help="武器選択で選ぶ武器番号の順")
+    verify.add_argument("--size", type=parse_size, default=(1920, 1080), help="画面サイズ（例 1920x1080）")
+    verify.add_argument("--save", help="全て一致したときに基準のハッシュ値の列を書き出すJSONファイル")
+    verify.add_argument("--against", help="--saveで書き出したハッシュ値の列と比べる")
+
+    memory = sub.add_parser("memory", parents=[common], help="敵・武器・爆発1個あたりのメモリ使用量を測る")
+    memory.add_argument("--count", type=int, default=2000, help="種類ごとに作る数")
+    memory.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    memory.add_argument("--size", type=parse_size, default=(1920, 1080), help="画面サイズ（例 1920x1080）")
+    memory.add_argument("--json", help="結果を書き出すJSONファイル（-なら標準出力）")
+
+    pack = sub.add_parser("pack", parents=[common], help="変換済み画像のパック(assets.pack)を作り直す")
+    pack.add_argument("--size", type=parse_size, default=(1920, 1080), help="背景を合わせる画面サイズ（例 1920x1080）")
+    pack.add_argument("--output", help="書き出すファイル（初期値 assets.pack）")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
+    args = parse_args()
+    Missile_Weapon.rotation_steps = Sword_Wepon.rotation_steps = args.rotation_steps
+    Missile_Weapon.homing = args.missile_homing
+    assets.use_sysfont = not args.no_sysfont
+    if args.no_pack:
+        assets.pack_path = None
+    if args.command not in (None, "play") and not (args.command == "replay" and args.speed > 0):
+        #画面と音のない環境でも動くようにダミードライバを使う
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
     pg.init()
     pg.mixer.init()
-    main()
+    status = 0
+    if args.command == "headless":
+        run_headless(args)
+    elif args.command == "bench":
+        run_bench(args)
+    elif args.command == "batch":
+        run_batch(args)
+    elif args.command == "replay":
+        run_replay(args)
+    elif args.command == "verify":
+        status = run_verify(args)
+    elif args.command == "memory":
+        run_memory(args)
+    elif args.command == "pack":
+        run_pack(args)
+    else:
+        main(args.swarm, make_profiler(args), args.dirty_rects, not args.sync_load, args.interpolate, args.max_skip,
+             args.record)
     pg.quit()
-    sys.exit()
\ No newline at end of file
+    sys.exit(status)